@@ -1,54 +1,366 @@
-from flask import Flask, request
-from sqlalchemy import create_engine, and_
+import base64
+import json
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+from flask import Flask, Response, abort, g, request, stream_with_context
+from backend.api import columnar
+from backend.api.cache import ResponseCache, cached_response
+from backend.services import metrics
 from backend.models.models import TLE
-from backend.models.models import db_session, get_engine
+from backend.models.tle_batch import TLE_DTYPE
+from backend.services.database.archive import ARCHIVE_DTYPE, column_array
+from backend.services.database.catalog import get_catalog_version, get_latest_catalog
+from backend.services.database.database_utils import get_scoped_session
+from backend.services.database.query_dsl import FilterError, compile_query
+from config import PROFILE_REQUESTS
 
 app = Flask(__name__)
+app.config["PROFILE_REQUESTS"] = PROFILE_REQUESTS
+
+# One session per request thread from the shared read only pool, returned to the pool at teardown
+Session = get_scoped_session(readonly=True)
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    Session.remove()
+
+# Serialized read responses keyed by catalog version and normalized request, see backend/api/cache.py
+response_cache = ResponseCache()
+
+def current_catalog_version():
+    return get_catalog_version(Session())
+
+# Request metrics, the stages within a request are recorded as spans, see backend/services/metrics.py
+request_seconds = metrics.registry.histogram("orbitviz_http_request_duration_seconds", "Time to produce a response, without streaming it")
+requests_total = metrics.registry.counter("orbitviz_http_requests_total", "Responses by endpoint and status")
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = perf_counter()
+    metrics.collect_timings()
+    if app.config["PROFILE_REQUESTS"] and request.headers.get("X-Profile") == "1":
+        g.profiler = metrics.SamplingProfiler().start()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = perf_counter() - g.pop("request_start", perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method)
+    requests_total.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    # Per stage timings for the browser's network panel
+    timings = metrics.stop_collecting_timings()
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings] + [f"total;dur={elapsed * 1000:.3f}"]
+    )
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        response.headers["X-Profile-Id"] = metrics.profiles.add(profiler.stop().collapsed())
+    return response
+
+def response_cache_metrics():
+    return [
+        ("orbitviz_response_cache_hits_total", "counter", "Responses served from the response cache", response_cache.hits),
+        ("orbitviz_response_cache_misses_total", "counter", "Responses not found in the response cache", response_cache.misses),
+        ("orbitviz_response_cache_bytes", "gauge", "Size of the cached response bodies", response_cache.size),
+    ]
+
+metrics.registry.register_collector(response_cache_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8", headers={"Cache-Control": "no-store"})
 
-engine = get_engine()
+@app.route('/metrics/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Collapsed stacks of a request sent with X-Profile: 1, e.g. for flamegraph.pl or speedscope"""
+    profile = metrics.profiles.get(profile_id)
+    if profile is None:
+        abort(404)
+    return Response(profile, mimetype="text/plain")
 
-# A mapping from string operators to SQLAlchemy functions
-operator_mapping = {
-    "<": "__lt__",
-    "<=": "__le__",
-    "==": "__eq__",
-    "!=": "__ne__",
-    ">": "__gt__",
-    ">=": "__ge__",
+DEFAULT_FIELDS = ["name", "satellite_number"]
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10_000
+STREAM_BATCH_SIZE = 1000
+# Response formats, chosen by the format argument or else the Accept header, JSON by default
+FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "columns": columnar.MIMETYPE,
 }
+# State vectors per /catalog/states response, binary and JSON
+MAX_STATES = 2_000_000
+MAX_JSON_STATES = 50_000
+# Keyset orders, each ends with the unique id so the position of a row is unambiguous
+ORDERS = {
+    "id": ["id"],
+    "epoch": ["epoch", "id"],
+}
+
+class QueryError(ValueError):
+    """Invalid query options, reported to the client as 400 like invalid filters"""
+
+@app.errorhandler(QueryError)
+@app.errorhandler(FilterError)
+def handle_query_error(error):
+    return {"error": str(error)}, 400
 
 @app.route('/query', methods=['GET'])
-@db_session(engine)
-def query_tle(session):
-    # Extract parameters from JSON object received from front end
-    params = request.json
-    
-    # Validate the parameters
-    def validate_params(params):
-        valid_cols = set(TLE.__table__.columns)
-        valid_params = {}
-        for column, operations in params.items():
-            if column not in valid_cols:
-                continue
-            valid_params[column] = {}
-            for operator_str, value in operations.items():
-                if operator_str in operator_mapping:
-                    valid_params[column][operator_str] = value
-        return valid_params
-    params = validate_params(params)
-    
-    # Convert the parameters into SQLAlchemy filter expressions
-    filter_expressions = []
-    for column, operations in params.items():
-        for operator_str, value in operations.items():
-            operator_func = getattr(getattr(TLE, column), operator_mapping[operator_str])
-            filter_expressions.append(operator_func(value))
-    
-    # Create a session and query the database
-    results = session.query(TLE).filter(and_(*filter_expressions)).all()
-    
-    # Transform results into a format that can be sent back to the front end
-    results_data = [{"name": result.name, "satellite_number": result.satellite_number} for result in results]
+@cached_response(response_cache, current_catalog_version)
+def query_tle():
+    """Filters come as the JSON body in the language of backend/services/database/query_dsl.py, e.g.
+    {"inclination": {"between": [50, 60]}, "group": "stations"}, options as query string arguments:
+    fields  comma separated columns to return, name and satellite_number by default
+    order   keyset order, "id" (default) or "epoch"
+    limit   page size, at most MAX_PAGE_SIZE
+    cursor  next_cursor of the previous page
+    format  "json" (default) pages of results, "ndjson" to stream every match one row per line, or "columns" for
+            pages in the binary columnar format of backend/api/columnar.py with next_cursor in its meta"""
+    session = Session()
+    filters = request.get_json(silent=True) or {}
+    fields = parse_fields(request.args.get("fields"))
+    order = request.args.get("order", "id")
+    if order not in ORDERS:
+        raise QueryError(f"order must be one of {sorted(ORDERS)}")
+    limit = parse_limit(request.args.get("limit"))
+    cursor = request.args.get("cursor")
+    after = decode_cursor(cursor, order) if cursor else None
+
+    # Only the requested columns and the keyset columns are read, no ORM objects are built
+    keys = ORDERS[order]
+    selected = list(dict.fromkeys(fields + keys))
+    format_ = response_format()
+    if format_ == "ndjson":
+        page_size = limit  # None streams every match
+    else:
+        limit = limit or DEFAULT_PAGE_SIZE
+        page_size = limit + 1  # the extra row tells whether there is a next page
+    statement, params = compile_query(filters, selected, keys, after, page_size)
+    if format_ == "ndjson":
+        return Response(stream_with_context(stream_rows(session, statement, params, fields)), mimetype="application/x-ndjson")
+
+    with metrics.span("query"):
+        rows = session.execute(statement, params).mappings().all()
+    next_cursor = encode_cursor(order, [rows[limit - 1][key] for key in keys]) if len(rows) > limit else None
+    if format_ == "columns":
+        columns = {field: column_array([row[field] for row in rows[:limit]], ARCHIVE_DTYPE[field]) for field in fields}
+        return columnar_response(columns, {"next_cursor": next_cursor})
+    results_data = [{field: to_json_value(row[field]) for field in fields} for row in rows[:limit]]
 
     # Return the results as JSON
-    return {"results": results_data}
+    return {"results": results_data, "next_cursor": next_cursor}
+
+@app.route('/catalog', methods=['GET'])
+@cached_response(response_cache, current_catalog_version)
+def catalog():
+    """Latest elements of every satellite, one column per TLE field, straight from the in-memory snapshot.
+    fields  comma separated columns, all by default
+    format  "json" (default) {"version", "columns": {field: [values]}} or "columns" for the binary columnar format"""
+    snapshot = get_latest_catalog(Session())
+    fields = request.args.get("fields")
+    fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(TLE_DTYPE.names)
+    unknown = [field for field in fields if field not in TLE_DTYPE.names]
+    if unknown:
+        raise QueryError(f"unknown fields {unknown}")
+    columns = {field: snapshot.data[field] for field in fields}
+    if response_format() == "columns":
+        return columnar_response(columns, {"version": snapshot.version})
+    return {"version": snapshot.version, "columns": {field: json_column(values) for field, values in columns.items()}}
+
+@app.route('/catalog/states', methods=['GET'])
+@cached_response(response_cache, current_catalog_version)
+def catalog_states():
+    """TEME state vectors of the latest elements propagated with SGP4, every satellite at every time in one call.
+    start       ISO time of the first state, required so responses can be cached
+    step        seconds between states, 60 by default
+    count       number of times, 1 by default
+    satellites  comma separated satellite numbers, the whole catalog by default
+    format      "json" (default) or "columns": satellite_number (n), position and velocity (n, count, 3) in km and
+                km/s and the sgp4 error codes (n, count) as columns, the times in the meta"""
+    from backend.services.calculations.propagation import get_catalog_propagator, time_grid
+
+    try:
+        start = datetime.fromisoformat(request.args["start"])
+    except (KeyError, ValueError):
+        raise QueryError("start must be an ISO time")
+    step = parse_number("step", float, 60.0, 1e-3, 86400.0 * 365)
+    count = parse_number("count", int, 1, 1, MAX_STATES)
+    satellites = request.args.get("satellites")
+    try:
+        satellites = [int(n) for n in satellites.split(",")] if satellites else None
+    except ValueError:
+        raise QueryError("satellites must be comma separated satellite numbers")
+
+    format_ = response_format()
+    if format_ == "ndjson":
+        raise QueryError("format must be json or columns")
+    propagator = get_catalog_propagator(Session())
+    states = count * (len(propagator) if satellites is None else len(satellites))
+    max_states = MAX_JSON_STATES if format_ == "json" else MAX_STATES
+    if states > max_states:
+        raise QueryError(f"{states} states requested, at most {max_states} per {format_} response")
+
+    result = propagator.propagate(time_grid(start, step, count), satellites)
+    meta = {
+        "version": propagator.version, "frame": "TEME", "start": start.isoformat(), "step_seconds": step, "count": count,
+    }
+    if format_ == "columns":
+        return columnar_response({
+            "satellite_number": result.satellite_numbers,
+            "position": result.positions,
+            "velocity": result.velocities,
+            "error": result.errors,
+        }, meta)
+    failed = result.errors[..., None] != 0
+    return dict(
+        meta,
+        times=json_column(result.times),
+        satellite_numbers=result.satellite_numbers.tolist(),
+        positions=np.where(failed, None, result.positions).tolist(),
+        velocities=np.where(failed, None, result.velocities).tolist(),
+        errors=result.errors.tolist(),
+    )
+
+def parse_number(name, type_, default, minimum, maximum):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = type_(value)
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+    if not minimum <= value <= maximum:
+        raise QueryError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+def response_format():
+    format_ = request.args.get("format")
+    if format_ is None:
+        mimetype = request.accept_mimetypes.best_match(list(FORMATS.values()))
+        format_ = next((name for name, value in FORMATS.items() if value == mimetype), "json")
+    if format_ not in FORMATS:
+        raise QueryError(f"format must be one of {sorted(FORMATS)}")
+    return format_
+
+def columnar_response(columns, meta):
+    return Response(columnar.encode_columns(columns, meta), mimetype=columnar.MIMETYPE)
+
+def json_column(values):
+    if values.dtype.kind == "M":
+        return [None if value == "NaT" else value for value in np.datetime_as_string(values, unit="us").tolist()]
+    return values.tolist()
+
+def stream_rows(session, statement, params, fields):
+    """Yields one JSON line per row, fetching STREAM_BATCH_SIZE rows at a time from the open cursor"""
+    result = session.execute(statement, params, execution_options={"yield_per": STREAM_BATCH_SIZE}).mappings()
+    for partition in result.partitions():
+        yield "".join(json.dumps({field: to_json_value(row[field]) for field in fields}) + "\n" for row in partition)
+
+def parse_fields(fields):
+    if not fields:
+        return list(DEFAULT_FIELDS)
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in TLE.__table__.c]
+    if unknown:
+        raise QueryError(f"unknown fields {unknown}")
+    return fields
+
+def parse_limit(limit):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise QueryError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+def encode_cursor(order, values):
+    """Opaque cursor holding the order and the keyset values of the last row of a page"""
+    payload = json.dumps({"order": order, "after": [to_json_value(value) for value in values]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor, order):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = payload["after"]
+        if payload["order"] != order or len(values) != len(ORDERS[order]):
+            raise QueryError("cursor does not belong to this order")
+        if order == "epoch":
+            values = [datetime.fromisoformat(values[0]), int(values[1])]
+        return [int(values[0])] if order == "id" else values
+    except QueryError:
+        raise
+    except (ValueError, KeyError, TypeError):
+        raise QueryError("invalid cursor")
+
+def to_json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+# Background jobs, see backend/services/jobs.py
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Body {"kind": "visibility", "params": {...}, "timeout": seconds}. For visibility, params may name a
+    satellite_number instead of elements, which is resolved to its latest elements here, and a missing start is
+    resolved to now, so the job id (a hash of the params) never matches the result of an earlier window."""
+    from backend.services.jobs import get_job_manager
+
+    body = request.get_json(silent=True) or {}
+    params = dict(body.get("params") or {})
+    if "satellite_number" in params and "elements" not in params:
+        params["elements"] = latest_elements(params.pop("satellite_number"))
+    if body.get("kind") == "visibility" and not params.get("start"):
+        params["start"] = str(np.datetime64("now", "s"))
+    try:
+        job = get_job_manager().submit(body.get("kind"), params, body.get("timeout"))
+    except ValueError as e:
+        raise QueryError(str(e))
+    return job.to_dict(), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    return find_job(job_id).to_dict()
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    from backend.services.jobs import get_job_manager
+
+    find_job(job_id)
+    return get_job_manager().cancel(job_id).to_dict()
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """The result once the job succeeded, otherwise the job with 202 while it is pending or 409 when it did not succeed"""
+    from backend.services.jobs import PENDING, SUCCEEDED, get_job_manager
+
+    job = find_job(job_id)
+    if job.status == SUCCEEDED:
+        return get_job_manager().result(job_id)
+    return job.to_dict(), 202 if job.status in PENDING else 409
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events with the job status on every change until it finished"""
+    from backend.services.jobs import get_job_manager
+
+    find_job(job_id)
+    events = (f"data: {json.dumps(state)}\n\n" for state in get_job_manager().watch(job_id))
+    return Response(events, mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def find_job(job_id):
+    from backend.services.jobs import get_job_manager
+
+    job = get_job_manager().get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+def latest_elements(satellite_number):
+    """Latest elements of a satellite as a JSON ready dict of TLE columns"""
+    record = get_latest_catalog(Session()).get(int(satellite_number))
+    if record is None:
+        raise QueryError(f"no elements for satellite {satellite_number}")
+    return {name: to_json_value(record[name].item()) for name in record.dtype.names}
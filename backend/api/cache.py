@@ -0,0 +1,106 @@
+"""HTTP caching for the read endpoints.
+The data only changes when ingest runs, so a response is identified by the catalog version and the normalized
+request. That key is the ETag: clients revalidate with If-None-Match and get 304, and serialized bodies are kept
+in a byte bounded LRU so repeated queries are answered without touching the database."""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, request
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+MAX_ENTRY_BYTES = 8 * 1024 * 1024  # larger responses are only revalidated, not stored
+
+
+class ResponseCache:
+    """Thread safe LRU of serialized responses, bounded by the total size of the bodies"""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns (body, mimetype) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def request_etag(version):
+    """Strong ETag of the current request at a catalog version: path, sorted query arguments, the JSON body
+    with sorted keys and the Accept header the response format may be negotiated from"""
+    body = request.get_json(silent=True)
+    normalized = json.dumps(
+        [version, request.path, sorted(request.args.items(multi=True)), body, request.headers.get("Accept", "")],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return '"' + hashlib.sha1(normalized.encode()).hexdigest() + '"'
+
+
+def cached_response(cache, get_version):
+    """Decorator for GET views whose response only depends on the request and the catalog version.
+    get_version() returns the current catalog version."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = request_etag(get_version())
+            if etag.strip('"') in request.if_none_match:
+                return not_modified(etag)
+            entry = cache.get(etag)
+            if entry is not None:
+                body, mimetype = entry
+                return with_validators(Response(body, mimetype=mimetype), etag)
+
+            response = view(*args, **kwargs)
+            if not isinstance(response, Response):
+                response = current_app.make_response(response)
+            if response.status_code == 200 and not response.is_streamed:
+                cache.put(etag, response.get_data(), response.mimetype)
+            return with_validators(response, etag) if response.status_code == 200 else response
+        return wrapper
+    return decorator
+
+
+def not_modified(etag):
+    return with_validators(Response(status=304), etag)
+
+
+def with_validators(response, etag):
+    response.headers["ETag"] = etag
+    # Cached copies must be revalidated, the catalog may have changed since
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept"
+    return response
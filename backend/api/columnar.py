@@ -0,0 +1,127 @@
+"""Binary columnar responses for array heavy data: catalog columns, positions, velocities, times.
+The body is the typed-array buffers of the columns behind a small JSON header, so a browser can view every column
+with e.g. new Float64Array(body, offset, length) without parsing, and the server writes NumPy buffers as they are.
+
+Layout, all little endian:
+    MAGIC (4 bytes) | header length (uint32) | header JSON, padded to 8 bytes | column buffers, each 8 byte aligned
+The header is {"rows": n, "columns": [column, ...], "meta": {...}} where a column is
+    {"name", "type", "offset", "length", "shape"}   for numbers, shape only for rows of vectors, e.g. [n, 3]
+    {"name", "type": "utf8", "offset", "length", "data_offset", "data_length"}   int32 offsets (n + 1) and utf-8 data
+Offsets are from the start of the body. Types are uint8, int32, int64, float32, float64, bool (one byte) and
+timestamp[us], int64 microseconds since the Unix epoch."""
+import json
+import struct
+
+import numpy as np
+
+MIMETYPE = "application/vnd.orbitviz.columns"
+MAGIC = b"OVC1"
+ALIGNMENT = 8
+NUMBER_TYPES = {"u1": "uint8", "i4": "int32", "i8": "int64", "f4": "float32", "f8": "float64", "b1": "bool"}
+
+
+def encode_columns(columns, meta=None):
+    """Serializes a {name: array} mapping (or a structured array) of equal length columns to the columnar format"""
+    if isinstance(columns, np.ndarray):
+        columns = {name: columns[name] for name in columns.dtype.names}
+    rows = len(next(iter(columns.values()))) if columns else 0
+    entries = []
+    buffers = []
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if len(values) != rows:
+            raise ValueError(f"column {name} has {len(values)} rows, expected {rows}")
+        entry = {"name": name}
+        if values.dtype.kind in "US":
+            offsets, data = utf8_buffers(values)
+            entry.update(type="utf8", length=rows)
+            buffers += [(entry, "offset", offsets), (entry, "data_offset", data)]
+        else:
+            entry.update(type=column_type(values), length=int(values.size))
+            if values.ndim > 1:
+                entry["shape"] = list(values.shape)
+            buffers.append((entry, "offset", to_little_endian(values)))
+        entries.append(entry)
+
+    header = {"rows": rows, "columns": entries, "meta": meta or {}}
+    # Offsets depend on the header length and the header length on the offsets (their digits), so the header is
+    # laid out until its length stops changing. Both only grow, so this ends after a few passes.
+    header_bytes = json.dumps(header).encode()
+    while True:
+        position = aligned(len(MAGIC) + 4 + len(header_bytes))
+        for entry, key, buffer in buffers:
+            entry[key] = position
+            if key == "data_offset":
+                entry["data_length"] = buffer.nbytes
+            position = aligned(position + buffer.nbytes)
+        laid_out = json.dumps(header).encode()
+        if len(laid_out) == len(header_bytes):
+            header_bytes = laid_out
+            break
+        header_bytes = laid_out
+
+    body = bytearray(position)
+    body[:len(MAGIC)] = MAGIC
+    struct.pack_into("<I", body, len(MAGIC), len(header_bytes))
+    start = len(MAGIC) + 4
+    body[start:start + len(header_bytes)] = header_bytes
+    for entry, key, buffer in buffers:
+        body[entry[key]:entry[key] + buffer.nbytes] = buffer.tobytes()
+    return bytes(body)
+
+
+def decode_columns(body):
+    """Reads a columnar body back into ({name: array}, meta), numbers as read-only views of the body"""
+    if body[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a columnar body")
+    (header_length,) = struct.unpack_from("<I", body, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(body[start:start + header_length])
+    dtypes = {type_: np.dtype(code).newbyteorder("<") for code, type_ in NUMBER_TYPES.items()}
+    dtypes["timestamp[us]"] = np.dtype("<M8[us]")
+    columns = {}
+    for entry in header["columns"]:
+        if entry["type"] == "utf8":
+            offsets = np.frombuffer(body, "<i4", entry["length"] + 1, entry["offset"])
+            data = body[entry["data_offset"]:entry["data_offset"] + entry["data_length"]]
+            columns[entry["name"]] = np.array([data[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])], dtype=str)
+        else:
+            values = np.frombuffer(body, dtypes[entry["type"]], entry["length"], entry["offset"])
+            columns[entry["name"]] = values.reshape(entry.get("shape", [entry["length"]]))
+    return columns, header["meta"]
+
+
+def column_type(values):
+    if values.dtype.kind == "M":
+        return "timestamp[us]"
+    code = f"{values.dtype.kind}{values.dtype.itemsize}"
+    if code not in NUMBER_TYPES:
+        raise ValueError(f"unsupported column type {values.dtype}")
+    return NUMBER_TYPES[code]
+
+
+def to_little_endian(values):
+    """Contiguous little endian copy of a column, datetimes as int64 microseconds"""
+    if values.dtype.kind == "M":
+        values = values.astype("M8[us]").view(np.int64)
+    return np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+
+
+def utf8_buffers(values):
+    """Arrow style (int32 offsets, utf-8 data) buffers of a string column, without a Python loop for ASCII"""
+    if values.dtype.kind == "U":
+        try:
+            values = values.astype(f"S{max(values.dtype.itemsize // 4, 1)}")
+        except UnicodeEncodeError:
+            values = np.char.encode(values, "utf-8")
+    values = np.ascontiguousarray(values)
+    lengths = np.char.str_len(values)  # bytes before the trailing NUL padding
+    characters = values.view(np.uint8).reshape(len(values), values.dtype.itemsize)
+    data = characters[np.arange(values.dtype.itemsize) < lengths[:, None]]
+    offsets = np.zeros(len(values) + 1, dtype="<i4")
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, data
+
+
+def aligned(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
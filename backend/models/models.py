@@ -1,20 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Table, PrimaryKeyConstraint, and_, UniqueConstraint
-from sqlalchemy.ext.declarative import declarative_base, declared_attr
-from sqlalchemy.orm import sessionmaker, foreign
-from sgp4.io import twoline2rv
-from sgp4.earth_gravity import wgs72
+from sqlalchemy import Column, Integer, String, Float, Table, UniqueConstraint, ForeignKey, DateTime, Index
+from sqlalchemy.orm import declarative_base, relationship
 from typing import Union, Tuple
 import math
-from contextlib import contextmanager
-from functools import wraps
-import sqlite3
-import os
-from config import DB_URI, DB_PATH
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Index
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-import json
-from datetime import datetime
+from backend.models.tle_batch import TLEBatch
+from backend.models.omm import iter_omm_file
 
 
 Base = declarative_base()
@@ -50,54 +39,33 @@ class TLE(Base):
     # Relationships
     satellite = relationship("Satellite", back_populates="tles", foreign_keys=[satellite_number])
 
-    __table_args__ = (Index('idx_satellite_epoch', 'satellite_number', 'epoch'),)
+    # Unique so bulk ingest can rely on INSERT ... ON CONFLICT DO NOTHING to skip known TLEs
+    # idx_epoch_id serves keyset pagination in epoch order
+    __table_args__ = (
+        Index('idx_satellite_epoch', 'satellite_number', 'epoch', unique=True),
+        Index('idx_epoch_id', 'epoch', 'id'),
+    )
     # Factory methods
     @staticmethod
     def from_string(tle_string):
-        """All TLEs should be created using this method.
-        All other factory methods should call this method.
-        This ensures that the TLE is valid and that the checksums are correct, at the cost of some overhead."""
+        """All TLEs should be created using this method or the TLEBatch parser it wraps.
+        This ensures that the TLE is valid and that the checksums are correct."""
         try:
             lines = tle_string.strip().split("\n")
             if len(lines) != 3:
                 raise ValueError("TLE string must have exactly 3 lines")
 
-            name = lines[0].strip()
-            line1 = lines[1].strip()
-            line2 = lines[2].strip()
-
-            # Use sgp4 to validate the TLE
-            satrec = twoline2rv(line1, line2, wgs72)
-
-            # Creating a mapping of attribute names to their respective values
-            attributes = {
-                'satellite_number': satrec.satnum,
-                'name': name,
-                'classification': satrec.classification,
-                'international_designator': satrec.intldesg,
-                'epoch_year': satrec.epochyr,
-                'epoch_day': satrec.epochdays,
-                'mean_motion_dot': satrec.ndot,
-                'mean_motion_ddot': satrec.nddot,
-                'bstar': satrec.bstar,
-                'ephemeris_type': satrec.ephtype,
-                'element_number': satrec.elnum,
-                'inclination': satrec.inclo,
-                'right_ascension': satrec.nodeo,
-                'eccentricity': satrec.ecco,
-                'argument_of_perigee': satrec.argpo,
-                'mean_anomaly': satrec.mo,
-                'mean_motion': satrec.no_kozai,
-                'revolution_number': satrec.revnum,
-                'epoch': satrec.epoch
-            }
-            return TLE(**attributes)
+            batch = TLEBatch.from_lines(lines)
+            if batch.errors:
+                raise ValueError(batch.errors[0].reason)
+            return batch.to_tles()[0]
         except Exception as e:
             print(f"Error parsing TLE: {str(e)}")
             return None
     
     @staticmethod
     def from_file(file_path: str):
+        """Returns (TLEs, ParseErrors of the records that could not be parsed)"""
         try:
             with open(file_path, 'r') as file:
                 first_line = file.readline()
@@ -113,84 +81,31 @@ class TLE(Base):
                     return TLE._parse_tle_file(file)
         except Exception as e:
             print(f"Error parsing file: {str(e)}")
-            return []
+            return [], []
     
     @staticmethod
     def _parse_tle_file(file):
-        lines = file.readlines()
-        tles = []
-        for i in range(0, len(lines), 3):
-            try:
-                name = lines[i].strip()
-                line1 = lines[i+1].strip()
-                line2 = lines[i+2].strip()
-                tle = TLE.from_string(f"{name}\n{line1}\n{line2}")
-                if tle is not None:
-                    tles.append(tle)
-            except (IndexError, ValueError) as e:
-                print(f"Error processing TLE starting at line {i}: {str(e)}")
-        return tles
+        """Parses the whole file at once with TLEBatch, returns (TLEs, ParseErrors)"""
+        batch = TLEBatch.from_file(file)
+        return batch.to_tles(), batch.errors
     
     @staticmethod
     def _parse_json_file(file):
-        tles = []
-        raise NotImplementedError("JSON parsing is not yet implemented")
-        # # Load the JSON data only once
-        # data = json.load(file)
-
-        # for entry in data:
-        #     try:
-        #         # Parse the EPOCH in ISO format with timezone
-        #         epoch_datetime = datetime.fromisoformat(entry['EPOCH'])
-        #         epoch_year = epoch_datetime.year % 100
-        #         epoch_day = epoch_datetime.timetuple().tm_yday + epoch_datetime.hour / 24 + epoch_datetime.minute / 1440 + epoch_datetime.second / 86400
-
-        #         # Convert BSTAR to the specific format
-        #         bstar = "{:.5e}".format(entry['BSTAR'])
-        #         bstar_coefficient, bstar_exponent = bstar.split('e')
-        #         bstar_formatted = f"{bstar_coefficient.replace('.','')[:-1]}{int(bstar_exponent):+d}"
-
-        #         # mean motion dot
-        #         f"{entry['MEAN_MOTION_DOT']:.8f}".lstrip('0')
-        #         # Extract TLE fields
-        #         fields = {
-        #             'name': entry['OBJECT_NAME'],
-        #             'norad_cat_id': entry['NORAD_CAT_ID'],
-        #             'classification': entry.get('CLASSIFICATION_TYPE', 'U'),
-        #             'int_desig_year': entry['OBJECT_ID'][2:4],
-        #             'int_desig_launch_no': entry['OBJECT_ID'][5:8],
-        #             'int_desig_piece': entry['OBJECT_ID'][8:],
-        #             'epoch_year': epoch_year,
-        #             'epoch_day': epoch_day,
-        #             'inclination': entry['INCLINATION'],
-        #             'right_ascension': entry['RA_OF_ASC_NODE'],
-        #             'eccentricity': int(entry['ECCENTRICITY'] * 1e7),
-        #             'arg_of_pericenter': entry['ARG_OF_PERICENTER'],
-        #             'mean_anomaly': entry['MEAN_ANOMALY'],
-        #             'mean_motion': entry['MEAN_MOTION'],
-        #             'ephemeris_type': entry['EPHEMERIS_TYPE'],
-        #             'element_number': entry['ELEMENT_SET_NO'],
-        #             'mean_motion_dot': f"{entry.get('MEAN_MOTION_DOT', 0):.8f}".lstrip('0'),
-        #             'bstar': bstar_formatted
-        #         }
-
-        #         # Construct TLE lines
-        #         tle_line1 = f"1 {fields['norad_cat_id']:05d}{fields['classification']} {fields['int_desig_year']}{fields['int_desig_launch_no']} {fields['int_desig_piece']} {fields['epoch_year']:02d}{fields['epoch_day']:012.8f} {fields['mean_motion_dot']} {fields['bstar']} {fields['ephemeris_type']} {fields['element_number']:04d} 0"
-        #         tle_line2 = f"2 {fields['norad_cat_id']:05d} {fields['inclination']:.4f} {fields['right_ascension']:.4f} {fields['eccentricity']:07d} {fields['arg_of_pericenter']:.4f} {fields['mean_anomaly']:.4f} {fields['mean_motion']:.8f}"
-        #         tle_string = f"{fields['name']}\n{tle_line1}\n{tle_line2}"
-        #         tle = TLE.from_string(tle_string)
-        #         tles.append(tle)
-        #     except Exception as e:
-        #         print(f"Error processing JSON object: {entry} with {str(e)}")
-
-        # return tles
+        """Streams an OMM JSON file (e.g. Celestrak FORMAT=json), returns (TLEs, ParseErrors)"""
+        return TLE._parse_omm_file(file)
 
     @staticmethod
     def _parse_csv_file(file):
-        tles = []
-        # TODO: Implement
-        raise NotImplementedError("JSON parsing is not yet implemented")
-        return tles
+        """Streams an OMM CSV file (e.g. Celestrak FORMAT=csv), returns (TLEs, ParseErrors)"""
+        return TLE._parse_omm_file(file)
+
+    @staticmethod
+    def _parse_omm_file(file):
+        tles, errors = [], []
+        for batch in iter_omm_file(file):
+            tles += batch.to_tles()
+            errors += batch.errors
+        return tles, errors
     
     # Instance methods
     def to_tle(self, as_string=False) -> Union[Tuple, str]:
@@ -299,7 +214,9 @@ satellite_group_association = Table(
     Column('group_name', String, ForeignKey('groups.name'), primary_key=True)
 )
 
-
-
-
-
+class VersionCounter(Base):
+    """Named counters bumped by writes that do not add TLEs, e.g. group membership changes, so readers in any process
+    can tell their cached responses are stale"""
+    __tablename__ = 'version_counters'
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
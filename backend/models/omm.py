@@ -0,0 +1,168 @@
+"""Streaming Orbit Mean-Elements Message (OMM) ingestion, e.g. Celestrak's FORMAT=json and FORMAT=csv feeds.
+OMM fields are mapped straight into TLEBatch columns without rebuilding and re-parsing TLE text."""
+import csv
+import json
+from itertools import islice
+
+import numpy as np
+
+from backend.models.tle_batch import TLEBatch, TLE_DTYPE, ParseError, DEG2RAD, XPDOTP
+
+JSON_BUFFER_SIZE = 1 << 16
+OMM_CHUNK_SIZE = 50_000
+
+# TLE column -> (OMM field, scale to sgp4 units). Angles are degrees and mean motion is rev/day in OMM
+OMM_FLOAT_FIELDS = {
+    "inclination": ("INCLINATION", DEG2RAD),
+    "right_ascension": ("RA_OF_ASC_NODE", DEG2RAD),
+    "argument_of_perigee": ("ARG_OF_PERICENTER", DEG2RAD),
+    "mean_anomaly": ("MEAN_ANOMALY", DEG2RAD),
+    "eccentricity": ("ECCENTRICITY", 1.0),
+    "mean_motion": ("MEAN_MOTION", 1.0 / XPDOTP),
+    "mean_motion_dot": ("MEAN_MOTION_DOT", 1.0 / (XPDOTP * 1440.0)),
+    "mean_motion_ddot": ("MEAN_MOTION_DDOT", 1.0 / (XPDOTP * 1440.0 * 1440)),
+    "bstar": ("BSTAR", 1.0),
+}
+# TLE column -> (OMM field, default when the field is missing or empty)
+OMM_INT_FIELDS = {
+    "satellite_number": ("NORAD_CAT_ID", None),
+    "ephemeris_type": ("EPHEMERIS_TYPE", 0),
+    "element_number": ("ELEMENT_SET_NO", 999),
+    "revolution_number": ("REV_AT_EPOCH", 0),
+}
+
+
+def detect_format(first_line):
+    """Returns "json", "csv" or "tle" for the first line of an element file"""
+    first_line = first_line.lstrip()
+    if first_line.startswith("{") or first_line.startswith("["):
+        return "json"
+    if "," in first_line:
+        return "csv"
+    return "tle"
+
+
+def iter_json_records(file, buffer_size=JSON_BUFFER_SIZE):
+    """Incrementally decodes the objects of a top level JSON array (or a single object) from a text file.
+    Only one buffer and the object being decoded are held in memory."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    in_array = False
+
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+            position += 1
+        if position < len(buffer):
+            if not in_array and buffer[position] == "[":
+                in_array = True
+                position += 1
+                continue
+            if in_array and buffer[position] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # Only trust a value once the character after it was read, or at the end of the file
+                if end < len(buffer) or eof:
+                    yield value
+                    if not in_array:
+                        return
+                    position = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            return
+        chunk = file.read(buffer_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_csv_records(file):
+    """Streams the rows of an OMM CSV file as dicts"""
+    return csv.DictReader(file)
+
+
+def batch_from_omm(records, first_record_number=1):
+    """Maps OMM records (dicts of OMM field -> value) into a TLEBatch.
+    Invalid records are reported in TLEBatch.errors, where line_number is the record number."""
+    records = list(records)
+    data = np.empty(len(records), dtype=TLE_DTYPE)
+    failed = np.zeros(len(records), dtype=bool)
+
+    for column, (field, scale) in OMM_FLOAT_FIELDS.items():
+        default = 0.0 if field == "MEAN_MOTION_DDOT" else None
+        data[column] = _omm_column(records, field, np.float64, failed, default) * scale
+    for column, (field, default) in OMM_INT_FIELDS.items():
+        data[column] = _omm_column(records, field, np.int64, failed, default)
+
+    epochs = _omm_column(records, "EPOCH", "M8[us]", failed)
+    years = epochs.astype("M8[Y]")
+    data["epoch"] = epochs
+    data["epoch_year"] = years.astype(np.int64) + 1970
+    data["epoch_day"] = 1.0 + (epochs - years.astype("M8[us]")) / np.timedelta64(86400_000_000, "us")
+    data["name"] = [str(record.get("OBJECT_NAME") or "").strip()[:50] for record in records]
+    data["classification"] = [(record.get("CLASSIFICATION_TYPE") or "U")[:1] for record in records]
+    data["international_designator"] = [str(record.get("OBJECT_ID") or "")[2:].replace("-", "")[:8] for record in records]
+
+    failed |= ~np.isfinite(data["mean_motion"]) | (data["eccentricity"] < 0) | (data["eccentricity"] >= 1)
+    errors = [
+        ParseError(first_record_number + i, "OMM record has missing or invalid fields", json.dumps(records[i], default=str))
+        for i in np.flatnonzero(failed)
+    ]
+    return TLEBatch(data[~failed], errors)
+
+
+def iter_omm_file(file, chunk_size=OMM_CHUNK_SIZE):
+    """Streams an OMM JSON or CSV file, given as a path or an open text file, as TLEBatches of chunk_size records"""
+    if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+        with open(file, "r", encoding="utf-8", newline="") as f:
+            yield from iter_omm_file(f, chunk_size)
+        return
+
+    position = file.tell()
+    fmt = detect_format(file.readline())
+    file.seek(position)
+    records = iter_json_records(file) if fmt == "json" else iter_csv_records(file)
+    record_number = 1
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield batch_from_omm(chunk, record_number)
+        record_number += len(chunk)
+
+
+def read_omm_file(file):
+    """Reads a whole OMM JSON or CSV file into one TLEBatch"""
+    return TLEBatch.concatenate(iter_omm_file(file))
+
+
+def read_element_file(file):
+    """Reads a TLE, OMM JSON or OMM CSV file into a TLEBatch"""
+    with open(file, "r", encoding="utf-8", newline="") as f:
+        if detect_format(f.readline()) == "tle":
+            return TLEBatch.from_file(file)
+    return read_omm_file(file)
+
+
+def _omm_column(records, field, dtype, failed, default=None):
+    """Converts one OMM field of all records at once, falling back to record by record conversion to flag bad records"""
+    values = [record.get(field) for record in records]
+    if default is not None:
+        values = [default if value is None or value == "" else value for value in values]
+    try:
+        out = np.array(values, dtype=dtype)
+    except (ValueError, TypeError):
+        out = np.zeros(len(values), dtype=dtype)
+        for i, value in enumerate(values):
+            try:
+                out[i] = value if dtype == "M8[us]" else float(value)
+            except (ValueError, TypeError):
+                failed[i] = True
+    # None converts silently to NaN/NaT
+    failed |= np.isnat(out) if dtype == "M8[us]" else np.isnan(out) if dtype == np.float64 else False
+    return out
@@ -0,0 +1,262 @@
+"""Columnar TLE parsing.
+Slices the fixed-width TLE columns of a whole file at once into NumPy arrays instead of
+building one sgp4 Satellite and one ORM object per record. ORM objects are only built at the edges."""
+import gzip
+import math
+from collections import namedtuple
+
+import numpy as np
+
+DEG2RAD = math.pi / 180.0
+XPDOTP = 1440.0 / (2.0 * math.pi)  # rev/day -> rad/min
+LINE_WIDTH = 69
+
+# Mirrors the columns of the TLE model, in the same units sgp4 stores them in
+TLE_DTYPE = np.dtype([
+    ("satellite_number", "i4"),
+    ("name", "U50"),
+    ("classification", "U1"),
+    ("international_designator", "U8"),
+    ("epoch_year", "i4"),
+    ("epoch_day", "f8"),
+    ("mean_motion_dot", "f8"),
+    ("mean_motion_ddot", "f8"),
+    ("bstar", "f8"),
+    ("ephemeris_type", "i4"),
+    ("element_number", "i4"),
+    ("inclination", "f8"),
+    ("right_ascension", "f8"),
+    ("eccentricity", "f8"),
+    ("argument_of_perigee", "f8"),
+    ("mean_anomaly", "f8"),
+    ("mean_motion", "f8"),
+    ("revolution_number", "i4"),
+    ("epoch", "M8[us]"),
+])
+
+# Column positions that must hold a fixed character, same checks as sgp4.io.twoline2rv
+LINE1_LAYOUT = {0: b"1", 1: b" ", 8: b" ", 23: b".", 32: b" ", 34: b".", 43: b" ", 52: b" ", 61: b" ", 63: b" "}
+LINE2_LAYOUT = {0: b"2", 1: b" ", 7: b" ", 11: b".", 16: b" ", 20: b".", 25: b" ", 33: b" ", 37: b".", 42: b" ", 46: b".", 51: b" "}
+
+ParseError = namedtuple("ParseError", ["line_number", "reason", "text"])
+
+
+class TLEBatch:
+    """A set of TLE records stored column-wise in a structured array of TLE_DTYPE.
+    Records that could not be parsed are reported in `errors` as ParseError tuples."""
+
+    def __init__(self, data=None, errors=None):
+        self.data = np.empty(0, dtype=TLE_DTYPE) if data is None else data
+        self.errors = [] if errors is None else errors
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, column):
+        return self.data[column]
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    @property
+    def satellite_numbers(self):
+        return np.unique(self.data["satellite_number"])
+
+    # Factory methods
+    @staticmethod
+    def from_lines(lines, first_line_number=1):
+        """Parses a sequence of TLE lines (str or bytes), with or without name lines."""
+        lines = [line.encode("utf-8") if isinstance(line, str) else line for line in lines]
+        line_numbers = np.array([i for i, line in enumerate(lines, first_line_number) if line.strip()], dtype=np.int64)
+        lines = [line.strip() for line in lines if line.strip()]
+        if not lines:
+            return TLEBatch()
+
+        chars = np.array(lines, dtype=f"S{LINE_WIDTH}").view(np.uint8).reshape(len(lines), LINE_WIDTH)
+        errors = []
+
+        # Pair every line 1 with the line 2 right after it, the line before that is the name if it is not an element line
+        is_line1 = (chars[:, 0] == ord("1")) & (chars[:, 1] == ord(" "))
+        is_line2 = (chars[:, 0] == ord("2")) & (chars[:, 1] == ord(" "))
+        paired = np.zeros(len(lines), dtype=bool)
+        paired[:-1] = is_line1[:-1] & is_line2[1:]
+        i1 = np.flatnonzero(paired)
+        i2 = i1 + 1
+        has_name = (i1 > 0) & ~is_line1[np.maximum(i1 - 1, 0)] & ~is_line2[np.maximum(i1 - 1, 0)]
+        i0 = np.where(has_name, i1 - 1, -1)
+
+        used = np.zeros(len(lines), dtype=bool)
+        used[i1] = used[i2] = True
+        used[i0[has_name]] = True
+        for i in np.flatnonzero(~used):
+            reason = "line 1 without a matching line 2" if is_line1[i] else "line 2 without a matching line 1" if is_line2[i] else "unexpected line"
+            errors.append(ParseError(int(line_numbers[i]), reason, lines[i].decode("utf-8", "replace")))
+
+        line1 = chars[i1]
+        line2 = chars[i2]
+        record_line_numbers = line_numbers[np.where(has_name, i0, i1)]
+        bad = np.zeros(len(i1), dtype=bool)
+
+        def reject(mask, reason):
+            for i in np.flatnonzero(mask & ~bad):
+                errors.append(ParseError(int(record_line_numbers[i]), reason, lines[i1[i]].decode("utf-8", "replace")))
+            bad[mask] = True
+
+        reject(~_matches_layout(line1, LINE1_LAYOUT), "line 1 does not match the TLE format")
+        reject(~_matches_layout(line2, LINE2_LAYOUT) | (line2[:, 67] == 0), "line 2 does not match the TLE format")
+        reject((line1[:, 2:7] != line2[:, 2:7]).any(axis=1), "satellite numbers in lines 1 and 2 do not match")
+        reject(~_checksum_ok(line1), "line 1 checksum mismatch")
+        reject(~_checksum_ok(line2), "line 2 checksum mismatch")
+
+        parse_failed = np.zeros(len(i1), dtype=bool)
+        data = np.empty(len(i1), dtype=TLE_DTYPE)
+        data["satellite_number"] = _alpha5_column(line1, parse_failed)
+        data["classification"] = np.where(line1[:, 7] == ord(" "), "U", _field(line1, 7, 8).astype("U1"))
+        data["international_designator"] = np.char.rstrip(_field(line1, 9, 17)).astype("U8")
+        two_digit_year = _number_column(line1, 18, 20, np.int32, parse_failed)
+        data["epoch_year"] = np.where(two_digit_year < 57, 2000, 1900) + two_digit_year
+        data["epoch_day"] = _number_column(line1, 20, 32, np.float64, parse_failed)
+        data["mean_motion_dot"] = _number_column(line1, 33, 43, np.float64, parse_failed) / (XPDOTP * 1440.0)
+        data["mean_motion_ddot"] = _exponent_column(line1, 44, parse_failed) / (XPDOTP * 1440.0 * 1440)
+        data["bstar"] = _exponent_column(line1, 53, parse_failed)
+        data["ephemeris_type"] = _number_column(np.where(line1 == ord(" "), np.uint8(ord("0")), line1), 62, 63, np.int32, parse_failed)
+        data["element_number"] = _number_column(line1, 64, 68, np.int32, parse_failed)
+        data["inclination"] = _number_column(line2, 8, 16, np.float64, parse_failed) * DEG2RAD
+        data["right_ascension"] = _number_column(line2, 17, 25, np.float64, parse_failed) * DEG2RAD
+        data["eccentricity"] = _number_column(np.where(line2 == ord(" "), np.uint8(ord("0")), line2), 26, 33, np.int64, parse_failed) / 1e7
+        data["argument_of_perigee"] = _number_column(line2, 34, 42, np.float64, parse_failed) * DEG2RAD
+        data["mean_anomaly"] = _number_column(line2, 43, 51, np.float64, parse_failed) * DEG2RAD
+        data["mean_motion"] = _number_column(line2, 52, 63, np.float64, parse_failed) / XPDOTP
+        data["revolution_number"] = _number_column(line2, 63, 68, np.int32, parse_failed, blank=0)
+        data["epoch"] = _epoch_column(data["epoch_year"], data["epoch_day"])
+        reject(parse_failed, "a numeric field could not be parsed")
+
+        data["name"] = [lines[i].decode("utf-8", "replace") if i >= 0 else "" for i in i0]
+
+        errors.sort(key=lambda error: error.line_number)
+        return TLEBatch(data[~bad], errors)
+
+    @staticmethod
+    def from_file(file):
+        """Parses a TLE file given as a path or an open file object."""
+        if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+            with open(file, "rb") as f:
+                content = f.read()
+        else:
+            content = file.read()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return TLEBatch.from_lines(content.splitlines())
+
+    @staticmethod
+    def iter_file(path, chunk_size=100_000, offset=0, first_line_number=1):
+        """Streams a TLE file (optionally gzip compressed) as TLEBatches of about chunk_size lines.
+        Chunks always end on a line 2, so no record is split. Yields (batch, offset, next_line_number) where
+        offset is the byte offset right after the chunk, which can be passed back in to resume."""
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rb") as f:
+            f.seek(offset)
+            line_number = first_line_number
+            lines = []
+            while True:
+                line = f.readline()
+                if line:
+                    lines.append(line)
+                if not line or (len(lines) >= chunk_size and line.lstrip().startswith(b"2 ")):
+                    if lines:
+                        yield TLEBatch.from_lines(lines, line_number), f.tell(), line_number + len(lines)
+                        line_number += len(lines)
+                        lines = []
+                    if not line:
+                        return
+
+    def unique(self):
+        """Drops records with a (satellite_number, epoch) already seen earlier in the batch."""
+        _, first = np.unique(self.data[["satellite_number", "epoch"]], return_index=True)
+        return TLEBatch(self.data[np.sort(first)], self.errors)
+
+    @staticmethod
+    def concatenate(batches):
+        batches = list(batches)
+        if not batches:
+            return TLEBatch()
+        return TLEBatch(np.concatenate([b.data for b in batches]), [e for b in batches for e in b.errors])
+
+    # Edges
+    def to_records(self):
+        """Returns the batch as a list of plain python dicts keyed by TLE column, e.g. for executemany."""
+        columns = {name: self.data[name].tolist() for name in TLE_DTYPE.names}
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def to_tles(self):
+        """Builds TLE ORM objects from the batch."""
+        from backend.models.models import TLE
+        return [TLE(**record) for record in self.to_records()]
+
+
+def _field(chars, start, stop):
+    """Returns the fixed-width columns [start, stop) of every line as a bytes array."""
+    return np.ascontiguousarray(chars[:, start:stop]).view(f"S{stop - start}").ravel()
+
+
+def _matches_layout(chars, layout):
+    ok = np.ones(len(chars), dtype=bool)
+    for column, char in layout.items():
+        ok &= chars[:, column] == ord(char)
+    return ok
+
+
+def _checksum_ok(chars):
+    """Vectorized TLE checksum, lines without a checksum digit are accepted like sgp4 does."""
+    body = chars[:, :68].astype(np.int32)
+    digits = (body >= ord("0")) & (body <= ord("9"))
+    total = np.where(digits, body - ord("0"), 0).sum(axis=1) + (body == ord("-")).sum(axis=1)
+    checksum = chars[:, 68].astype(np.int32) - ord("0")
+    has_checksum = (checksum >= 0) & (checksum <= 9)
+    return ~has_checksum | (total % 10 == checksum)
+
+
+def _number_column(chars, start, stop, dtype, failed, blank=None):
+    """Parses a numeric field for all lines at once.
+    Falls back to record by record parsing to find the offending records when the fast path fails."""
+    field = _field(chars, start, stop)
+    try:
+        return field.astype(dtype)
+    except ValueError:
+        out = np.zeros(len(field), dtype=dtype)
+        for i, value in enumerate(field):
+            try:
+                out[i] = float(value)
+            except ValueError:
+                if blank is not None and not value.strip():
+                    out[i] = blank
+                else:
+                    failed[i] = True
+        return out
+
+
+def _exponent_column(chars, start, failed):
+    """Parses the TLE 'assumed decimal point' fields such as ' 12345-4' (0.12345e-4)."""
+    mantissa = _number_column(chars, start, start + 6, np.int64, failed) / 1e5
+    exponent = _number_column(chars, start + 6, start + 8, np.float64, failed)
+    return mantissa * np.power(10.0, exponent)
+
+
+def _alpha5_column(chars, failed):
+    """Satellite numbers, including Alpha-5 numbers such as 'A0001' (100001)."""
+    alpha = (chars[:, 2] >= ord("A")) & (chars[:, 2] <= ord("Z"))
+    if not alpha.any():
+        return _number_column(chars, 2, 7, np.int32, failed)
+    digits = np.where(alpha[:, None], np.hstack([np.full((len(chars), 1), ord("0"), np.uint8), chars[:, 3:7]]), chars[:, 2:7])
+    numbers = _number_column(digits, 0, 5, np.int32, failed)
+    prefix = chars[:, 2].astype(np.int32) - ord("A") + 10
+    prefix -= (chars[:, 2] > ord("I")).astype(np.int32) + (chars[:, 2] > ord("O")).astype(np.int32)
+    return np.where(alpha, prefix * 10000 + numbers, numbers)
+
+
+def _epoch_column(epoch_year, epoch_day):
+    """Converts year and fractional day of year to datetime64, rounded to the microsecond.
+    The TLE epoch has 8 decimals of a day, so this is exact."""
+    year_start = (epoch_year - 1970).astype("M8[Y]").astype("M8[us]")
+    microseconds = np.rint((epoch_day - 1.0) * 86400e6).astype(np.int64)
+    return year_start + microseconds.astype("m8[us]")
@@ -1,6 +1,5 @@
 import numpy as np
 import portion as P
-from scipy import optimize
 
 def find_crossing_bound_indices(values):
     """Given a list of values, returns the indices of the values where the boundary is crossed
@@ -24,6 +23,8 @@ def initial_search(times, f, desired_val, *args):
 
 def find_crossing(func, desired_val, start_time, end_time, *args):
     """Finds the desired value boundary crossing time of a function of time."""
+    from scipy import optimize
+
     # Use scipy optimize to find the boundary crossing times
     root = optimize.root_scalar(
         func,
@@ -1,7 +1,5 @@
 import numpy as np
-from astropy.coordinates import GCRS, EarthLocation, ITRS
-from astropy import units as u
-from astropy.coordinates.builtin_frames.intermediate_rotation_transforms import cirs_to_itrs_mat, gcrs_to_cirs_mat
+# astropy is imported where it is used, it takes seconds to import
 
 
 def get_satellite_state(time, ephems):
@@ -10,17 +8,21 @@ def get_satellite_state(time, ephems):
     return r, v
 
 def get_ground_station_position(time, location):
-    """Returns the position of the ground station in the GCRS frame at a given time"""
+    """Returns the position of the ground station in the GCRS frame at a given time (scalar or array)"""
 
-    # r,v = location.get_gcrs_posvel(obstime=time)
-    # return r.xyz.to(u.km), v.xyz.to(u.km/u.s)
+    from astropy import units as u
+    from earth_orientation import EarthOrientation
 
-    gcrs_coords = location.itrs.transform_to(GCRS(obstime=time))
-    r = gcrs_coords.cartesian.xyz.to(u.km)
+    # One batched rotation instead of an astropy frame transform per call, see earth_orientation for its accuracy
+    itrs = np.array([coordinate.to_value(u.km) for coordinate in location.geocentric])
+    r = EarthOrientation(np.atleast_1d(time.utc.datetime64)).to_inertial(itrs).T * u.km
+    r = r[:, 0] if time.isscalar else r
     return r, r
 
 def calc_elevation(time, ephems, location):
     """Returns the elevation angle of the satellite at a given time"""
+    from astropy import units as u
+
     r1, _ = get_satellite_state(time, ephems)
     r2 = r1 - 1000 * u.km
     r2, _ = get_ground_station_position(time, location)
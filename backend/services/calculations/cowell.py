@@ -0,0 +1,223 @@
+"""Numerical (Cowell) propagation of many orbits in one compiled call, for custom or maneuvering orbits that
+SGP4 elements do not describe.
+Each orbit is integrated with its own adaptive Dormand-Prince 5(4) steps and tolerances, and the states at the
+requested times come from the dense output of the step that contains them, so output times do not shorten the
+steps. The force model is two-body gravity plus J2, and drag from an exponential atmosphere for orbits given a
+ballistic coefficient; the right-hand side writes into preallocated buffers and never returns to Python.
+It is the batched counterpart of the poliastro CowellPropagator of visibility_intervals3.py, which propagates one
+poliastro Orbit with a Python right-hand side.
+
+    errors, positions, velocities = propagate(states, seconds, rtol=1e-10)"""
+import numpy as np
+from numba import njit
+
+from backend.services.calculations.propagation import SGP4_ERRORS, julian_dates, mask_failed, satrec_from_elements
+
+MU = 398600.4418  # km^3/s^2
+EARTH_RADIUS = 6378.137  # km
+J2 = 1.08262668e-3
+EARTH_ROTATION = 7.292115e-5  # rad/s, the atmosphere rotates with the Earth
+RTOL = 1e-9
+ATOL = 1e-6  # km and km/s
+MAX_STEPS = 1_000_000  # per orbit
+# Error codes per state, 0 is success. States from the failure on are NaN.
+COWELL_ERRORS = {
+    1: "maximum number of steps reached",
+    2: "step size underflow",
+    3: "below the Earth's surface",
+}
+# Exponential atmosphere (Vallado, Fundamentals of Astrodynamics, table 8-4): base altitude km, density kg/m^3
+# at the base altitude, scale height km
+ATMOSPHERE = np.array([
+    (0, 1.225, 7.249), (25, 3.899e-2, 6.349), (30, 1.774e-2, 6.682), (40, 3.972e-3, 7.554),
+    (50, 1.057e-3, 8.382), (60, 3.206e-4, 7.714), (70, 8.770e-5, 6.549), (80, 1.905e-5, 5.799),
+    (90, 3.396e-6, 5.382), (100, 5.297e-7, 5.877), (110, 9.661e-8, 7.263), (120, 2.438e-8, 9.473),
+    (130, 8.484e-9, 12.636), (140, 3.845e-9, 16.149), (150, 2.070e-9, 22.523), (180, 5.464e-10, 29.740),
+    (200, 2.789e-10, 37.105), (250, 7.248e-11, 45.546), (300, 2.418e-11, 53.628), (350, 9.518e-12, 53.298),
+    (400, 3.725e-12, 58.515), (450, 1.585e-12, 60.828), (500, 6.967e-13, 63.822), (600, 1.454e-13, 71.835),
+    (700, 3.614e-14, 88.667), (800, 1.170e-14, 124.64), (900, 5.245e-15, 181.05), (1000, 3.019e-15, 268.00),
+])
+
+# Dormand-Prince 5(4) tableau (the right-hand side does not depend on time, so no nodes), error weights (5th minus 4th order) and dense output weights (Hairer, contd5)
+A = np.array([
+    [0, 0, 0, 0, 0, 0],
+    [1 / 5, 0, 0, 0, 0, 0],
+    [3 / 40, 9 / 40, 0, 0, 0, 0],
+    [44 / 45, -56 / 15, 32 / 9, 0, 0, 0],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656, 0],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+])
+E = np.array([71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40])
+D = np.array([
+    -12715105075 / 11282082432, 0, 87487479700 / 32700410799, -10690763975 / 1880347072,
+    701980252875 / 199316789632, -1453857185 / 822651844, 69997945 / 29380423,
+])
+
+
+@njit(cache=True)
+def density(altitude):
+    """Atmospheric density in kg/m^3 at an altitude in km"""
+    layer = np.searchsorted(ATMOSPHERE[:, 0], altitude, side="right") - 1
+    if layer < 0:
+        layer = 0
+    return ATMOSPHERE[layer, 1] * np.exp(-(altitude - ATMOSPHERE[layer, 0]) / ATMOSPHERE[layer, 2])
+
+
+@njit(cache=True)
+def derivative(y, j2, ballistic, out):
+    """Writes d(state)/dt of the state y (x, y, z, vx, vy, vz) into out: two-body gravity, plus J2 when j2 is
+    true, plus drag when ballistic (Cd * area / mass in m^2/kg) is nonzero"""
+    x, y_, z = y[0], y[1], y[2]
+    r2 = x * x + y_ * y_ + z * z
+    r = np.sqrt(r2)
+    k = -MU / (r2 * r)
+    ax, ay, az = k * x, k * y_, k * z
+    if j2:
+        factor = 1.5 * J2 * MU * EARTH_RADIUS ** 2 / (r2 * r2 * r)
+        z2 = 5 * z * z / r2
+        ax += factor * x * (z2 - 1)
+        ay += factor * y_ * (z2 - 1)
+        az += factor * z * (z2 - 3)
+    if ballistic > 0:
+        # Velocity relative to the co-rotating atmosphere, 1e3 converts the density and area to km
+        vx, vy, vz = y[3] + EARTH_ROTATION * y_, y[4] - EARTH_ROTATION * x, y[5]
+        v = np.sqrt(vx * vx + vy * vy + vz * vz)
+        drag = -0.5e3 * ballistic * density(r - EARTH_RADIUS) * v
+        ax += drag * vx
+        ay += drag * vy
+        az += drag * vz
+    out[0], out[1], out[2] = y[3], y[4], y[5]
+    out[3], out[4], out[5] = ax, ay, az
+
+
+@njit(cache=True)
+def error_norm(error, y, y_new, rtol, atol):
+    total = 0.0
+    for i in range(6):
+        scale = atol + rtol * max(abs(y[i]), abs(y_new[i]))
+        total += (error[i] / scale) ** 2
+    return np.sqrt(total / 6)
+
+
+@njit(cache=True)
+def integrate(states, seconds, rtol, atol, j2, ballistic, max_steps, errors, out):
+    """Integrates each row of states (n, 6) and writes the states at seconds (m,), ascending from 0, into
+    out (n, m, 6) and the error codes into errors (n, m)"""
+    k = np.empty((7, 6))
+    y = np.empty(6)
+    y_new = np.empty(6)
+    stage = np.empty(6)
+    error = np.empty(6)
+    dense = np.empty((5, 6))
+    end = seconds[-1]
+    for orbit in range(states.shape[0]):
+        y[:] = states[orbit]
+        t = 0.0
+        output = 0
+        while output < len(seconds) and seconds[output] <= 0:
+            out[orbit, output] = y
+            output += 1
+        derivative(y, j2, ballistic[orbit], k[0])
+        # Initial step from the scales of the state and its derivative (Hairer, Norsett and Wanner II.4)
+        d0, d1 = 0.0, 0.0
+        for i in range(6):
+            scale = atol[orbit] + rtol[orbit] * abs(y[i])
+            d0 += (y[i] / scale) ** 2
+            d1 += (k[0, i] / scale) ** 2
+        h = 0.01 * np.sqrt(d0 / d1) if d0 > 1e-10 and d1 > 1e-10 else 1e-6
+        code = 0
+        steps = 0
+        while output < len(seconds):
+            if steps == max_steps:
+                code = 1
+                break
+            if h < 1e-10 * max(t, 1.0):
+                code = 2
+                break
+            last = h >= end - t
+            if last:
+                h = end - t
+            for s in range(1, 7):
+                for i in range(6):
+                    total = 0.0
+                    for j in range(s):
+                        total += A[s, j] * k[j, i]
+                    stage[i] = y[i] + h * total
+                if s < 6:
+                    derivative(stage, j2, ballistic[orbit], k[s])
+            y_new[:] = stage  # the 7th row of A is the 5th order solution
+            derivative(y_new, j2, ballistic[orbit], k[6])
+            for i in range(6):
+                total = 0.0
+                for j in range(7):
+                    total += E[j] * k[j, i]
+                error[i] = h * total
+            norm = error_norm(error, y, y_new, rtol[orbit], atol[orbit])
+            steps += 1
+            if norm > 1.0:
+                h *= max(0.2, 0.9 * norm ** -0.2)
+                continue
+            for i in range(6):
+                difference = y_new[i] - y[i]
+                correction = h * k[0, i] - difference
+                total = 0.0
+                for j in range(7):
+                    total += D[j] * k[j, i]
+                dense[0, i] = y[i]
+                dense[1, i] = difference
+                dense[2, i] = correction
+                dense[3, i] = difference - h * k[6, i] - correction
+                dense[4, i] = h * total
+            t_new = end if last else t + h
+            while output < len(seconds) and seconds[output] <= t_new:
+                theta = (seconds[output] - t) / h
+                rest = 1 - theta
+                for i in range(6):
+                    out[orbit, output, i] = dense[0, i] + theta * (dense[1, i] + rest * (dense[2, i] + theta * (dense[3, i] + rest * dense[4, i])))
+                output += 1
+            t = t_new
+            y[:] = y_new
+            k[0] = k[6]  # first same as last
+            if y[0] ** 2 + y[1] ** 2 + y[2] ** 2 < EARTH_RADIUS ** 2:
+                code = 3
+                break
+            h *= min(10.0, 0.9 * norm ** -0.2) if norm > 0 else 10.0
+        for remaining in range(output, len(seconds)):
+            errors[orbit, remaining] = code
+    return errors, out
+
+
+def propagate(states, seconds, rtol=RTOL, atol=ATOL, j2=True, ballistic_coefficients=0.0, max_steps=MAX_STEPS):
+    """Integrates initial states (n, 6) in km and km/s of an inertial, Earth centered frame (e.g. TEME) and
+    returns (errors (n, m), positions (n, m, 3), velocities (n, m, 3)) at seconds (m,) from the initial states,
+    like SatrecArray.sgp4. rtol, atol and ballistic_coefficients (Cd * area / mass in m^2/kg, 0 for no drag)
+    are scalars or one value per orbit."""
+    states = np.ascontiguousarray(np.atleast_2d(states), dtype=np.float64)
+    seconds = np.atleast_1d(np.asarray(seconds, dtype=np.float64))
+    if states.shape[1:] != (6,):
+        raise ValueError("states must have shape (n, 6)")
+    if len(seconds) and (seconds[0] < 0 or (np.diff(seconds) < 0).any()):
+        raise ValueError("seconds must be ascending from 0")
+    n = len(states)
+    rtol, atol, ballistic = (np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype=np.float64), (n,)))
+                             for value in (rtol, atol, ballistic_coefficients))
+    errors = np.zeros((n, len(seconds)), dtype=np.uint8)
+    out = np.empty((n, len(seconds), 6))
+    if n and len(seconds):
+        integrate(states, seconds, rtol, atol, bool(j2), ballistic, int(max_steps), errors, out)
+    positions, velocities = np.ascontiguousarray(out[..., :3]), np.ascontiguousarray(out[..., 3:])
+    mask_failed(errors, positions, velocities)
+    return errors, positions, velocities
+
+
+def initial_states(elements, time):
+    """TEME states (n, 6) of a TLE_DTYPE array of elements at a datetime64 time, from SGP4"""
+    jd, fr = julian_dates(np.datetime64(time, "us"))
+    states = np.empty((len(elements), 6))
+    for row, record in enumerate(elements):
+        error, r, v = satrec_from_elements(record).sgp4(float(jd), float(fr))
+        if error:
+            raise ValueError(f"satellite {record['satellite_number']}: {SGP4_ERRORS.get(error, error)}")
+        states[row] = r + v
+    return states
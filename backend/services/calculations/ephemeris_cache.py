@@ -0,0 +1,233 @@
+"""Persistent cache of propagated ephemerides under data/cache/ephemerides.
+An entry is the states of one satellite on one time grid, keyed by (TLE id or orbit hash, propagator, start, step,
+count), stored as .npy files that are memory mapped on a hit. Each entry directory is self describing and its
+modification time is its last use, so several processes (API, job workers) can share the cache without a common
+index. Each process keeps its own index of the entries in LRU order and their total size, seeded from the directory
+once and kept up to date by its gets, puts and removals, so misses and ingests do not rescan the directory. The cache
+is bounded in bytes by evicting the least recently used entries, and entries of a satellite are dropped by an ingest
+hook once a TLE with a newer epoch becomes its latest."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import select
+
+from config import DIRS
+from backend.models.models import TLE, Satellite
+from backend.services.calculations.propagation import StateVectors, julian_dates, mask_failed, satrec_from_elements, time_grid
+from backend.services.database.database_operations import IN_CHUNK_SIZE, chunks, register_ingest_hook
+from backend.services.metrics import registry
+
+EPHEMERIS_DIR = os.path.join(DIRS["cache"], "ephemerides")
+MAX_CACHE_BYTES = 1024 ** 3
+ARRAYS = ("positions", "velocities", "errors")
+# The element columns that determine an SGP4 orbit
+ORBIT_FIELDS = (
+    "satellite_number", "epoch", "bstar", "mean_motion_dot", "mean_motion_ddot", "eccentricity",
+    "argument_of_perigee", "inclination", "mean_anomaly", "mean_motion", "right_ascension",
+)
+
+
+def orbit_hash(elements):
+    """Content hash of the orbit of a TLE column record (a dict or TLE_DTYPE row)"""
+    values = [str(np.datetime64(elements["epoch"], "us")) if field == "epoch" else repr(float(elements[field]))
+              for field in ORBIT_FIELDS]
+    return hashlib.sha1("|".join(values).encode()).hexdigest()
+
+
+class EphemerisCache:
+    def __init__(self, root=EPHEMERIS_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> meta, least recently used first
+        self._bytes = 0
+
+    @staticmethod
+    def key(elements, start, step_seconds, count, tle_id=None, propagator="sgp4"):
+        orbit = f"tle-{int(tle_id)}" if tle_id is not None else orbit_hash(elements)
+        normalized = json.dumps([orbit, propagator, str(np.datetime64(start, "us")), float(step_seconds), int(count)])
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def propagate(self, elements, start, step_seconds, count, tle_id=None):
+        """SGP4 states of one satellite at count times from start, step_seconds apart, as StateVectors of shape
+        (1, count, ...). Served from the cache when possible, otherwise propagated and stored."""
+        key = self.key(elements, start, step_seconds, count, tle_id)
+        states = self.get(key)
+        if states is not None:
+            return states
+        times = time_grid(start, step_seconds, count)
+        errors, positions, velocities = satrec_from_elements(elements).sgp4_array(*julian_dates(times))
+        mask_failed(errors, positions, velocities)
+        states = StateVectors(np.array([elements["satellite_number"]], dtype=np.int32), times,
+                              positions[None], velocities[None], errors[None])
+        self.put(key, states, {
+            "satellite_number": int(elements["satellite_number"]),
+            "epoch": str(np.datetime64(elements["epoch"], "us")),
+            "tle_id": None if tle_id is None else int(tle_id),
+            "start": str(times[0]), "step_seconds": float(step_seconds), "count": int(count),
+        })
+        return states
+
+    def get(self, key):
+        """Read-only memory mapped StateVectors of an entry, or None"""
+        path = os.path.join(self.root, key)
+        try:
+            meta = read_meta(path)
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+            os.utime(os.path.join(path, "meta.json"))  # last use, for the LRU order
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self.misses += 1
+                self._forget(key)  # evicted by another process
+            return None
+        with self._lock:
+            self.hits += 1
+            self._touch(key, meta)
+        times = time_grid(meta["start"], meta["step_seconds"], meta["count"])
+        return StateVectors(np.array([meta["satellite_number"]], dtype=np.int32), times,
+                            arrays["positions"], arrays["velocities"], arrays["errors"])
+
+    def put(self, key, states, meta):
+        """Stores an entry, written to a temporary directory and renamed so readers never see a partial one"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        size = 0
+        for name in ARRAYS:
+            array = getattr(states, name)
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+            size += array.nbytes
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta, bytes=size), f)
+        try:
+            os.rename(tmp_path, os.path.join(self.root, key))
+        except OSError:
+            shutil.rmtree(tmp_path)  # another process stored the same entry first
+        with self._lock:
+            self._touch(key, dict(meta, bytes=size))
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def entries(self):
+        """(key, meta, last use) of every entry"""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                meta_path = os.path.join(entry.path, "meta.json")
+                entries.append((entry.name, read_meta(entry.path), os.stat(meta_path).st_mtime))
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                continue
+        return entries
+
+    @property
+    def index(self):
+        """key -> meta of the known entries, least recently used first, read from the directory on first use"""
+        if self._index is None:
+            self._index = OrderedDict()
+            self._bytes = 0
+            for key, meta, _ in sorted(self.entries(), key=lambda entry: entry[2]):
+                self._touch(key, meta)
+        return self._index
+
+    def _touch(self, key, meta):
+        """Records key as the most recently used entry, the caller holds the lock"""
+        index = self.index
+        if key in index:
+            index.move_to_end(key)
+            return
+        index[key] = {field: meta[field] for field in ("satellite_number", "epoch", "bytes")}
+        self._bytes += meta["bytes"]
+
+    def _forget(self, key):
+        meta = self.index.pop(key, None)
+        if meta is not None:
+            self._bytes -= meta["bytes"]
+
+    @property
+    def size(self):
+        with self._lock:
+            self.index  # seeds the total
+            return self._bytes
+
+    def evict(self, max_bytes=None):
+        """Removes the least recently used entries until the cache fits in max_bytes, returns the removed keys"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self._lock:
+            index = self.index
+            while self._bytes > max_bytes and index:
+                removed.append(next(iter(index)))
+                self._forget(removed[-1])
+        for key in removed:
+            self._delete(key)
+        return removed
+
+    def remove(self, key):
+        with self._lock:
+            self._forget(key)
+        self._delete(key)
+
+    def _delete(self, key):
+        # Open memory maps of the entry stay valid, the files are freed with them
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            self.remove(key)
+
+    def invalidate(self, session):
+        """Ingest hook: removes the entries of satellites whose latest TLE is newer than the one they were
+        propagated from, returns the removed keys"""
+        with self._lock:
+            entries = list(self.index.items())
+        satellite_numbers = sorted({meta["satellite_number"] for _, meta in entries})
+        latest = {}
+        for chunk in chunks(satellite_numbers, IN_CHUNK_SIZE):
+            latest.update(session.execute(
+                select(TLE.satellite_number, TLE.epoch)
+                .join(Satellite, Satellite.latest_tle_id == TLE.id)
+                .where(TLE.satellite_number.in_(chunk))
+            ).all())
+        removed = []
+        for key, meta in entries:
+            epoch = latest.get(meta["satellite_number"])
+            if epoch is not None and np.datetime64(epoch, "us") > np.datetime64(meta["epoch"], "us"):
+                self.remove(key)
+                removed.append(key)
+        return removed
+
+    def metrics(self):
+        return [
+            ("orbitviz_ephemeris_cache_hits_total", "counter", "Ephemerides served from the cache", self.hits),
+            ("orbitviz_ephemeris_cache_misses_total", "counter", "Ephemerides propagated on a cache miss", self.misses),
+        ]
+
+
+def read_meta(path):
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+ephemeris_cache = None
+
+
+def get_ephemeris_cache():
+    """The process-wide EphemerisCache, invalidated by every ingest in this process"""
+    global ephemeris_cache
+    if ephemeris_cache is None:
+        ephemeris_cache = EphemerisCache()
+        register_ingest_hook(ephemeris_cache.invalidate)
+        registry.register_collector(ephemeris_cache.metrics)
+    return ephemeris_cache
@@ -0,0 +1,156 @@
+"""Compressed interpolating ephemerides: piecewise Chebyshev fits of propagated positions.
+A segment of degree d is fitted to the positions at its d + 1 Chebyshev nodes and then checked against the
+propagator at CHECKS_PER_SEGMENT points in between; segments over tolerance_km are halved and refitted, so the
+fit is verified to tolerance_km at the check points. All nodes and checks of a refinement round are propagated
+in one vectorized call. Evaluation groups a batch of times by segment into small matrix products, and gives the
+velocities as the derivative of the position series."""
+import numpy as np
+from numpy.polynomial.chebyshev import chebder, chebvander
+
+from backend.services.calculations.propagation import julian_dates, satrec_from_elements
+
+DEGREE = 12
+TOLERANCE_KM = 1e-3
+SEGMENTS_PER_ORBIT = 2
+CHECKS_PER_SEGMENT = 2 * (DEGREE + 1)
+MAX_REFINEMENTS = 12
+SECOND = np.timedelta64(1, "s")
+
+
+class ChebyshevEphemeris:
+    """Positions over [start, start + boundaries[-1] seconds] as Chebyshev series, one per segment between
+    consecutive boundaries, with coefficients (segments, degree + 1, 3) in km"""
+
+    def __init__(self, start, boundaries, coefficients, max_error_km=None):
+        self.start = np.datetime64(start, "us")
+        self.boundaries = np.asarray(boundaries, dtype=np.float64)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.max_error_km = max_error_km
+        self._derivatives = None
+
+    def __len__(self):
+        return len(self.coefficients)
+
+    @property
+    def degree(self):
+        return self.coefficients.shape[1] - 1
+
+    @property
+    def duration_seconds(self):
+        return float(self.boundaries[-1])
+
+    @property
+    def nbytes(self):
+        return self.boundaries.nbytes + self.coefficients.nbytes
+
+    def evaluate(self, times):
+        """Positions (n, 3) in km and velocities (n, 3) in km/s at datetime64 times within the fitted span"""
+        return self.evaluate_seconds((np.asarray(times, dtype="M8[us]") - self.start) / SECOND)
+
+    def position(self, second):
+        """Position (3,) in km at one time in seconds from start, without the grouping of evaluate_seconds, for
+        scalar callers such as root finding"""
+        if not 0 <= second <= self.duration_seconds:
+            raise ValueError("time outside of the fitted span")
+        index = min(int(np.searchsorted(self.boundaries, second, side="right")), len(self)) - 1
+        lower, upper = self.boundaries[index], self.boundaries[index + 1]
+        tau = min(max((2 * second - (lower + upper)) / (upper - lower), -1.0), 1.0)
+        return np.cos(np.arange(self.degree + 1) * np.arccos(tau)) @ self.coefficients[index]  # T_k(tau)
+
+    def evaluate_seconds(self, seconds):
+        seconds = np.atleast_1d(np.asarray(seconds, dtype=np.float64))
+        if seconds.size and (seconds.min() < 0 or seconds.max() > self.duration_seconds):
+            raise ValueError("times outside of the fitted span")
+        segment = np.searchsorted(self.boundaries, seconds, side="right").clip(1, len(self)) - 1
+        positions = np.empty((len(seconds), 3))
+        velocities = np.empty((len(seconds), 3))
+        # Times grouped by segment: each group is two small matrix products with the coefficients of its segment
+        # and of their derivative, instead of gathering coefficients for every time
+        order = np.argsort(segment, kind="stable")
+        ends = np.cumsum(np.bincount(segment, minlength=len(self)))
+        for index in np.flatnonzero(np.diff(ends, prepend=0)).tolist():
+            rows = order[ends[index - 1] if index else 0:ends[index]]
+            lower, upper = self.boundaries[index], self.boundaries[index + 1]
+            tau = (2 * seconds[rows] - (lower + upper)) / (upper - lower)
+            basis = chebvander(tau, self.degree)
+            positions[rows] = basis @ self.coefficients[index]
+            velocities[rows] = basis[:, :-1] @ self.derivatives[index] * (2 / (upper - lower))
+        return positions, velocities
+
+    @property
+    def derivatives(self):
+        """Chebyshev coefficients (segments, degree, 3) of the derivatives with respect to tau in [-1, 1]"""
+        if self._derivatives is None:
+            self._derivatives = chebder(self.coefficients, axis=1)
+        return self._derivatives
+
+    def to_arrays(self):
+        """Arrays for np.savez, see from_arrays"""
+        return {
+            "start": np.array([self.start]), "boundaries": self.boundaries, "coefficients": self.coefficients,
+            "max_error_km": np.array([np.nan if self.max_error_km is None else self.max_error_km]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        max_error_km = float(arrays["max_error_km"][0])
+        return cls(arrays["start"][0], arrays["boundaries"], arrays["coefficients"], None if np.isnan(max_error_km) else max_error_km)
+
+    @classmethod
+    def fit(cls, propagate, start, duration_seconds, segment_seconds, degree=DEGREE, tolerance_km=TOLERANCE_KM,
+            checks_per_segment=CHECKS_PER_SEGMENT, max_refinements=MAX_REFINEMENTS):
+        """Fits positions returned by propagate(seconds from start) -> (n, 3) km over [0, duration_seconds].
+        Starts from segments of about segment_seconds and halves the ones over tolerance_km at their check points.
+        Raises ValueError when max_refinements halvings are not enough, e.g. when propagate returns NaN."""
+        segments = max(1, int(np.ceil(duration_seconds / segment_seconds)))
+        bounds = np.linspace(0.0, duration_seconds, segments + 1)
+        lowers, uppers = bounds[:-1], bounds[1:]
+        nodes = np.cos(np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1))  # Chebyshev nodes of the first kind
+        checks = np.linspace(-1.0, 1.0, checks_per_segment)
+        # T_k(node_j), the discrete orthogonality of the nodes turns the fit into one matrix product
+        fit_matrix = np.cos(np.outer(np.arange(degree + 1), np.arccos(nodes))) * (2.0 / (degree + 1))
+        fit_matrix[0] /= 2
+        check_matrix = np.cos(np.outer(np.arccos(checks), np.arange(degree + 1)))
+
+        done_lowers, done_uppers, done_coefficients, max_error = [], [], [], 0.0
+        for _ in range(max_refinements + 1):
+            half, mid = (uppers - lowers) / 2, (uppers + lowers) / 2
+            points = np.concatenate([nodes, checks])
+            # One propagate call for the nodes and check points of every open segment
+            values = propagate((mid[:, None] + half[:, None] * points).ravel()).reshape(len(lowers), len(points), 3)
+            coefficients = np.einsum("kj,sjd->skd", fit_matrix, values[:, :len(nodes)])
+            fitted = np.einsum("jk,skd->sjd", check_matrix, coefficients)
+            errors = np.linalg.norm(fitted - values[:, len(nodes):], axis=2).max(axis=1)
+            good = errors <= tolerance_km
+            done_lowers.append(lowers[good])
+            done_uppers.append(uppers[good])
+            done_coefficients.append(coefficients[good])
+            if good.any():
+                max_error = max(max_error, float(errors[good].max()))
+            if good.all():
+                break
+            lowers, uppers = lowers[~good], uppers[~good]
+            lowers, uppers = np.concatenate([lowers, (lowers + uppers) / 2]), np.concatenate([(lowers + uppers) / 2, uppers])
+        else:
+            raise ValueError(f"no fit within {tolerance_km} km after {max_refinements} refinements")
+
+        lowers, uppers = np.concatenate(done_lowers), np.concatenate(done_uppers)
+        order = np.argsort(lowers)
+        boundaries = np.append(lowers[order], uppers[order][-1])
+        return cls(start, boundaries, np.concatenate(done_coefficients)[order], max_error)
+
+    @classmethod
+    def from_elements(cls, elements, start, duration_seconds, segment_seconds=None, **kwargs):
+        """Fits SGP4 positions of a TLE column record, by default with SEGMENTS_PER_ORBIT segments per revolution"""
+        satrec = satrec_from_elements(elements)
+        start = np.datetime64(start, "us")
+        if segment_seconds is None:
+            period_seconds = 2 * np.pi / float(elements["mean_motion"]) * 60  # mean motion in radians per minute
+            segment_seconds = period_seconds / SEGMENTS_PER_ORBIT
+
+        def propagate(seconds):
+            errors, positions, _ = satrec.sgp4_array(*julian_dates(start + (seconds * 1e6).astype("m8[us]")))
+            positions[errors != 0] = np.nan
+            return positions
+
+        return cls.fit(propagate, start, duration_seconds, segment_seconds, **kwargs)
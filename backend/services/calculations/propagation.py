@@ -0,0 +1,188 @@
+"""Batched SGP4 propagation of the stored catalog.
+A CatalogPropagator holds one sgp4 SatrecArray built from the latest elements, and propagates N satellites at
+M times in a single vectorized call into contiguous TEME arrays. get_catalog_propagator() keeps one per catalog
+version, so the Satrecs are only rebuilt when ingest changes the catalog.
+propagate_sharded spreads the satellites over worker processes writing into memory-mapped output files, for
+results larger than memory and for using every core."""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS72
+
+from config import DIRS
+from backend.services.calculations.earth_orientation import julian_dates
+from backend.services.database.catalog import get_latest_catalog
+from backend.services.metrics import instrument
+
+STATES_DIR = os.path.join(DIRS["cache"], "states")
+SHARDS_PER_WORKER = 4
+SGP4_EPOCH = np.datetime64("1949-12-31T00:00:00", "us")
+# sgp4 error codes, 0 is success
+SGP4_ERRORS = {
+    1: "mean eccentricity out of range",
+    2: "mean motion below zero",
+    3: "perturbed eccentricity out of range",
+    4: "semi-latus rectum below zero",
+    6: "satellite has decayed",
+}
+
+
+def satrec_from_elements(elements):
+    """Builds an sgp4 Satrec from a TLE column record (a dict or TLE_DTYPE row), without going through TLE text"""
+    epoch = np.datetime64(elements["epoch"], "us")
+    satrec = Satrec()
+    satrec.sgp4init(
+        WGS72, "i", int(elements["satellite_number"]),
+        float((epoch - SGP4_EPOCH) / np.timedelta64(1, "D")),
+        float(elements["bstar"]), float(elements["mean_motion_dot"]), float(elements["mean_motion_ddot"]),
+        float(elements["eccentricity"]), float(elements["argument_of_perigee"]), float(elements["inclination"]),
+        float(elements["mean_anomaly"]), float(elements["mean_motion"]), float(elements["right_ascension"]),
+    )
+    return satrec
+
+
+def mask_failed(errors, positions, velocities):
+    """Sets the states sgp4 reported an error for to NaN, it still returns a position for e.g. decayed satellites"""
+    failed = errors != 0
+    if failed.any():
+        positions[failed] = np.nan
+        velocities[failed] = np.nan
+
+
+def time_grid(start, step_seconds, count):
+    """count datetime64[us] times from start, step_seconds apart"""
+    return np.datetime64(start, "us") + (np.arange(count) * step_seconds * 1e6).astype("m8[us]")
+
+
+class StateVectors:
+    """TEME states of N satellites at M times: positions and velocities (N, M, 3) in km and km/s, and the sgp4
+    error codes (N, M). States with a nonzero code are NaN, see mask_failed."""
+
+    def __init__(self, satellite_numbers, times, positions, velocities, errors):
+        self.satellite_numbers = satellite_numbers
+        self.times = times
+        self.positions = positions
+        self.velocities = velocities
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.satellite_numbers)
+
+
+class CatalogPropagator:
+    """SatrecArray of a TLE_DTYPE array of elements, in satellite number order"""
+
+    def __init__(self, elements, version=None):
+        self.version = version
+        order = np.argsort(elements["satellite_number"], kind="stable")
+        self.elements = elements[order]
+        self.satellite_numbers = self.elements["satellite_number"]
+        self.satrecs = [satrec_from_elements(record) for record in self.elements]
+        self.satrec_array = SatrecArray(self.satrecs)
+
+    def __len__(self):
+        return len(self.satellite_numbers)
+
+    @instrument("propagate")
+    def propagate(self, times, satellite_numbers=None):
+        """StateVectors of the given satellites (all by default, unknown ones are left out) at datetime64 times"""
+        times = np.atleast_1d(np.asarray(times, dtype="M8[us]"))
+        jd, fr = julian_dates(times)
+        if satellite_numbers is None:
+            errors, positions, velocities = self.satrec_array.sgp4(jd, fr)
+            mask_failed(errors, positions, velocities)
+            return StateVectors(self.satellite_numbers, times, positions, velocities, errors)
+        rows = self._rows(np.asarray(satellite_numbers))
+        errors, positions, velocities = SatrecArray([self.satrecs[row] for row in rows]).sgp4(jd, fr)
+        mask_failed(errors, positions, velocities)
+        return StateVectors(self.satellite_numbers[rows], times, positions, velocities, errors)
+
+    @instrument("propagate")
+    def propagate_sharded(self, times, satellite_numbers=None, workers=None, out_dir=None, shard_size=None):
+        """Same StateVectors as propagate, computed by a pool of worker processes for catalogs and horizons whose
+        result does not fit in memory. Each worker propagates shards of satellites with its own SatrecArray
+        straight into memory-mapped output files, so nothing is pickled back and the arrays of the result are
+        zero-copy views of those files. The files are kept in out_dir as positions.npy, velocities.npy and
+        errors.npy when it is given, otherwise they are temporary and deleted once no view refers to them."""
+        times = np.atleast_1d(np.asarray(times, dtype="M8[us]"))
+        rows = np.arange(len(self)) if satellite_numbers is None else self._rows(np.asarray(satellite_numbers))
+        if not len(rows) or not len(times):
+            return self.propagate(times, satellite_numbers)  # nothing to map
+        workers = workers or os.cpu_count() or 1
+        # A few shards per worker so a slow shard does not leave the other workers idle
+        shard_size = shard_size or max(1, -(-len(rows) // (workers * SHARDS_PER_WORKER)))
+        shards = [(start, min(start + shard_size, len(rows))) for start in range(0, len(rows), shard_size)]
+
+        temporary = out_dir is None
+        if temporary:
+            os.makedirs(STATES_DIR, exist_ok=True)
+            out_dir = tempfile.mkdtemp(dir=STATES_DIR)
+        else:
+            os.makedirs(out_dir, exist_ok=True)
+        paths = {name: os.path.join(out_dir, f"{name}.npy") for name in ("errors", "positions", "velocities")}
+        shapes = {"errors": (len(rows), len(times)), "positions": (len(rows), len(times), 3), "velocities": (len(rows), len(times), 3)}
+        outputs = {
+            name: np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8 if name == "errors" else np.float64, shape=shapes[name])
+            for name, path in paths.items()
+        }
+        global shard_task
+        try:
+            with shard_lock:
+                shard_task = (self.satrecs, rows, julian_dates(times), paths)
+                try:
+                    # Forked workers inherit the Satrecs and the times instead of receiving them pickled
+                    with multiprocessing.get_context("fork").Pool(min(workers, len(shards))) as pool:
+                        for _ in pool.imap_unordered(propagate_shard, shards):
+                            pass
+                finally:
+                    shard_task = None  # do not keep the catalog alive after a failed run either
+        finally:
+            if temporary:
+                # The maps stay valid after the files are unlinked, the space is freed with the last view
+                shutil.rmtree(out_dir)
+        return StateVectors(self.satellite_numbers[rows], times, outputs["positions"], outputs["velocities"], outputs["errors"])
+
+    def _rows(self, satellite_numbers):
+        """Rows of the known satellites among satellite_numbers"""
+        if not len(self):
+            return np.zeros(0, dtype=np.intp)
+        rows = np.searchsorted(self.satellite_numbers, satellite_numbers).clip(max=len(self) - 1)
+        return rows[self.satellite_numbers[rows] == satellite_numbers]
+
+
+# (satrecs, rows, (jd, fr), output paths) of the propagate_sharded call in progress, inherited by its workers
+shard_task = None
+shard_lock = threading.Lock()
+
+
+def propagate_shard(shard):
+    """Worker: propagates rows[start:stop] into the same rows of the memory-mapped outputs"""
+    satrecs, rows, (jd, fr), paths = shard_task
+    start, stop = shard
+    outputs = {name: np.load(path, mmap_mode="r+") for name, path in paths.items()}
+    errors, positions, velocities = (outputs[name][start:stop] for name in ("errors", "positions", "velocities"))
+    # SatrecArray.sgp4 without its allocation: the C++ loop writes into the contiguous slices of the maps.
+    # _sgp4(jd, fr, errors, positions, velocities) is private sgp4 API, checked against sgp4 2.27 and pinned by
+    # test_private_satrec_array_sgp4, re-check it when upgrading sgp4.
+    SatrecArray([satrecs[row] for row in rows[start:stop]])._sgp4(jd, fr, errors, positions, velocities)
+    mask_failed(errors, positions, velocities)
+    for output in outputs.values():
+        output.flush()
+
+
+propagator = None
+propagator_lock = threading.Lock()
+
+
+def get_catalog_propagator(session=None):
+    """CatalogPropagator of the latest catalog, rebuilt when the catalog version changed"""
+    global propagator
+    snapshot = get_latest_catalog(session)
+    with propagator_lock:
+        if propagator is None or propagator.version != snapshot.version:
+            propagator = CatalogPropagator(snapshot.data, snapshot.version)
+        return propagator
@@ -1,13 +1,12 @@
 from functools import wraps
-from time import time
+from time import perf_counter
 
 def timeit(f):
+    """Prints the duration of each call, for scripts. Services record spans instead, see backend/services/metrics.py"""
     @wraps(f)
     def wrap(*args, **kw):
-        ts = time()
+        ts = perf_counter()
         result = f(*args, **kw)
-        te = time()
-        print('func:%r args:[%r, %r] took: %2.4f sec' % \
-          (f.__name__, args, kw, te-ts))
+        print('func:%r took: %2.4f sec' % (f.__name__, perf_counter() - ts))
         return result
-    return wrap
\ No newline at end of file
+    return wrap
@@ -0,0 +1,91 @@
+"""Visibility intervals (passes) of a satellite over a ground station, propagated with SGP4.
+A numpy version of the visibility_intervals3.py pipeline that runs from stored elements, e.g. as a background job:
+sample the elevation on a grid, bracket the min_elevation crossings and refine them with boundary.find_crossing.
+The refinement evaluates one time per iteration, from a Chebyshev fit of the window instead of SGP4."""
+import numpy as np
+
+from backend.services.calculations.boundary import find_crossing, find_crossing_bound_indices
+from backend.services.calculations.earth_orientation import EarthOrientation
+from backend.services.calculations.ephemeris_cache import get_ephemeris_cache
+from backend.services.calculations.interpolation import ChebyshevEphemeris
+from backend.services.calculations.propagation import julian_dates, satrec_from_elements
+from backend.services.metrics import instrument, span
+
+WGS84_A = 6378.137  # km
+WGS84_F = 1 / 298.257223563
+
+
+def geodetic_to_ecef(latitude_deg, longitude_deg, altitude_km):
+    """WGS84 station position in km and its local up unit vector"""
+    lat, lon = np.radians(latitude_deg), np.radians(longitude_deg)
+    e2 = WGS84_F * (2 - WGS84_F)
+    n = WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    position = np.array([
+        (n + altitude_km) * np.cos(lat) * np.cos(lon),
+        (n + altitude_km) * np.cos(lat) * np.sin(lon),
+        (n * (1 - e2) + altitude_km) * np.sin(lat),
+    ])
+    up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    return position, up
+
+
+@instrument("propagate")
+def elevations(satrec, times, station, up):
+    """Elevation angles in degrees of the satellite seen from the station at datetime64 times"""
+    _, r, _ = satrec.sgp4_array(*julian_dates(times))
+    return topocentric_elevations(r, times, station, up)
+
+
+def topocentric_elevations(r, times, station, up):
+    """Elevation angles in degrees of TEME positions (n, 3) at the datetime64 times (n,)"""
+    rho = EarthOrientation(times, "gmst").to_earth_fixed(r) - station
+    return np.degrees(np.arcsin(rho @ up / np.linalg.norm(rho, axis=1)))
+
+
+def visibility_intervals(elements, latitude, longitude, altitude_km=0.0, start=None, duration_hours=24.0,
+                         step_seconds=60.0, min_elevation_deg=10.0):
+    """Passes above min_elevation_deg within [start, start + duration_hours] as a JSON ready dict.
+    step_seconds must be shorter than the shortest pass of interest, crossings are refined to ~1 ms."""
+    satrec = satrec_from_elements(elements)
+    station, up = geodetic_to_ecef(latitude, longitude, altitude_km)
+    start = np.datetime64(start or np.datetime64("now"), "us")
+    offsets = np.arange(0.0, duration_hours * 3600.0 + step_seconds, step_seconds)  # seconds from start
+
+    def at(seconds):
+        return start + (np.atleast_1d(seconds) * 1e6).astype("m8[us]")
+
+    # The sampled grid is the expensive part of repeated runs over the same window, it comes from the cache
+    grid = get_ephemeris_cache().propagate(elements, start, step_seconds, len(offsets))
+    values = topocentric_elevations(grid.positions[0], grid.times, station, up) - min_elevation_deg
+    brackets = find_crossing_bound_indices(values)
+    ephemeris = None
+    if brackets:
+        try:
+            # Sub-metre error, well below the ~1 ms (7 m) the crossings are refined to
+            ephemeris = ChebyshevEphemeris.from_elements(elements, start, offsets[-1])
+        except ValueError:
+            pass  # SGP4 fails within the window, e.g. the satellite decays, the refinement falls back to it
+
+    def above(seconds, desired_val):
+        if ephemeris is None:
+            return elevations(satrec, at(seconds), station, up)[0] - desired_val
+        return topocentric_elevations(ephemeris.position(float(seconds))[None], at(seconds), station, up)[0] - desired_val
+
+    with span("root_find"):
+        crossings = [
+            find_crossing(above, min_elevation_deg, offsets[i], offsets[j])
+            for i, j in brackets
+        ]
+    # Passes already in progress at the start or still in progress at the end are cut at the window
+    bounds = ([0.0] if values[0] >= 0 else []) + crossings + ([offsets[-1]] if values[-1] >= 0 else [])
+
+    passes = []
+    for rise, set_ in zip(bounds[::2], bounds[1::2]):
+        # Sampled peak, a pass shorter than one step peaks at about min_elevation_deg
+        peak = values[(offsets > rise) & (offsets < set_)].max(initial=0.0)
+        passes.append({
+            "rise": str(at(rise)[0]),
+            "set": str(at(set_)[0]),
+            "max_elevation_deg": float(peak + min_elevation_deg),
+        })
+    return {"satellite_number": int(elements["satellite_number"]), "passes": passes}
@@ -1,11 +1,19 @@
+import argparse
 import os
-import requests
 from config import DIRS
 from backend.services.database.database_operations import insert_tle
+from backend.services.database.database_utils import initialize_database
+from backend.services.data_fetching.fetcher import ValidatorStore, fetch_and_ingest, fetch_sources
+from backend.services.data_fetching.pipeline import ingest_groups
+from backend.services.calculations.ephemeris_cache import get_ephemeris_cache
+from backend.services.database.archive import enable_archive_sync
 
 DATA_DIR = DIRS["data"]
+VALIDATORS_PATH = os.path.join(DIRS["tles"], "validators.json")
 
-CELESTRAK_URL = "https://celestrak.org/NORAD/elements/gp.php?GROUP={}&FORMAT=tle"
+CELESTRAK_URL = "https://celestrak.org/NORAD/elements/gp.php?GROUP={}&FORMAT={}"
+# Celestrak FORMAT -> file extension
+FORMATS = {"tle": "txt", "json": "json", "csv": "csv"}
 
 GROUPS = [
     "last-30-days", "stations", "visual", "active", "analyst","1982-092", "1999-025", "iridium-33-debris", "cosmos-2251-debris", "weather", "noaa",
@@ -17,33 +25,90 @@ GROUPS = [
     "engineering", "education", "military", "radar", "cubesat", "other",
 ]
 
-def get_tle_source(group):
-    """Returns the URL and filepath for a given Celestrak group."""
-    return CELESTRAK_URL.format(group), os.path.join(DATA_DIR, 'tles', f"{group}.txt")
+def get_tle_source(group, fmt="tle"):
+    """Returns the URL and filepath for a given Celestrak group and format (tle, json or csv)."""
+    return CELESTRAK_URL.format(group, fmt), os.path.join(DATA_DIR, 'tles', f"{group}.{FORMATS[fmt]}")
 
-def get_tles(groups=GROUPS, update=True, add_to_database=True):
+def get_tles(groups=GROUPS, update=True, add_to_database=True, max_workers=8, fmt="tle"):
     """Gets the TLEs from Celestrak and saves them to the data/tles directory.
-        Also adds them to the database if add_to_database is True."""
-    for group in groups:
-
-        url, filepath = get_tle_source(group)
-
-        if not update and os.path.exists(filepath):
-            print(f"File exists: {group}")
-            continue
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(response.text)
-            print(f"Succeeded: {group}")
-            if add_to_database:
-                print("\tAdding to database...")
-                insert_tle(filepath, group=group)
-                print("\tDone adding to database.")
+        Also adds them to the database if add_to_database is True.
+        Groups are downloaded concurrently and only when they changed since the last download,
+        finished groups are added to the database while the others are still downloading."""
+    sources = [(group, *get_tle_source(group, fmt)) for group in groups]
+    validators = ValidatorStore(VALIDATORS_PATH)
+
+    def ingest(filepath, group):
+        print(f"\tAdding {group} to database...")
+        result = insert_tle(filepath, group=group, bulk=True, sync_group=True)
+        added, removed = (len(result.group_sync.added), len(result.group_sync.removed)) if result.group_sync else (0, 0)
+        print(f"\t{group}: {result.inserted} new TLEs, {len(result.errors)} bad records, {added} satellites added, {removed} removed")
+
+    if add_to_database:
+        results = fetch_and_ingest(sources, ingest, validators=validators, update=update, max_workers=max_workers)
+    else:
+        results = list(fetch_sources(sources, validators=validators, update=update, max_workers=max_workers))
+
+    for result in results:
+        print_fetch_result(result)
+    return results
+
+def print_fetch_result(result):
+    if result.status == "updated":
+        print(f"Succeeded: {result.group}")
+    elif result.status == "not_modified":
+        print(f"Not modified: {result.group}")
+    elif result.status == "skipped":
+        print(f"File exists: {result.group}")
+    else:
+        print(f"Failed: {result.group} ({result.error})")
+
+
+def get_tles_parallel(groups=GROUPS, update=True, max_workers=8, processes=None, fmt="tle", archive=False):
+    """Like get_tles, but updated groups are parsed in a process pool and written by a single writer process.
+    Parsing starts as soon as a download finishes."""
+    sources = [(group, *get_tle_source(group, fmt)) for group in groups]
+    validators = ValidatorStore(VALIDATORS_PATH)
+    downloads = fetch_sources(sources, validators=validators, update=update, max_workers=max_workers)
+
+    def updated():
+        for result in downloads:
+            print_fetch_result(result)
+            if result.status == "updated":
+                yield result.group, result.filepath
+
+    summaries = ingest_groups(updated(), processes=processes, archive=archive)
+    urls = {group: url for group, url, _ in sources}
+    for summary in summaries:
+        if "error" in summary:
+            validators.forget(urls[summary["group"]])  # downloaded again by the next run
+            print(f"Failed to ingest: {summary['group']} ({summary['error']})")
         else:
-            print(f"Failed: {group}")
+            print(f"Ingested: {summary['group']} {summary['inserted']}/{summary['records']} new TLEs, {summary['errors']} bad records, "
+                  f"{summary['added']} satellites added, {summary['removed']} removed")
+    return summaries
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Downloads Celestrak element sets and adds them to the database.")
+    parser.add_argument("groups", nargs="*", default=GROUPS, help="Celestrak groups, all known groups by default")
+    parser.add_argument("--format", dest="fmt", choices=sorted(FORMATS), default="tle")
+    parser.add_argument("--no-update", dest="update", action="store_false", help="skip groups that were already downloaded")
+    parser.add_argument("--no-database", dest="add_to_database", action="store_false", help="only download the files")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--parallel", action="store_true", help="parse in a process pool with a single writer process")
+    parser.add_argument("--processes", type=int, default=None, help="parser processes for --parallel, all cores by default")
+    parser.add_argument("--archive", action="store_true", help="keep the columnar element archive in data/cache in sync")
+    args = parser.parse_args(argv)
 
+    if args.add_to_database:
+        initialize_database()
+        get_ephemeris_cache()  # drops cached ephemerides of satellites that get a newer TLE
+    if args.archive:
+        enable_archive_sync()
 
+    if args.parallel and args.add_to_database:
+        get_tles_parallel(args.groups, update=args.update, max_workers=args.workers, processes=args.processes, fmt=args.fmt, archive=args.archive)
+    else:
+        get_tles(args.groups, update=args.update, add_to_database=args.add_to_database, max_workers=args.workers, fmt=args.fmt)
 
 if __name__ == "__main__":
-    get_tles(update=True, add_to_database=True)
+    main()
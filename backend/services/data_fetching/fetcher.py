@@ -0,0 +1,142 @@
+"""Concurrent download engine for element sets.
+Downloads run on a bounded thread pool sharing one keep-alive session, with conditional GETs
+(ETag/Last-Modified) so unchanged groups are not downloaded again, and retry with backoff."""
+import json
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 60)  # (connect, read) seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# status is one of "updated", "not_modified", "skipped", "failed" or "ingest_failed"
+FetchResult = namedtuple("FetchResult", ["group", "filepath", "status", "error", "url"], defaults=(None,))
+
+
+class ValidatorStore:
+    """ETag and Last-Modified values of previous downloads, persisted as JSON and keyed by URL."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._validators = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._validators = {}
+
+    def headers(self, url):
+        """Conditional request headers for url"""
+        validators = self._validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def update(self, url, response):
+        validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        with self._lock:
+            if any(validators.values()):
+                self._validators[url] = validators
+            else:
+                self._validators.pop(url, None)
+            self._save()
+
+    def forget(self, url):
+        """Drops the validators of url, e.g. when its download could not be ingested, so the next run downloads it again"""
+        with self._lock:
+            if self._validators.pop(url, None) is not None:
+                self._save()
+
+    def _save(self):
+        _atomic_write(self.path, json.dumps(self._validators, indent=2, sort_keys=True))
+
+
+def make_session(pool_size=8, retries=3, backoff_factor=0.5):
+    """A pooled keep-alive session which retries connection errors and transient HTTP errors with exponential backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_source(session, group, url, filepath, validators=None, timeout=DEFAULT_TIMEOUT):
+    """Downloads url to filepath unless the server reports it unchanged"""
+    headers = validators.headers(url) if validators is not None and os.path.exists(filepath) else {}
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        return FetchResult(group, filepath, "failed", str(e), url)
+
+    if response.status_code == 304:
+        return FetchResult(group, filepath, "not_modified", None, url)
+    if response.status_code != 200:
+        return FetchResult(group, filepath, "failed", f"HTTP {response.status_code}", url)
+
+    _atomic_write(filepath, response.text)
+    if validators is not None:
+        validators.update(url, response)
+    return FetchResult(group, filepath, "updated", None, url)
+
+
+def fetch_sources(sources, validators=None, update=True, max_workers=8, session=None, timeout=DEFAULT_TIMEOUT):
+    """Downloads (group, url, filepath) sources concurrently.
+    This is a generator yielding a FetchResult as each download finishes, so the caller can
+    process finished groups while the remaining downloads are still in flight."""
+    own_session = session is None
+    session = make_session(pool_size=max_workers) if own_session else session
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for group, url, filepath in sources:
+                if not update and os.path.exists(filepath):
+                    yield FetchResult(group, filepath, "skipped", None, url)
+                    continue
+                futures.append(executor.submit(fetch_source, session, group, url, filepath, validators, timeout))
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        if own_session:
+            session.close()
+
+
+def fetch_and_ingest(sources, ingest, validators=None, update=True, max_workers=8, session=None, timeout=DEFAULT_TIMEOUT):
+    """Pipeline which ingests each updated group with ingest(filepath, group) while other downloads continue.
+    Ingest runs on the calling thread so database writes stay serialized. Returns the list of FetchResults.
+    A group that fails to ingest loses its validators, so the next run downloads and ingests it again."""
+    results = []
+    for result in fetch_sources(sources, validators, update, max_workers, session, timeout):
+        if result.status == "updated":
+            try:
+                ingest(result.filepath, result.group)
+            except Exception as e:
+                result = result._replace(status="ingest_failed", error=str(e))
+                if validators is not None:
+                    validators.forget(result.url)
+        results.append(result)
+    return results
+
+
+def _atomic_write(path, content):
+    """Writes to a temporary file first so readers never see a partially written file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
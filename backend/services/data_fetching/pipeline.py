@@ -0,0 +1,104 @@
+"""Multi-process parse and ingest pipeline for element files.
+A process pool parses and validates group files in parallel and hands compact columnar TLEBatches
+to a single writer process, which serializes the database writes and dedupes TLEs shared by groups."""
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from config import DB_URI
+from backend.models.omm import read_element_file
+from backend.models.tle_batch import TLEBatch
+from backend.services.database.database_utils import initialize_database
+from backend.services.database.database_operations import bulk_insert_tle, run_ingest_hooks, sync_group_membership
+from backend.services.calculations.ephemeris_cache import get_ephemeris_cache
+from backend.services.database.archive import enable_archive_sync
+
+QUEUE_SIZE = 8  # batches waiting for the writer, bounds the memory used by parsed groups
+
+
+def parse_group(group, filepath):
+    """Runs in a pool process, only the structured array and the errors are sent back"""
+    return group, read_element_file(filepath)
+
+
+def writer_main(batches, summaries, db_uri, archive=False):
+    """Single writer process. Consumes (group, TLEBatch) items until None and reports one summary dict per group."""
+    if archive:
+        enable_archive_sync()
+    get_ephemeris_cache()  # drops cached ephemerides of satellites that get a newer TLE
+    engine = initialize_database(db_uri)
+    seen = set()
+    with sessionmaker(bind=engine)() as session:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            group, batch = item
+            summary = {"group": group, "records": len(batch), "errors": len(batch.errors), "inserted": 0}
+            try:
+                # TLEs already written for an earlier group in this run are not sent to the database again
+                keys = zip(batch["satellite_number"].tolist(), batch["epoch"].astype(np.int64).tolist())
+                new = np.fromiter((key not in seen for key in keys), dtype=bool, count=len(batch))
+                new_batch = TLEBatch(batch.data[new]).unique()
+
+                summary["inserted"] = bulk_insert_tle(new_batch, session=session).inserted
+                result = sync_group_membership(group, batch.satellite_numbers.tolist(), session=session)
+                session.commit()
+                # Only once committed, a group whose write is rolled back must not hide its TLEs from later groups
+                seen.update(zip(new_batch["satellite_number"].tolist(), new_batch["epoch"].astype(np.int64).tolist()))
+                if result.added or result.removed:
+                    run_ingest_hooks(session)
+                summary.update(added=len(result.added), removed=len(result.removed))
+            except Exception as e:
+                session.rollback()
+                summary["error"] = str(e)
+            summaries.put(summary)
+    engine.dispose()
+
+
+def ingest_groups(sources, processes=None, db_uri=DB_URI, archive=False):
+    """Parses (group, filepath) sources in a process pool and ingests them through one writer process.
+    sources may be a generator, e.g. of downloads as they finish: each source is parsed as soon as it arrives
+    and handed to the writer as soon as it is parsed. With archive the writer keeps the element archive in sync.
+    Returns the per group summaries in completion order."""
+    context = multiprocessing.get_context()
+    batches = context.Queue(maxsize=QUEUE_SIZE)
+    summaries = context.Queue()
+    writer = context.Process(target=writer_main, args=(batches, summaries, db_uri, archive), name="tle-writer")
+    writer.start()
+
+    parse_failures = []
+    sent = 0
+
+    def hand_over(future):
+        nonlocal sent
+        group = pending.pop(future)
+        try:
+            batches.put(future.result())
+            sent += 1
+        except Exception as e:
+            parse_failures.append({"group": group, "error": str(e)})
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            pending = {}
+            for group, filepath in sources:
+                pending[executor.submit(parse_group, group, filepath)] = group
+                for future in [f for f in pending if f.done()]:
+                    hand_over(future)
+            for future in as_completed(list(pending)):
+                hand_over(future)
+    finally:
+        batches.put(None)
+        results = []
+        while len(results) < sent:
+            try:
+                results.append(summaries.get(timeout=1))
+            except queue.Empty:
+                if not writer.is_alive():
+                    raise RuntimeError("The writer process exited before ingesting every group")
+        writer.join()
+    return parse_failures + results
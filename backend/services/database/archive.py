@@ -0,0 +1,245 @@
+"""Columnar, memory-mapped archive of the element history in the tles table.
+Rows are stored as NumPy .npy files under data/cache/elements, partitioned by satellite number bucket and epoch
+year, and sorted by (satellite_number, epoch) so one satellite's history is a contiguous slice of a memory map.
+The archive is kept in sync incrementally by exporting the tles rows above a watermark id."""
+import argparse
+import glob
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from config import DIRS
+from backend.models.models import TLE
+from backend.models.tle_batch import TLEBatch, TLE_DTYPE
+from backend.services.database.database_operations import bulk_insert_tle, register_ingest_hook
+from backend.services.database.database_utils import initialize_database, with_session
+
+ARCHIVE_DIR = os.path.join(DIRS["cache"], "elements")
+SATELLITE_BUCKET = 1000  # satellite numbers per partition directory
+EXPORT_CHUNK_SIZE = 1_000_000
+UNIX_EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# The TLE columns plus the database id, with strings stored as (utf-8) bytes to keep rows compact
+ARCHIVE_DTYPE = np.dtype([("id", "i8")] + [
+    (name, f"S{dtype.itemsize // 4}" if dtype.kind == "U" else dtype)
+    for name, (dtype, _) in TLE_DTYPE.fields.items()
+])
+TLE_COLUMNS = [TLE.__table__.c.id] + [TLE.__table__.c[name] for name in TLE_DTYPE.names]
+
+
+class ElementArchive:
+    """Reader and incremental exporter of one archive directory"""
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+
+    # Export
+    @property
+    def manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"watermark": 0, "rows": 0}
+
+    def sync(self, session, chunk_size=EXPORT_CHUNK_SIZE):
+        """Appends the tles rows added since the last sync, returns the number of exported rows"""
+        manifest = self.manifest
+        exported = 0
+        while True:
+            rows = session.execute(
+                select(*TLE_COLUMNS).where(TLE.id > manifest["watermark"]).order_by(TLE.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            self._append(rows_to_array(rows))
+            manifest["watermark"] = rows[-1][0]
+            manifest["rows"] += len(rows)
+            exported += len(rows)
+            self._save_manifest(manifest)
+            if len(rows) < chunk_size:
+                break
+        return exported
+
+    def rebuild(self, session, chunk_size=EXPORT_CHUNK_SIZE):
+        """Exports the whole tles table from scratch"""
+        for path in self._partition_paths():
+            os.remove(path)
+        self._save_manifest({"watermark": 0, "rows": 0})
+        return self.sync(session, chunk_size)
+
+    def _append(self, rows):
+        buckets = rows["satellite_number"] // SATELLITE_BUCKET
+        years = rows["epoch"].astype("M8[Y]").astype(np.int64) + 1970
+        keys = buckets * 10000 + years
+        for key in np.unique(keys):
+            path = self._partition_path(key // 10000, key % 10000)
+            partition = rows[keys == key]
+            if os.path.exists(path):
+                partition = np.concatenate([np.load(path), partition])
+            order = np.lexsort((partition["id"], partition["epoch"], partition["satellite_number"]))
+            partition = partition[order]
+            # Rows are immutable, so a repeated (satellite_number, epoch) can only come from a re-export
+            keep = np.ones(len(partition), dtype=bool)
+            keep[1:] = (partition["satellite_number"][1:] != partition["satellite_number"][:-1]) | (partition["epoch"][1:] != partition["epoch"][:-1])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.npy"
+            np.save(tmp_path, partition[keep])
+            os.replace(tmp_path, path)
+
+    def _save_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # Reads
+    def iter_partitions(self, min_satellite_number=0, max_satellite_number=None, start=None, end=None):
+        """Yields read-only memory mapped slices of the partitions covering the satellite number and epoch range.
+        Slices are views into the memory maps, except when an epoch range is given for several satellites."""
+        start = None if start is None else np.datetime64(start, "us")
+        end = None if end is None else np.datetime64(end, "us")
+        for path in self._partition_paths():
+            bucket, year = self._partition_key(path)
+            if bucket < min_satellite_number // SATELLITE_BUCKET:
+                continue
+            if max_satellite_number is not None and bucket > max_satellite_number // SATELLITE_BUCKET:
+                continue
+            if (start is not None and year < start.astype("M8[Y]").astype(np.int64) + 1970) or \
+                    (end is not None and year > end.astype("M8[Y]").astype(np.int64) + 1970):
+                continue
+            partition = np.load(path, mmap_mode="r")
+            sat_nums = partition["satellite_number"]
+            lo = np.searchsorted(sat_nums, min_satellite_number, side="left")
+            hi = len(partition) if max_satellite_number is None else np.searchsorted(sat_nums, max_satellite_number, side="right")
+            rows = partition[lo:hi]
+            if start is not None or end is not None:
+                if min_satellite_number != max_satellite_number:
+                    # Several satellites, epochs are only sorted within each satellite
+                    epochs = rows["epoch"]
+                    mask = np.ones(len(rows), dtype=bool)
+                    if start is not None:
+                        mask &= epochs >= start
+                    if end is not None:
+                        mask &= epochs <= end
+                    rows = rows[mask]
+                else:
+                    epochs = rows["epoch"]
+                    lo = 0 if start is None else np.searchsorted(epochs, start, side="left")
+                    hi = len(rows) if end is None else np.searchsorted(epochs, end, side="right")
+                    rows = rows[lo:hi]
+            if len(rows):
+                yield rows
+
+    def history(self, satellite_number, start=None, end=None):
+        """Element history of one satellite sorted by epoch.
+        A view into the memory map when it lives in one partition, otherwise the partitions are concatenated."""
+        return self.range(satellite_number, satellite_number, start, end)
+
+    def range(self, min_satellite_number, max_satellite_number, start=None, end=None):
+        """Element history of a range of satellites, sorted by satellite_number then epoch"""
+        parts = list(self.iter_partitions(min_satellite_number, max_satellite_number, start, end))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.empty(0, dtype=ARCHIVE_DTYPE)
+        rows = np.concatenate(parts)
+        return rows[np.lexsort((rows["epoch"], rows["satellite_number"]))]
+
+    # Import
+    def to_batches(self, **kwargs):
+        """Yields the archive as TLEBatches, e.g. to load it into another database with bulk_insert_tle"""
+        for rows in self.iter_partitions(**kwargs):
+            yield TLEBatch(array_to_tle_data(rows))
+
+    def _partition_path(self, bucket, year):
+        return os.path.join(self.root, f"sat_{int(bucket):04d}", f"{int(year)}.npy")
+
+    @staticmethod
+    def _partition_key(path):
+        bucket = int(os.path.basename(os.path.dirname(path))[4:])
+        year = int(os.path.splitext(os.path.basename(path))[0])
+        return bucket, year
+
+    def _partition_paths(self):
+        return sorted(path for path in glob.glob(os.path.join(self.root, "sat_*", "*.npy")) if not path.endswith(".tmp.npy"))
+
+
+def rows_to_array(rows):
+    """Converts (id, *TLE columns) result rows to an ARCHIVE_DTYPE array"""
+    columns = list(zip(*rows))
+    array = np.empty(len(rows), dtype=ARCHIVE_DTYPE)
+    for name, values in zip(ARCHIVE_DTYPE.names, columns):
+        array[name] = column_array(values, ARCHIVE_DTYPE[name])
+    return array
+
+
+def column_array(values, dtype):
+    """Converts one column of result values to an array of an ARCHIVE_DTYPE field type, None becomes 0 or empty"""
+    has_none = None in values
+    if dtype.kind == "S":
+        return np.asarray(string_column(values, dtype.itemsize, has_none), dtype=dtype)
+    if dtype.kind in "if":
+        return np.array([0 if value is None else value for value in values] if has_none else values, dtype=dtype)
+    if values and isinstance(values[0], str):
+        # Raw SQLite timestamps, NumPy parses them in C
+        return np.array(values, dtype="M8[us]")
+    # Much faster than letting NumPy convert datetime objects
+    return np.array([(value - UNIX_EPOCH) // MICROSECOND for value in values], dtype=np.int64).view("M8[us]")
+
+
+def string_column(values, size, has_none=True):
+    """Encodes a column of strings to utf-8 bytes of at most size bytes, None becomes empty"""
+    if not has_none:
+        try:
+            return np.array(values, dtype=f"U{size}").astype(f"S{size}")  # ASCII, encoded in C
+        except UnicodeEncodeError:
+            pass
+    return [(value or "").encode("utf-8")[:size] for value in values]
+
+
+def array_to_tle_data(rows):
+    """Converts ARCHIVE_DTYPE rows back to a TLE_DTYPE array"""
+    data = np.empty(len(rows), dtype=TLE_DTYPE)
+    for name in TLE_DTYPE.names:
+        if rows.dtype[name].kind != "S":
+            data[name] = rows[name]
+            continue
+        try:
+            data[name] = rows[name].astype(TLE_DTYPE[name])  # ASCII, decoded in C
+        except UnicodeDecodeError:
+            data[name] = np.char.decode(rows[name], "utf-8", "replace")
+    return data
+
+
+def enable_archive_sync(root=ARCHIVE_DIR):
+    """Keeps the archive in sync with every insert_tle/bulk_insert_tle in this process"""
+    archive = ElementArchive(root)
+    register_ingest_hook(archive.sync)
+    return archive
+
+
+@with_session
+def main(argv=None, session=None):
+    parser = argparse.ArgumentParser(description="Exports the tles table to the columnar element archive.")
+    parser.add_argument("command", choices=["sync", "rebuild", "load"], help="load imports the archive into the database")
+    parser.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+    archive = ElementArchive(args.root)
+    if args.command == "load":
+        initialize_database()
+        inserted = sum(bulk_insert_tle(batch, session=session).inserted for batch in archive.to_batches())
+        print(f"Loaded {inserted} new TLEs from {args.root}")
+    else:
+        exported = archive.sync(session) if args.command == "sync" else archive.rebuild(session)
+        print(f"Exported {exported} TLEs to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
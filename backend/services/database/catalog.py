@@ -0,0 +1,163 @@
+"""Process-wide snapshot of the latest TLE of every satellite, held as a structured array sorted by satellite number.
+The catalog version is the highest tles.id: every insert_tle/bulk_insert_tle that stores a TLE moves it, and a
+satellite whose latest TLE changed points at an id above the previous version. So a refresh only loads those rows.
+Group membership changes do not store TLEs, they bump the group_membership VersionCounter instead, which is part of
+the version that keys response caches."""
+import threading
+from time import monotonic
+
+import numpy as np
+from sqlalchemy import func, select
+
+from backend.models.models import TLE, Satellite, VersionCounter
+from backend.models.tle_batch import TLEBatch, TLE_DTYPE
+from backend.services.database.archive import TLE_COLUMNS, rows_to_array, array_to_tle_data
+from backend.services.database.database_operations import MEMBERSHIP_COUNTER, register_ingest_hook
+from backend.services.database.database_utils import db_session, get_engine
+
+CHECK_INTERVAL = 1.0  # seconds between version checks for TLEs ingested by other processes
+
+
+class CatalogSnapshot:
+    """Immutable latest elements of the catalog at one version. data is a TLE_DTYPE array sorted by
+    satellite_number and tle_ids holds the database id of each row."""
+
+    def __init__(self, version=0, data=None, tle_ids=None):
+        self.version = version
+        self.data = np.empty(0, dtype=TLE_DTYPE) if data is None else data
+        self.tle_ids = np.empty(0, dtype=np.int64) if tle_ids is None else tle_ids
+        self.satellite_numbers = self.data["satellite_number"]
+        self._rows = dict(zip(self.satellite_numbers.tolist(), range(len(self.data))))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, satellite_number):
+        return satellite_number in self._rows
+
+    def get(self, satellite_number):
+        """Latest elements of one satellite as a TLE_DTYPE record, or None"""
+        row = self._rows.get(satellite_number)
+        return None if row is None else self.data[row]
+
+    def take(self, satellite_numbers):
+        """Latest elements of many satellites as a TLEBatch, unknown satellite numbers are left out"""
+        satellite_numbers = np.asarray(satellite_numbers)
+        rows = np.searchsorted(self.satellite_numbers, satellite_numbers).clip(max=max(len(self) - 1, 0))
+        found = (self.satellite_numbers[rows] == satellite_numbers) if len(self) else np.zeros(len(satellite_numbers), dtype=bool)
+        return TLEBatch(self.data[rows[found]])
+
+    def to_batch(self):
+        return TLEBatch(self.data)
+
+    def merge(self, version, data, tle_ids):
+        """Returns a new snapshot with the rows of the satellites in data replaced or added"""
+        keep = ~np.isin(self.satellite_numbers, data["satellite_number"])
+        merged = np.concatenate([self.data[keep], data])
+        merged_ids = np.concatenate([self.tle_ids[keep], tle_ids])
+        order = np.argsort(merged["satellite_number"], kind="stable")
+        return CatalogSnapshot(version, merged[order], merged_ids[order])
+
+
+def read_catalog_version(session):
+    """The catalog version stored in the database, the highest tles.id"""
+    return session.scalar(select(func.max(TLE.id))) or 0
+
+
+def read_data_version(session):
+    """(catalog version, group membership version) in one round trip"""
+    tles, membership = session.execute(select(
+        select(func.max(TLE.id)).scalar_subquery(),
+        select(VersionCounter.value).where(VersionCounter.name == MEMBERSHIP_COUNTER).scalar_subquery(),
+    )).one()
+    return tles or 0, membership or 0
+
+
+class CatalogVersion:
+    """The (catalog version, group membership version) pair without the snapshot, to key response caches that may
+    depend on group filters. Re-read from the database after an ingest or membership change in this process, and at
+    most every check_interval seconds for changes by other processes."""
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = None
+        self._checked_at = None
+
+    def invalidate(self, session=None):
+        """Ingest hook, the next read checks the version"""
+        self.version = None
+
+    def get(self, session=None):
+        if self.version is not None and monotonic() - self._checked_at < self.check_interval:
+            return self.version
+        if session is None:
+            with db_session(get_engine(readonly=True)) as session:
+                return self.get(session)
+        self._checked_at = monotonic()
+        self.version = read_data_version(session)
+        return self.version
+
+
+class LatestCatalog:
+    """Keeps a CatalogSnapshot current. Readers get the snapshot without touching the database, unless an ingest in
+    this process invalidated it or CHECK_INTERVAL passed since the last version check."""
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.snapshot = CatalogSnapshot()
+        self._stale = True
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self, session=None):
+        """Ingest hook, the next read checks the version"""
+        self._stale = True
+
+    def get(self, session=None):
+        """Returns the current snapshot, refreshing it first if needed"""
+        if self._needs_check():
+            with self._lock:
+                if self._needs_check():
+                    self.refresh(session)
+        return self.snapshot
+
+    def _needs_check(self):
+        return self._stale or self._checked_at is None or monotonic() - self._checked_at >= self.check_interval
+
+    def refresh(self, session=None):
+        """Loads the latest TLEs that changed since the snapshot version, returns the number of loaded rows"""
+        if session is None:
+            with db_session(get_engine(readonly=True)) as session:
+                return self.refresh(session)
+        self._stale = False
+        self._checked_at = monotonic()
+        version = read_catalog_version(session)
+        if version == self.snapshot.version:
+            return 0
+        if version < self.snapshot.version:
+            # TLEs were deleted (e.g. a rebuilt database), start over
+            self.snapshot = CatalogSnapshot()
+        rows = session.execute(
+            select(*TLE_COLUMNS)
+            .join(Satellite, Satellite.latest_tle_id == TLE.id)
+            .where(TLE.id > self.snapshot.version, TLE.id <= version)
+        ).all()
+        array = rows_to_array(rows)
+        self.snapshot = self.snapshot.merge(version, array_to_tle_data(array), array["id"])
+        return len(rows)
+
+
+latest_catalog = LatestCatalog()
+register_ingest_hook(latest_catalog.invalidate)
+catalog_version = CatalogVersion()
+register_ingest_hook(catalog_version.invalidate)
+
+
+def get_latest_catalog(session=None):
+    """The process-wide latest catalog snapshot"""
+    return latest_catalog.get(session)
+
+
+def get_catalog_version(session=None):
+    """The process-wide (catalog version, group membership version)"""
+    return catalog_version.get(session)
@@ -1,18 +1,43 @@
 from backend.services.database.database_utils import with_session
-from backend.models.models import TLE, Satellite, Group
-from backend.services.calculations.utils import timeit
-from sqlalchemy import exists
+from backend.services.database import postgres
+from backend.services.database.query_dsl import compile_query
+from backend.models.models import TLE, Satellite, Group, VersionCounter, satellite_group_association
+from backend.models.tle_batch import TLEBatch
+from backend.models.omm import read_element_file
+from backend.services.metrics import instrument
+from sqlalchemy import delete, exists, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 
+import json
 import os
+from collections import namedtuple
+import numpy as np
+from config import DIRS
 
-operator_mapping = {
-    "<": "__lt__",
-    "<=": "__le__",
-    "==": "__eq__",
-    "!=": "__ne__",
-    ">": "__gt__",
-    ">=": "__ge__",
-}
+IN_CHUNK_SIZE = 500
+STREAM_CHUNK_SIZE = 100_000
+
+MEMBERSHIP_COUNTER = "group_membership"
+
+GroupSyncResult = namedtuple("GroupSyncResult", ["group", "added", "removed"])
+# Returned by the insert functions, group_sync is the GroupSyncResult of sync_group and None without it, errors
+# are the ParseErrors of the source records that could not be parsed
+IngestResult = namedtuple("IngestResult", ["inserted", "group_sync", "errors"])
+
+# Callables hook(session) run after TLEs are committed, e.g. to keep caches and exports in sync
+ingest_hooks = []
+
+def register_ingest_hook(hook):
+    if hook not in ingest_hooks:
+        ingest_hooks.append(hook)
+
+def run_ingest_hooks(session):
+    """Runs the ingest hooks, a failing hook is reported but does not undo the committed ingest"""
+    for hook in ingest_hooks:
+        try:
+            hook(session)
+        except Exception as e:
+            print(f"Error in ingest hook {getattr(hook, '__qualname__', hook)}: {str(e)}")
 
 @with_session
 def query_tle(display=False, session=None, **kwargs):
@@ -22,6 +47,13 @@ def query_tle(display=False, session=None, **kwargs):
         display_results(result)
     return result
 
+@with_session
+@instrument("query")
+def find_tles(filters, fields=("id", "name", "satellite_number", "epoch"), order_by=("id",), limit=None, session=None):
+    """Rows of the TLEs matching query_dsl filters, e.g. find_tles({"group": "stations", "epoch": {">=": "2024-01-01"}})"""
+    statement, params = compile_query(filters, fields, order_by, limit=limit)
+    return session.execute(statement, params).all()
+
 # Display or use the queried data
 
 def display_results(result):
@@ -61,7 +93,8 @@ def fetch_existing_satelites(new_tles, session=None):
 
 @with_session
 def fetch_latest_tles(session=None):
-    """Fetches the latest TLEs from the database"""
+    """Fetches the latest TLEs from the database as ORM objects.
+    For read-only use of the whole catalog, catalog.get_latest_catalog() is much cheaper."""
     result = (
         session.query(Satellite, TLE)
         .join(TLE, Satellite.latest_tle_id == TLE.id)
@@ -70,48 +103,261 @@ def fetch_latest_tles(session=None):
     return [tle for sat, tle in result]
 
 def get_tles_from_source(tle_source):
-    """Returns a list of TLEs from a file or a TLE string"""
+    """Returns (TLEs, ParseErrors) from a file or a TLE string"""
+    if os.path.isfile(tle_source):
+        return TLE.from_file(tle_source)
     tles_to_add = []
+    tle = TLE.from_string(tle_source)
+    if tle is not None:
+        tles_to_add.append(tle) 
+    return tles_to_add, []
+
+@with_session
+def get_existing_tle_epochs(tles_to_add, session=None):
+    """Returns the (satellite_number, epoch) pairs already stored for the incoming TLEs.
+    Only reads the columns of idx_satellite_epoch, limited to epochs not older than the incoming ones."""
+    if not tles_to_add:
+        return set()
+    min_epoch = min(tle.epoch for tle in tles_to_add)
+    sat_nums = list({tle.satellite_number for tle in tles_to_add})
+    existing_tle_epochs = set()
+    for chunk in chunks(sat_nums, IN_CHUNK_SIZE):
+        existing_tle_epochs.update(
+            session.execute(
+                select(TLE.satellite_number, TLE.epoch)
+                .where(TLE.satellite_number.in_(chunk), TLE.epoch >= min_epoch)
+            ).tuples()
+        )
+    return existing_tle_epochs
+
+def chunks(values, size):
+    """Splits a sequence into lists of at most size items, e.g. to stay below the SQLite bound parameter limit"""
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def get_tle_batch_from_source(tle_source):
+    """Returns a TLEBatch from a TLE/OMM file or a string of one or more TLEs"""
     if os.path.isfile(tle_source):
-        tles_to_add = TLE.from_file(tle_source)
+        return read_element_file(tle_source)
+    return TLEBatch.from_lines(tle_source.strip().splitlines())
+
+def insert_ignore(table, session):
+    """INSERT ... ON CONFLICT DO NOTHING for the dialect the session is bound to"""
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing()
+
+@with_session
+@instrument("ingest")
+def bulk_insert_tle(tle_source, session=None, group=None, sync_group=False):
+    """Set-based version of insert_tle.
+    TLEs are inserted with one executemany INSERT ... ON CONFLICT DO NOTHING on idx_satellite_epoch,
+    or COPY and a merge on PostgreSQL, so existing epochs never have to be loaded. Returns an IngestResult.
+    With sync_group the source is taken as the complete member list of group, see sync_group_membership, so an
+    empty source removes every member."""
+    batch = tle_source if isinstance(tle_source, TLEBatch) else get_tle_batch_from_source(tle_source)
+    if not len(batch):
+        result = None
+        if group is not None and sync_group:
+            result = sync_group_membership(group, [], session=session)
+            session.commit()
+            if result.removed:
+                run_ingest_hooks(session)
+        return IngestResult(0, result, batch.errors)
+
+    # Name each new satellite after its most recent TLE
+    latest_first = batch.data[::-1]
+    sat_nums, first = np.unique(latest_first["satellite_number"], return_index=True)
+    latest_names = latest_first["name"][first]
+    session.execute(
+        insert_ignore(Satellite.__table__, session),
+        [{"satellite_number": n, "name": name} for n, name in zip(sat_nums.tolist(), latest_names.tolist())],
+    )
+
+    # Every TLE inserted below gets an id above this one
+    max_id = session.scalar(select(func.max(TLE.id))) or 0
+    if session.get_bind().dialect.name == "postgresql":
+        postgres.copy_tle_rows(batch, session)
     else:
-        tle = TLE.from_string(tle_source)
-        if tle is not None:
-            tles_to_add.append(tle) 
-    return tles_to_add
+        session.execute(insert_ignore(TLE.__table__, session), batch.to_records())
+
+    # Point latest_tle_id at the most recent TLE of every satellite that got a new one
+    latest_tle_id = (
+        select(TLE.id)
+        .where(TLE.satellite_number == Satellite.satellite_number)
+        .order_by(TLE.epoch.desc(), TLE.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    session.execute(
+        update(Satellite)
+        .where(Satellite.satellite_number.in_(select(TLE.satellite_number).where(TLE.id > max_id)) | Satellite.latest_tle_id.is_(None))
+        .values(latest_tle_id=latest_tle_id)
+        .execution_options(synchronize_session=False)
+    )
+
+    members_changed = False
+    result = None
+    if group is not None:
+        if sync_group:
+            result = sync_group_membership(group, sat_nums.tolist(), session=session)
+            members_changed = bool(result.added or result.removed)
+        else:
+            members_changed = add_group_members(group, sat_nums.tolist(), session=session)
+
+    inserted = session.scalar(select(func.count()).select_from(TLE).where(TLE.id > max_id))
+    session.commit()
+    if inserted or members_changed:
+        run_ingest_hooks(session)
+    return IngestResult(inserted, result, batch.errors)
 
-# TODO: Make sure this doesn't eat up too much memory, possibly as filter by minimum tle epoch
 @with_session
-def get_existing_tle_epochs(tles_to_add, session=None):
-    existing_tle_epochs = {
-        (tle.satellite_number, tle.epoch): tle
-        for tle in session.query(TLE)
-        .filter(TLE.satellite_number.in_([tle.satellite_number for tle in tles_to_add]))
-        .all()
+def known_tle_mask(batch, session=None):
+    """Boolean mask of the batch records whose (satellite_number, epoch) is already stored.
+    Uses an index-only lookup on idx_satellite_epoch bounded by the epoch range of the batch."""
+    if not len(batch):
+        return np.zeros(0, dtype=bool)
+    epochs = batch["epoch"]
+    min_epoch, max_epoch = epochs.min().item(), epochs.max().item()
+    known = set()
+    for chunk in chunks(batch.satellite_numbers.tolist(), IN_CHUNK_SIZE):
+        rows = session.execute(
+            select(TLE.satellite_number, TLE.epoch)
+            .where(TLE.satellite_number.in_(chunk), TLE.epoch.between(min_epoch, max_epoch))
+        ).all()
+        if rows:
+            sat_nums, stored_epochs = zip(*rows)
+            known.update(zip(sat_nums, np.array(stored_epochs, dtype="M8[us]").astype(np.int64).tolist()))
+    keys = zip(batch["satellite_number"].tolist(), epochs.astype(np.int64).tolist())
+    return np.fromiter((key in known for key in keys), dtype=bool, count=len(batch))
+
+@with_session
+@instrument("ingest")
+def stream_insert_tle(tle_path, session=None, group=None, chunk_size=STREAM_CHUNK_SIZE, checkpoint_path=None, resume=True):
+    """Bounded-memory ingest for large (optionally gzip compressed) TLE archives.
+    The file is read in chunks of about chunk_size lines, each chunk is deduplicated against itself and
+    the database, bulk inserted and committed, then a checkpoint is written so an interrupted run resumes
+    after the last committed chunk. Returns a summary dict."""
+    checkpoint_path = checkpoint_path or os.path.join(DIRS["cache"], f"{os.path.basename(tle_path)}.checkpoint.json")
+    checkpoint = load_checkpoint(checkpoint_path, tle_path) if resume else None
+    checkpoint = checkpoint or new_checkpoint(tle_path)
+    if checkpoint["complete"]:
+        return checkpoint
+
+    for batch, offset, line_number in TLEBatch.iter_file(tle_path, chunk_size, checkpoint["offset"], checkpoint["line_number"]):
+        batch = batch.unique()
+        if len(batch):
+            new = TLEBatch(batch.data[~known_tle_mask(batch, session=session)])
+            checkpoint["inserted"] += bulk_insert_tle(new, session=session).inserted
+            if group is not None:
+                members_changed = add_group_members(group, batch.satellite_numbers.tolist(), session=session)
+                session.commit()
+                if members_changed:
+                    run_ingest_hooks(session)
+        checkpoint["records"] += len(batch)
+        checkpoint["errors"] += len(batch.errors)
+        checkpoint.update(offset=offset, line_number=line_number)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    checkpoint["complete"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+def ensure_group(group, session):
+    session.execute(insert_ignore(Group.__table__, session).values(name=group))
+
+def bump_version_counter(name, session):
+    """Increments a VersionCounter in the caller's transaction"""
+    session.execute(insert_ignore(VersionCounter.__table__, session).values(name=name, value=0))
+    session.execute(update(VersionCounter).where(VersionCounter.name == name).values(value=VersionCounter.value + 1))
+
+@with_session
+def add_group_members(group, satellite_numbers, session=None):
+    """Adds satellites to a group, creating the group if needed. Satellites already in the group are skipped by the database.
+    Returns whether rows may have been added, in which case the membership counter was bumped."""
+    ensure_group(group, session)
+    if not satellite_numbers:
+        return False
+    result = session.execute(
+        insert_ignore(satellite_group_association, session),
+        [{"satellite_number": n, "group_name": group} for n in satellite_numbers],
+    )
+    # Drivers that cannot count the rows of an executemany report -1, counted as a change
+    if result.rowcount == 0:
+        return False
+    bump_version_counter(MEMBERSHIP_COUNTER, session)
+    return True
+
+@with_session
+def sync_group_membership(group, satellite_numbers, session=None):
+    """Makes satellite_numbers the exact member list of a group, e.g. the latest Celestrak list.
+    Diffs against the stored satellite_group_association rows and applies it with one bulk insert and chunked
+    bulk deletes, so the cost is linear in the group size. Returns the applied GroupSyncResult."""
+    ensure_group(group, session)
+    existing = set(session.scalars(
+        select(satellite_group_association.c.satellite_number).where(satellite_group_association.c.group_name == group)
+    ))
+    incoming = {int(n) for n in satellite_numbers}
+    added = sorted(incoming - existing)
+    removed = sorted(existing - incoming)
+
+    if added:
+        session.execute(
+            insert_ignore(satellite_group_association, session),
+            [{"satellite_number": n, "group_name": group} for n in added],
+        )
+    for chunk in chunks(removed, IN_CHUNK_SIZE):
+        session.execute(
+            delete(satellite_group_association).where(
+                satellite_group_association.c.group_name == group,
+                satellite_group_association.c.satellite_number.in_(chunk),
+            )
+        )
+    if added or removed:
+        bump_version_counter(MEMBERSHIP_COUNTER, session)
+    return GroupSyncResult(group, added, removed)
+
+def new_checkpoint(tle_path):
+    stat = os.stat(tle_path)
+    return {
+        "source": os.path.abspath(tle_path), "size": stat.st_size, "mtime": stat.st_mtime,
+        "offset": 0, "line_number": 1, "records": 0, "inserted": 0, "errors": 0, "complete": False,
     }
-    return existing_tle_epochs
 
+def load_checkpoint(checkpoint_path, tle_path):
+    """Returns the checkpoint of tle_path, or None if there is none or the file changed since"""
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    stat = os.stat(tle_path)
+    if (checkpoint.get("source"), checkpoint.get("size"), checkpoint.get("mtime")) != (os.path.abspath(tle_path), stat.st_size, stat.st_mtime):
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
 
 @with_session
-@timeit
-def insert_tle(tle_source, session=None, group=None):
+@instrument("ingest")
+def insert_tle(tle_source, session=None, group=None, bulk=False, sync_group=False):
+    """Returns an IngestResult like bulk_insert_tle"""
+    if bulk:
+        return bulk_insert_tle(tle_source, session=session, group=group, sync_group=sync_group)
 
-    tles_to_add = get_tles_from_source(tle_source)
+    tles_to_add, errors = get_tles_from_source(tle_source)
+    inserted = 0
+    result = None
     
     if tles_to_add:
         # Prefetch existing data
         existing_sats = fetch_existing_satelites(tles_to_add, session=session)
         existing_tle_epochs = get_existing_tle_epochs(tles_to_add, session=session)
 
-        # Optionally, associate with a group
-        # TODO: make a group function
-        if group is not None:
-            # Ensure the group exists
-            db_group = session.query(Group).filter_by(name=group).one_or_none()
-            if db_group is None:
-                db_group = Group(name=group)
-                session.add(db_group)
-
         # Process the new TLE data
         for tle in tles_to_add:
             if tle is not None:
@@ -132,6 +378,7 @@ def insert_tle(tle_source, session=None, group=None):
                 #     session.add(tle)
                 if not (tle.satellite_number, tle.epoch) in existing_tle_epochs:
                     session.add(tle)
+                    inserted += 1
 
                 # Efficiently check for existing satellite and latest TLE
                 satellite = existing_sats.get(sat_num)
@@ -145,9 +392,20 @@ def insert_tle(tle_source, session=None, group=None):
                     # Update latest_tle if the new TLE is more recent
                     if not satellite.latest_tle or tle.epoch > satellite.latest_tle.epoch:
                         satellite.latest_tle = tle
-                        
-                # Ensure the satellite is associated with the group
-                if group is not None and db_group is not None and satellite not in db_group.satellites:
-                    db_group.satellites.append(satellite)
+
+        # Optionally, associate with a group
+        if group is not None:
+            session.flush()
+            if sync_group:
+                result = sync_group_membership(group, list(existing_sats), session=session)
+            else:
+                add_group_members(group, list(existing_sats), session=session)
                     
         session.commit()
+        run_ingest_hooks(session)
+    elif group is not None and sync_group:
+        result = sync_group_membership(group, [], session=session)
+        session.commit()
+        if result.removed:
+            run_ingest_hooks(session)
+    return IngestResult(inserted, result, errors)
@@ -1,31 +1,132 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sgp4.io import twoline2rv
-from sgp4.earth_gravity import wgs72
-from typing import Union, Tuple
-import math
+"""Engines, sessions and schema setup. Nothing touches the database on import: engines are created on first use
+and the schema is created by initialize_database, e.g. with `python -m backend.services.database.database_utils init`."""
+import argparse
+import os
+import weakref
 from contextlib import contextmanager
 from functools import wraps
-import sqlite3
-import os
-from config import DB_URI, DB_PATH
-from backend.models.models import Base
+
+from sqlalchemy import create_engine, inspect, text, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from config import DB_URI, DB_PROFILE, setup_directories
+from backend.models.models import Base, TLE
+from backend.services.database import postgres
 
 # Initialize Database
-def get_engine(db_uri=DB_URI):
-    return create_engine(db_uri)
+# One engine and one session factory per (database, read only) and process
+_engines = {}
+_session_factories = {}
+# Session factories of the engines handed to db_session, dropped with their engine. They are not bound to it, a
+# bound factory would keep its key alive.
+_engine_session_factories = weakref.WeakKeyDictionary()
+
+def get_engine(db_uri=DB_URI, readonly=False, profile=DB_PROFILE):
+    """Returns the shared engine for db_uri, creating it with the given profile on first use.
+    Read only engines connect with SQLite's mode=ro, so with WAL they never block behind ingest writes.
+    On PostgreSQL their transactions are read only, which also rejects TEMPORARY tables and COPY."""
+    key = (str(db_uri), readonly)
+    if key not in _engines:
+        _engines[key] = create_profiled_engine(db_uri, readonly, profile)
+    return _engines[key]
+
+def create_profiled_engine(db_uri=DB_URI, readonly=False, profile=DB_PROFILE):
+    url = make_url(db_uri)
+    if url.get_backend_name() != "sqlite":
+        execution_options = {"postgresql_readonly": True} if readonly else {}
+        return create_engine(url, execution_options=execution_options, **pool_options(profile))
+
+    in_memory = url.database in (None, "", ":memory:")
+    if not readonly and not in_memory:
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+    if readonly and not in_memory:
+        url = url.set(database=f"file:{url.database}", query={**url.query, "mode": "ro", "uri": "true"})
+    engine = create_engine(
+        url,
+        connect_args={"timeout": profile["busy_timeout"] / 1000, "check_same_thread": False},
+        **({} if in_memory else pool_options(profile)),
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not readonly and not in_memory:
+            cursor.execute(f"PRAGMA journal_mode={profile['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={profile['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size={int(profile['cache_size'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(profile['mmap_size'])}")
+        cursor.execute(f"PRAGMA busy_timeout={int(profile['busy_timeout'])}")
+        cursor.close()
+
+    return engine
+
+def pool_options(profile):
+    return {key: profile[key] for key in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping")}
 
 def initialize_database(db_uri=DB_URI):
-    engine = get_engine()
+    engine = get_engine(db_uri)
+    if engine.dialect.name == "postgresql":
+        postgres.create_schema(engine)
+        return engine
     Base.metadata.create_all(engine)
+    ensure_unique_tle_epochs(engine)
+    # create_all skips the tables that exist, so indexes added to the models later are created here
+    for index in TLE.__table__.indexes:
+        index.create(engine, checkfirst=True)
     return engine
 
-engine = initialize_database()
+def ensure_unique_tle_epochs(engine):
+    """Databases created before idx_satellite_epoch was unique have a plain index that ON CONFLICT cannot use.
+    Drops duplicate TLEs, repoints latest_tle_id and rebuilds the index as unique."""
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes(TLE.__tablename__)}
+    if indexes.get("idx_satellite_epoch", {}).get("unique"):
+        return
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM tles WHERE id NOT IN (SELECT MIN(id) FROM tles GROUP BY satellite_number, epoch)"))
+        connection.execute(text(
+            "UPDATE satellites SET latest_tle_id = (SELECT id FROM tles WHERE tles.satellite_number = satellites.satellite_number "
+            "ORDER BY epoch DESC, id DESC LIMIT 1)"
+        ))
+        connection.execute(text("DROP INDEX IF EXISTS idx_satellite_epoch"))
+        for index in TLE.__table__.indexes:
+            index.create(connection)
+
+def __getattr__(name):
+    # The default engine used to be created on import as database_utils.engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_sessionmaker(db_uri=DB_URI, readonly=False):
+    """Returns the shared sessionmaker bound to the shared engine"""
+    key = (str(db_uri), readonly)
+    if key not in _session_factories:
+        _session_factories[key] = sessionmaker(bind=get_engine(db_uri, readonly))
+    return _session_factories[key]
+
+def get_scoped_session(db_uri=DB_URI, readonly=False):
+    """Returns a scoped_session registry, which hands out one session per thread (e.g. per request).
+    Call .remove() on it when the request or thread is done."""
+    key = (str(db_uri), readonly, "scoped")
+    if key not in _session_factories:
+        _session_factories[key] = scoped_session(get_sessionmaker(db_uri, readonly))
+    return _session_factories[key]
 
 def get_session(engine):
-    Session = sessionmaker(bind=engine)
-    return Session()
+    if engine is None:
+        return get_sessionmaker()()
+    factory = _engine_session_factories.get(engine)
+    if factory is None:
+        factory = _engine_session_factories[engine] = sessionmaker()
+    return factory(bind=engine)
+
+def dispose_engines():
+    """Drops inherited connections in a forked child, they must not be shared with the parent"""
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=dispose_engines)
 
 @contextmanager
 def db_session(engine):
@@ -54,8 +155,31 @@ def with_session(func):
     @wraps(func)
     def wrapper(*args, session=None, **kwargs):
         if session is None:
-            with db_session(engine) as session:
+            with db_session(get_engine()) as session:
                 return func(*args, session=session, **kwargs)
         else:
             return func(*args, session=session, **kwargs)
     return wrapper
+
+def with_read_session(func):
+    """Like with_session, but the session comes from the read only pool"""
+    @wraps(func)
+    def wrapper(*args, session=None, **kwargs):
+        if session is None:
+            with db_session(get_engine(readonly=True)) as session:
+                return func(*args, session=session, **kwargs)
+        else:
+            return func(*args, session=session, **kwargs)
+    return wrapper
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Database setup.")
+    parser.add_argument("command", choices=["init"], help="init creates the data directories and the database schema")
+    parser.add_argument("--db-uri", default=DB_URI)
+    args = parser.parse_args(argv)
+    setup_directories()
+    initialize_database(args.db_uri)
+    print(f"Initialized {args.db_uri}")
+
+if __name__ == "__main__":
+    main()
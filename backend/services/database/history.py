@@ -0,0 +1,144 @@
+"""Batched time travel over the TLE history: the TLE that was current at a given time for many satellites at once.
+The governing TLE of (satellite_number, time) is the one with the latest epoch not after time.
+elements_at answers all pairs with one as-of join in the database, or with a vectorized binary search over the
+sorted columnar history of an ElementArchive. Large batches go to the archive by default: the database join costs
+about 2.5 s per 100k pairs, the binary search a fraction of that."""
+import csv
+import io
+
+import numpy as np
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, type_coerce
+
+from backend.models.models import TLE
+from backend.models.tle_batch import TLEBatch, TLE_DTYPE
+from backend.services.database.archive import ElementArchive, TLE_COLUMNS, rows_to_array, array_to_tle_data
+from backend.services.database import postgres
+from backend.services.database.database_utils import with_session
+from backend.services.metrics import instrument
+
+ARCHIVE_MIN_PAIRS = 10_000  # batches from this size on read the default archive when it is up to date
+default_archive = None
+
+# Query pairs are loaded into a temporary table so the database sees them in one statement
+query_metadata = MetaData()
+as_of_queries = Table(
+    "as_of_queries", query_metadata,
+    Column("i", Integer, primary_key=True),
+    Column("satellite_number", Integer),
+    Column("time", DateTime),
+    prefixes=["TEMPORARY"],
+)
+
+
+def get_default_archive():
+    global default_archive
+    if default_archive is None:
+        default_archive = ElementArchive()
+    return default_archive
+
+
+@instrument("query")
+@with_session
+def elements_at(satellite_numbers, times, session=None, archive=None):
+    """Returns (TLEBatch, found) for arrays of satellite numbers and times (datetime64 or datetimes).
+    Row i of the batch is the TLE governing pair i where found[i], pairs without any earlier TLE are not found.
+    Reads from the archive when one is given, from the default archive for ARCHIVE_MIN_PAIRS pairs or more when it
+    holds every row of the database, otherwise from the database. archive=False always reads the database."""
+    satellite_numbers = np.asarray(satellite_numbers, dtype=np.int64)
+    times = np.asarray(times, dtype="M8[us]")
+    if archive is None and len(satellite_numbers) >= ARCHIVE_MIN_PAIRS:
+        archive = get_default_archive()
+        if archive.manifest["watermark"] != (session.scalar(select(func.max(TLE.id))) or 0):
+            archive = None
+    if archive:
+        return archive_elements_at(archive, satellite_numbers, times)
+    return database_elements_at(satellite_numbers, times, session=session)
+
+
+@with_session
+def database_elements_at(satellite_numbers, times, session=None):
+    """As-of join on idx_satellite_epoch: one index seek per pair, all in one statement.
+    Needs a writable session: read only PostgreSQL transactions reject the temporary table and COPY."""
+    data = np.zeros(len(satellite_numbers), dtype=TLE_DTYPE)
+    found = np.zeros(len(satellite_numbers), dtype=bool)
+    if not len(satellite_numbers):
+        return TLEBatch(data), found
+
+    connection = session.connection()
+    as_of_queries.create(connection, checkfirst=True)
+    try:
+        load_queries(connection, satellite_numbers, times)
+        governing_id = (
+            select(TLE.id)
+            .where(TLE.satellite_number == as_of_queries.c.satellite_number, TLE.epoch <= as_of_queries.c.time)
+            .order_by(TLE.epoch.desc())
+            .limit(1)
+            .correlate(as_of_queries)
+            .scalar_subquery()
+        )
+        # Epochs come back unprocessed (strings on SQLite), rows_to_array converts them in bulk
+        columns = [type_coerce(column, String) if column.name == "epoch" else column for column in TLE_COLUMNS]
+        rows = connection.execute(
+            select(as_of_queries.c.i, *columns).join(TLE, TLE.id == governing_id)
+        ).all()
+    finally:
+        as_of_queries.drop(connection)
+
+    if rows:
+        pairs = np.array([row[0] for row in rows])
+        data[pairs] = array_to_tle_data(rows_to_array([row[1:] for row in rows]))
+        found[pairs] = True
+    return TLEBatch(data), found
+
+
+def load_queries(connection, satellite_numbers, times):
+    """Fills as_of_queries straight through the driver, bypassing per-row parameter processing.
+    Times are written in the format SQLAlchemy stores SQLite DateTimes in, which PostgreSQL also accepts."""
+    connection.execute(as_of_queries.delete())
+    time_strings = np.char.replace(np.datetime_as_string(times, unit="us"), "T", " ")
+    rows = zip(range(len(times)), satellite_numbers.tolist(), time_strings.tolist())
+    if connection.dialect.name == "postgresql":
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        out.seek(0)
+        postgres.copy_from_csv(connection, "COPY as_of_queries (i, satellite_number, time) FROM STDIN WITH (FORMAT csv)", out)
+        return
+    marker = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.executemany(f"INSERT INTO as_of_queries (i, satellite_number, time) VALUES ({marker}, {marker}, {marker})", rows)
+    finally:
+        cursor.close()
+
+
+def archive_elements_at(archive, satellite_numbers, times):
+    """Vectorized binary search of every pair's epoch within its satellite's slice of the archive"""
+    data = np.zeros(len(satellite_numbers), dtype=TLE_DTYPE)
+    found = np.zeros(len(satellite_numbers), dtype=bool)
+    if not len(satellite_numbers):
+        return TLEBatch(data), found
+
+    history = archive.range(int(satellite_numbers.min()), int(satellite_numbers.max()), end=times.max())
+    index = as_of_index(history["satellite_number"], history["epoch"], satellite_numbers, times)
+    found = index >= 0
+    data[found] = array_to_tle_data(history[index[found]])
+    return TLEBatch(data), found
+
+
+def as_of_index(history_satellite_numbers, history_epochs, satellite_numbers, times):
+    """For rows sorted by (satellite_number, epoch), returns the row governing each (satellite_number, time)
+    pair, or -1. Bisects all pairs at once within their satellite's [lo, hi) slice, O(m log n)."""
+    lo = np.searchsorted(history_satellite_numbers, satellite_numbers, side="left")
+    hi = np.searchsorted(history_satellite_numbers, satellite_numbers, side="right")
+    start = lo.copy()
+    # Invariant: rows before lo are not after time, rows from hi on are after time (or another satellite)
+    while True:
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        not_after = np.zeros(len(lo), dtype=bool)
+        not_after[active] = history_epochs[mid[active]] <= times[active]
+        lo = np.where(active & not_after, mid + 1, lo)
+        hi = np.where(active & ~not_after, mid, hi)
+    return np.where(lo > start, lo - 1, -1)
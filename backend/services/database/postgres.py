@@ -0,0 +1,139 @@
+"""PostgreSQL storage backend, selected by pointing config.DB_URI (or ORBITVIZ_DB_URI) at a postgresql:// database.
+tles is range partitioned by epoch year, so epoch range scans only touch the partitions they need.
+Bulk ingest COPYs a TLEBatch into a temporary staging table and merges it with INSERT ... ON CONFLICT DO NOTHING."""
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from backend.models.tle_batch import TLE_DTYPE
+
+FIRST_PARTITION_YEAR = 1957  # Sputnik, no element set is older
+
+# The ORM metadata cannot express partitioning, and a partitioned table only supports unique keys that include the
+# partition key. So tles.id is unique per (id, epoch) and satellites.latest_tle_id has no foreign key constraint.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS satellites (
+        id SERIAL PRIMARY KEY,
+        satellite_number INTEGER UNIQUE,
+        name VARCHAR,
+        latest_tle_id BIGINT UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS tles (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+        name VARCHAR(50),
+        satellite_number INTEGER REFERENCES satellites (satellite_number),
+        classification VARCHAR(1),
+        international_designator VARCHAR(8),
+        epoch_year INTEGER,
+        epoch_day DOUBLE PRECISION,
+        mean_motion_dot DOUBLE PRECISION,
+        mean_motion_ddot DOUBLE PRECISION,
+        bstar DOUBLE PRECISION,
+        ephemeris_type INTEGER,
+        element_number INTEGER,
+        inclination DOUBLE PRECISION,
+        right_ascension DOUBLE PRECISION,
+        eccentricity DOUBLE PRECISION,
+        argument_of_perigee DOUBLE PRECISION,
+        mean_anomaly DOUBLE PRECISION,
+        mean_motion DOUBLE PRECISION,
+        revolution_number INTEGER,
+        epoch TIMESTAMP NOT NULL,
+        PRIMARY KEY (id, epoch)
+    ) PARTITION BY RANGE (epoch)""",
+    # Serves the ON CONFLICT merge, history range scans and latest TLE lookups (backward scan per satellite)
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_satellite_epoch ON tles (satellite_number, epoch)",
+    # Joins from satellites.latest_tle_id
+    "CREATE INDEX IF NOT EXISTS idx_tles_id ON tles (id)",
+    # Keyset pagination in epoch order
+    "CREATE INDEX IF NOT EXISTS idx_epoch_id ON tles (epoch, id)",
+    """CREATE TABLE IF NOT EXISTS groups (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS satellite_group_association (
+        satellite_number INTEGER REFERENCES satellites (satellite_number),
+        group_name VARCHAR REFERENCES groups (name),
+        PRIMARY KEY (satellite_number, group_name)
+    )""",
+    # Group member lookups filter on group_name, the primary key leads with satellite_number
+    "CREATE INDEX IF NOT EXISTS idx_group_members ON satellite_group_association (group_name, satellite_number)",
+    """CREATE TABLE IF NOT EXISTS version_counters (
+        name VARCHAR PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )""",
+]
+
+
+def create_schema(engine, last_year=None):
+    """Creates the tables, indexes and the yearly tles partitions up to last_year (next year by default)"""
+    last_year = last_year or datetime.utcnow().year + 1
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        ensure_partitions(connection, range(FIRST_PARTITION_YEAR, last_year + 1))
+
+
+def ensure_partitions(connection, years):
+    """Creates the missing yearly partitions of tles"""
+    existing = set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = 'tles'"
+    )).scalars())
+    for year in sorted(set(int(year) for year in years)):
+        if partition_name(year) in existing:
+            continue
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF tles "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+
+
+def partition_name(year):
+    return f"tles_y{int(year)}"
+
+
+def copy_tle_rows(batch, session):
+    """Inserts the TLEs of a batch that are not stored yet: COPY into a staging table, then one merge INSERT"""
+    connection = session.connection()
+    ensure_partitions(connection, np.unique(batch["epoch"].astype("M8[Y]").astype(np.int64) + 1970).tolist())
+
+    columns = ", ".join(TLE_DTYPE.names)
+    connection.execute(text(f"CREATE TEMPORARY TABLE tles_staging ON COMMIT DROP AS SELECT {columns} FROM tles WITH NO DATA"))
+    copy_from_csv(connection, f"COPY tles_staging ({columns}) FROM STDIN WITH (FORMAT csv)", batch_to_csv(batch))
+    # Duplicates inside the batch are skipped by the same ON CONFLICT clause
+    connection.execute(text(
+        f"INSERT INTO tles ({columns}) SELECT {columns} FROM tles_staging ON CONFLICT (satellite_number, epoch) DO NOTHING"
+    ))
+    connection.execute(text("DROP TABLE tles_staging"))
+
+
+def batch_to_csv(batch):
+    """Writes the TLE columns of a batch as CSV, in TLE_DTYPE order"""
+    out = io.StringIO()
+    columns = [
+        np.datetime_as_string(batch[name], unit="us") if name == "epoch" else batch[name]
+        for name in TLE_DTYPE.names
+    ]
+    # repr of a Python float round trips exactly. Strings are quoted, an unquoted empty field would be NULL
+    csv.writer(out, quoting=csv.QUOTE_NONNUMERIC).writerows(zip(*(column.tolist() for column in columns)))
+    out.seek(0)
+    return out
+
+
+def copy_from_csv(connection, statement, file):
+    """Runs COPY ... FROM STDIN with psycopg2 or psycopg 3 on the connection of the current transaction"""
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(statement, file)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(file.getvalue())
+    finally:
+        cursor.close()
@@ -0,0 +1,143 @@
+"""The filter language of the TLE queries, shared by the API and the database operations.
+Filters are {column: {operator: value}} on tles columns, e.g.
+    {"inclination": {">=": 50, "<": 60}, "satellite_number": {"in": [5, 25544]}, "epoch": {"between": [a, b]}}
+plus {"group": name} or {"group": {"in": [names]}} for membership of Celestrak groups.
+
+Requests with the same filter shape (which operators on which columns, not the values) share one statement:
+it is built once with bound parameters and cached, and each request only binds its values."""
+import operator
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import DateTime, Float, Integer, String, and_, bindparam, or_, select
+
+from backend.models.models import TLE, satellite_group_association
+
+STATEMENT_CACHE_SIZE = 256
+GROUP_KEY = "group"
+COMPARISONS = {
+    "<": ("lt", operator.lt),
+    "<=": ("le", operator.le),
+    "==": ("eq", operator.eq),
+    "!=": ("ne", operator.ne),
+    ">": ("gt", operator.gt),
+    ">=": ("ge", operator.ge),
+}
+LIST_OPERATORS = {"in": "in", "not in": "not_in"}
+RANGE_OPERATOR = "between"  # [low, high], both inclusive
+OPERATORS = set(COMPARISONS) | set(LIST_OPERATORS) | {RANGE_OPERATOR}
+
+columns = TLE.__table__.c
+
+
+class FilterError(ValueError):
+    """An unknown column or operator, or a value of the wrong type"""
+
+
+def normalize_filters(filters):
+    """Validates filters, returns (shape, params): the sorted (column, operator) pairs and the bound values"""
+    if not isinstance(filters, dict):
+        raise FilterError("filters must be an object of {column: {operator: value}}")
+    shape = []
+    params = {}
+    for column, operations in filters.items():
+        if column == GROUP_KEY:
+            operations = operations if isinstance(operations, dict) else {"==": operations}
+        elif column not in columns:
+            raise FilterError(f"unknown column {column!r}")
+        if not isinstance(operations, dict):
+            raise FilterError(f"filter of {column!r} must be an object of {{operator: value}}")
+        for operator_str, value in operations.items():
+            if operator_str not in OPERATORS or (column == GROUP_KEY and operator_str not in ("==", "in")):
+                raise FilterError(f"unknown operator {operator_str!r} for {column!r}")
+            name = parameter_name(column, operator_str)
+            if operator_str in LIST_OPERATORS:
+                if not isinstance(value, list):
+                    raise FilterError(f"{column!r} {operator_str} needs a list")
+                params[name] = [coerce(column, item) for item in value]
+            elif operator_str == RANGE_OPERATOR:
+                if not isinstance(value, list) or len(value) != 2:
+                    raise FilterError(f"{column!r} between needs [low, high]")
+                params[f"{name}_low"], params[f"{name}_high"] = (coerce(column, item) for item in value)
+            else:
+                params[name] = coerce(column, value)
+            shape.append((column, operator_str))
+    return tuple(sorted(shape)), params
+
+
+def compile_query(filters, fields, order_by=("id",), after=None, limit=None):
+    """Returns (statement, params) selecting fields of the tles rows matching filters, ordered by the order_by
+    columns. after holds the order_by values of a row to continue after (keyset pagination), which needs
+    order_by to end with a unique column."""
+    shape, params = normalize_filters(filters)
+    statement = cached_statement(shape, tuple(fields), tuple(order_by), after is not None, limit is not None)
+    if after is not None:
+        params.update({f"after_{i}": value for i, value in enumerate(after)})
+    if limit is not None:
+        params["limit"] = limit
+    return statement, params
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def cached_statement(shape, fields, order_by, keyset=False, limit=False):
+    conditions = [condition(column, operator_str) for column, operator_str in shape]
+    if keyset:
+        conditions.append(after_keyset([columns[name] for name in order_by]))
+    statement = select(*[columns[name] for name in fields]).where(*conditions).order_by(*[columns[name] for name in order_by])
+    return statement.limit(bindparam("limit", type_=Integer)) if limit else statement
+
+
+def condition(column, operator_str):
+    name = parameter_name(column, operator_str)
+    if column == GROUP_KEY:
+        group_name = satellite_group_association.c.group_name
+        members = select(satellite_group_association.c.satellite_number).where(
+            group_name.in_(bindparam(name, expanding=True)) if operator_str == "in" else group_name == bindparam(name)
+        )
+        return columns.satellite_number.in_(members)
+    column = columns[column]
+    if operator_str in LIST_OPERATORS:
+        values = bindparam(name, expanding=True, type_=column.type)
+        return column.in_(values) if operator_str == "in" else column.not_in(values)
+    if operator_str == RANGE_OPERATOR:
+        return column.between(bindparam(f"{name}_low", type_=column.type), bindparam(f"{name}_high", type_=column.type))
+    return COMPARISONS[operator_str][1](column, bindparam(name, type_=column.type))
+
+
+def after_keyset(order_columns, start=0):
+    """Rows after the one whose order columns have the values :after_0, :after_1, ..."""
+    column = order_columns[start]
+    value = bindparam(f"after_{start}", type_=column.type)
+    if start == len(order_columns) - 1:
+        return column > value
+    return or_(column > value, and_(column == value, after_keyset(order_columns, start + 1)))
+
+
+def parameter_name(column, operator_str):
+    if operator_str in COMPARISONS:
+        suffix = COMPARISONS[operator_str][0]
+    else:
+        suffix = LIST_OPERATORS.get(operator_str, operator_str)
+    return f"{column}_{suffix}"
+
+
+def coerce(column, value):
+    """Converts a JSON value to the Python type of the column"""
+    column_type = String() if column == GROUP_KEY else columns[column].type
+    try:
+        if isinstance(column_type, DateTime):
+            return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+        if isinstance(value, bool):
+            raise TypeError
+        if isinstance(column_type, Integer):
+            if isinstance(value, float) and not value.is_integer():
+                raise TypeError
+            return int(value)
+        if isinstance(column_type, Float):
+            return float(value)
+        if isinstance(column_type, String):
+            if not isinstance(value, str):
+                raise TypeError
+        return value
+    except (TypeError, ValueError):
+        raise FilterError(f"invalid value {value!r} for {column!r}")
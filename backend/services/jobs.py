@@ -0,0 +1,259 @@
+"""Background compute jobs, e.g. visibility calculations that take too long for a request.
+Each job runs in its own worker process, at most max_workers at a time, so a job that times out or is cancelled
+can be killed without disturbing the others. Results are persisted as JSON under data/cache/jobs, named after
+the job id, a hash of the kind and the parameters: identical jobs in flight are deduplicated and finished ones
+are served from disk, also after a restart."""
+import hashlib
+import importlib
+import json
+import math
+import multiprocessing
+import numbers
+import os
+import threading
+from collections import deque
+from multiprocessing.connection import wait
+from time import monotonic, time
+
+from config import DIRS
+
+JOBS_DIR = os.path.join(DIRS["cache"], "jobs")
+DEFAULT_TIMEOUT = 600  # seconds
+# Job kind -> "module:function", called in the worker with the job parameters as keyword arguments
+JOB_KINDS = {
+    "visibility": "backend.services.calculations.visibility:visibility_intervals",
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, TIMED_OUT = "queued", "running", "succeeded", "failed", "cancelled", "timed_out"
+PENDING = {QUEUED, RUNNING}
+
+
+class Job:
+    def __init__(self, job_id, kind, params, timeout, status=QUEUED):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.timeout = timeout
+        self.status = status
+        self.error = None
+        self.submitted_at = time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status, "error": self.error, "timeout": self.timeout,
+            "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+
+def job_id(kind, params):
+    normalized = json.dumps([kind, params], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:24]
+
+
+def run_job(target, params, result_path, connection):
+    """Worker process: runs the job function and writes its result, then reports (status, error)"""
+    try:
+        module, function = target.split(":")
+        result = getattr(importlib.import_module(module), function)(**params)
+        tmp_path = f"{result_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, result_path)
+        connection.send((SUCCEEDED, None))
+    except Exception as e:
+        connection.send((FAILED, f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+class JobManager:
+    """Queues jobs and runs them in worker processes from a dispatcher thread"""
+
+    def __init__(self, max_workers=None, jobs_dir=JOBS_DIR, default_timeout=DEFAULT_TIMEOUT, kinds=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.jobs_dir = jobs_dir
+        self.default_timeout = default_timeout
+        self.kinds = JOB_KINDS if kinds is None else kinds
+        self.jobs = {}
+        self._queue = deque()
+        # Job -> (process, connection, deadline). A killed job stays here until its process is reaped
+        self._running = {}
+        self._condition = threading.Condition()
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self._context = multiprocessing.get_context()
+        self._dispatcher = None
+        self._closed = False
+
+    def submit(self, kind, params, timeout=None):
+        """Returns the Job for kind and params, which is the in-flight or finished one if it exists.
+        timeout is a positive number of seconds, or None for the default."""
+        if kind not in self.kinds:
+            raise ValueError(f"unknown job kind {kind!r}, expected one of {sorted(self.kinds)}")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, numbers.Real)
+                                    or not 0 < timeout < math.inf):
+            raise ValueError(f"timeout must be a positive number of seconds, got {timeout!r}")
+        job_id_ = job_id(kind, params)
+        with self._condition:
+            job = self.jobs.get(job_id_)
+            if job is not None and (job.status in PENDING or (job.status == SUCCEEDED and os.path.exists(self.result_path(job_id_)))):
+                return job
+            job = Job(job_id_, kind, params, self.default_timeout if timeout is None else float(timeout))
+            if os.path.exists(self.result_path(job_id_)):
+                job.status = SUCCEEDED
+                job.finished_at = os.path.getmtime(self.result_path(job_id_))
+                self.jobs[job_id_] = job
+                return job
+            self.jobs[job_id_] = job
+            self._queue.append(job)
+            self._start_dispatcher()
+            self._condition.notify_all()
+        self._wake()
+        return job
+
+    def get(self, job_id_):
+        return self.jobs.get(job_id_)
+
+    def cancel(self, job_id_):
+        """Cancels a queued or running job, returns the job or None if it is unknown"""
+        with self._condition:
+            job = self.jobs.get(job_id_)
+            if job is None or job.status not in PENDING:
+                return job
+            if job.status == QUEUED:
+                self._queue.remove(job)
+            else:
+                self._running[job][0].kill()
+            self._finish(job, CANCELLED)
+        self._wake()
+        return job
+
+    def result(self, job_id_):
+        """The result of a succeeded job"""
+        with open(self.result_path(job_id_), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def result_path(self, job_id_):
+        return os.path.join(self.jobs_dir, f"{job_id_}.json")
+
+    def wait(self, job_id_, timeout=None):
+        """Blocks until the job finished or timeout passed, returns the job"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.jobs[job_id_].status not in PENDING, timeout)
+            return self.jobs[job_id_]
+
+    def watch(self, job_id_, heartbeat=15.0):
+        """Yields the job as a dict on every status change until it finished, or every heartbeat seconds"""
+        last = None
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.jobs[job_id_].status != last, heartbeat)
+                job = self.jobs[job_id_]
+                last = job.status
+                state = job.to_dict()
+            yield state
+            if last not in PENDING:
+                return
+
+    def shutdown(self):
+        """Kills the running jobs and stops the dispatcher"""
+        with self._condition:
+            self._closed = True
+            for job in list(self._queue) + list(self._running):
+                if job.status in PENDING:
+                    self._finish(job, CANCELLED)
+            self._queue.clear()
+        self._wake()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        for job in list(self._running):
+            self._running[job][0].kill()
+            self._collect(job)
+
+    # Dispatcher
+    def _start_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _wake(self):
+        self._wakeup_writer.send_bytes(b"")
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                while self._queue and len(self._running) < self.max_workers:
+                    self._start(self._queue.popleft())
+                connections = [connection for _, connection, _ in self._running.values()]
+                deadlines = [deadline for job, (_, _, deadline) in self._running.items() if job.status == RUNNING]
+            timeout = max(0.0, min(deadlines) - monotonic()) if deadlines else None
+            # A worker's connection becomes ready when it reports, or at EOF when it exits or is killed
+            ready = wait(connections + [self._wakeup_reader], timeout)
+            if self._wakeup_reader in ready:
+                while self._wakeup_reader.poll():
+                    self._wakeup_reader.recv_bytes()
+            with self._condition:
+                for job, (process, connection, deadline) in list(self._running.items()):
+                    if connection in ready:
+                        self._collect(job)
+                    elif job.status == RUNNING and monotonic() >= deadline:
+                        process.kill()
+                        self._finish(job, TIMED_OUT, f"exceeded the {job.timeout} s timeout")
+
+    def _start(self, job):
+        """Starts the worker of a job. A job that cannot be started fails, the dispatcher keeps running."""
+        reader = writer = None
+        try:
+            deadline = monotonic() + job.timeout
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            reader, writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=run_job, args=(self.kinds[job.kind], job.params, self.result_path(job.id), writer),
+                name=f"job-{job.id}", daemon=True,
+            )
+            process.start()
+        except Exception as e:
+            for connection in (reader, writer):
+                if connection is not None:
+                    connection.close()
+            self._finish(job, FAILED, f"{type(e).__name__}: {e}")
+            return
+        writer.close()
+        job.status = RUNNING
+        job.started_at = time()
+        self._running[job] = (process, reader, deadline)
+        self._condition.notify_all()
+
+    def _collect(self, job):
+        process, connection, _ = self._running.pop(job)
+        try:
+            status, error = connection.recv()
+        except EOFError:
+            status, error = FAILED, None
+        process.join()
+        connection.close()
+        if job.status != RUNNING:
+            return  # cancelled or timed out
+        if status == FAILED and error is None:
+            error = f"worker process exited with code {process.exitcode}"
+        self._finish(job, status, error)
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time()
+        self._condition.notify_all()
+
+
+job_manager = None
+
+
+def get_job_manager():
+    """The process-wide JobManager, created on first use"""
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager()
+    return job_manager
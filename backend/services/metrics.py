@@ -0,0 +1,248 @@
+"""Low overhead instrumentation: named spans timing the ingest, query, propagate and root_find stages, latency
+histograms and counters rendered in the Prometheus text format, and a sampling profiler for single requests.
+A span costs two perf_counter calls and one histogram update under a lock, and never formats its arguments.
+
+    with span("propagate"):
+        ...
+
+    @instrument("ingest")
+    def insert_tle(...):
+"""
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter as Tally, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from itertools import count
+from time import perf_counter
+
+# Upper bounds in seconds, from sub-millisecond index lookups to minutes long ingests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PROFILE_INTERVAL = 0.005  # seconds between samples
+MAX_PROFILES = 20  # finished profiles kept for /metrics/profiles/<id>
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations for each label set"""
+    type = "histogram"
+
+    def __init__(self, name, help_, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, value in zip(self.buckets + (float("inf"),), values):
+                cumulative += value
+                yield f"{self.name}_bucket", key + (("le", format_bound(bound)),), cumulative
+            yield f"{self.name}_sum", key, values[-1]
+            yield f"{self.name}_count", key, cumulative
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help_):
+        self.name = name
+        self.help = help_
+        self._series = Tally()
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] += value
+
+    def samples(self):
+        with self._lock:
+            series = dict(self._series)
+        for key, value in sorted(series.items()):
+            yield self.name, key, value
+
+
+class Registry:
+    """The metrics of the process, and collectors that report values owned elsewhere (e.g. cache sizes)"""
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_, buckets)
+
+    def counter(self, name, help_):
+        return self._get_or_create(Counter, name, help_)
+
+    def register_collector(self, collector):
+        """collector() returns [(name, type, help, value)] at every scrape"""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.type}"]
+            lines += [f"{name}{format_labels(labels)} {format_value(value)}" for name, labels, value in metric.samples()]
+        for collector in self.collectors:
+            for name, type_, help_, value in collector():
+                lines += [f"# HELP {name} {help_}", f"# TYPE {name} {type_}", f"{name} {format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args)
+            metric = self.metrics[name]
+        if not isinstance(metric, cls):
+            raise ValueError(f"metric {name} is a {metric.type}")
+        return metric
+
+
+registry = Registry()
+span_seconds = registry.histogram("orbitviz_span_duration_seconds", "Duration of instrumented stages")
+span_errors = registry.counter("orbitviz_span_errors_total", "Instrumented stages that raised")
+
+# Spans finished in this thread while a request collects them, for its Server-Timing header
+local = threading.local()
+
+
+@contextmanager
+def span(name):
+    """Times the block as the named stage. A stage nested in the same stage, e.g. bulk_insert_tle called by
+    insert_tle, is only timed once by the outermost span."""
+    active = getattr(local, "active", None)
+    if active is None:
+        active = local.active = set()
+    if name in active:
+        yield
+        return
+    active.add(name)
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        span_errors.inc(span=name)
+        raise
+    finally:
+        elapsed = perf_counter() - start
+        active.discard(name)
+        span_seconds.observe(elapsed, span=name)
+        timings = getattr(local, "timings", None)
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def instrument(name):
+    """Decorator form of span"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def collect_timings():
+    """Starts collecting the spans of this thread, returns the list they are appended to"""
+    local.timings = []
+    return local.timings
+
+
+def stop_collecting_timings():
+    timings = getattr(local, "timings", None) or []
+    local.timings = None
+    return timings
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread every interval seconds from a background thread.
+    The result is in the collapsed stack format of flame graph tools: "outer;inner;leaf count" per line."""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "".join(f"{stack} {samples}\n" for stack, samples in self.stacks.most_common())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """The last MAX_PROFILES finished profiles by id"""
+
+    def __init__(self, max_profiles=MAX_PROFILES):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            profile_id = str(next(self._ids))
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,162 @@
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.api import app as api
+from backend.api.columnar import MIMETYPE, decode_columns
+from backend.models.models import Base
+from backend.services.database.catalog import catalog_version, latest_catalog
+from backend.services.database.database_operations import add_group_members, bulk_insert_tle, sync_group_membership
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(f"{ISS_NEW}\n{VANGUARD}", session=session)
+        bulk_insert_tle(ISS_OLD, session=session)
+    return engine
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(api, "Session", scoped_session(sessionmaker(bind=engine)))
+    api.response_cache.clear()
+    catalog_version.invalidate()
+    latest_catalog.invalidate()
+    return api.app.test_client()
+
+def test_keyset_pages_in_epoch_order(client):
+    seen = []
+    cursor = None
+    while True:
+        args = {"order": "epoch", "limit": 2, "fields": "satellite_number,epoch"}
+        if cursor:
+            args["cursor"] = cursor
+        page = client.get("/query", query_string=args).get_json()
+        seen += page["results"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [row["satellite_number"] for row in seen] == [5, 25544, 25544]
+    assert seen[1]["epoch"] == "2008-09-20T12:25:40.104192"
+    assert set(seen[0]) == {"satellite_number", "epoch"}
+
+def test_ndjson_stream(client):
+    response = client.get("/query", query_string={"format": "ndjson", "fields": "id,name"})
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[1]["name"] == "VANGUARD 1"
+
+def test_bad_options(client):
+    assert client.get("/query", query_string={"fields": "password"}).status_code == 400
+    assert client.get("/query", query_string={"cursor": "garbage"}).status_code == 400
+    assert client.get("/query", query_string={"limit": 0}).status_code == 400
+
+def test_etag_and_response_cache(client, engine):
+    args = {"fields": "id", "limit": 2}
+    first = client.get("/query", query_string=args)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    # Same query with the arguments in another order is served from the cache
+    hits = api.response_cache.hits
+    second = client.get("/query?limit=2&fields=id")
+    assert second.headers["ETag"] == etag and second.get_json() == first.get_json()
+    assert api.response_cache.hits == hits + 1
+    assert client.get("/query", query_string=args, headers={"If-None-Match": etag}).status_code == 304
+
+    # An ingest moves the catalog version and so the ETag
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(ISS_NEW.replace("08265", "08266").replace("2928", "2929"), session=session)
+    assert client.get("/query", query_string=args, headers={"If-None-Match": etag}).status_code == 200
+
+def test_group_membership_change_moves_the_etag(client, engine):
+    with sessionmaker(bind=engine)() as session:
+        add_group_members("stations", [25544, 5], session=session)
+        session.commit()
+    catalog_version.invalidate()
+    args = {"fields": "satellite_number", "order": "epoch"}
+    first = client.get("/query", json={"group": "stations"}, query_string=args)
+    assert [row["satellite_number"] for row in first.get_json()["results"]] == [5, 25544, 25544]
+
+    # Only membership rows change, no TLE is stored
+    with sessionmaker(bind=engine)() as session:
+        sync_group_membership("stations", [], session=session)
+        session.commit()
+    catalog_version.invalidate()
+    second = client.get("/query", json={"group": "stations"}, query_string=args, headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200 and second.get_json()["results"] == []
+
+def test_cache_is_bounded_by_bytes():
+    cache = api.ResponseCache(max_bytes=10, max_entry_bytes=6)
+    cache.put("a", b"12345", "application/json")
+    cache.put("b", b"12345", "application/json")
+    assert not cache.put("big", b"1234567", "application/json")
+    cache.get("a")
+    cache.put("c", b"123", "application/json")
+    assert cache.get("b") is None and cache.get("a") is not None and cache.size == 8
+
+def test_query_pages_as_columns(client):
+    response = client.get("/query", query_string={"fields": "id,name,epoch", "limit": 2}, headers={"Accept": MIMETYPE})
+    assert response.mimetype == MIMETYPE
+    columns, meta = decode_columns(response.get_data())
+    assert columns["id"].tolist() == [1, 2]
+    assert columns["name"].tolist() == ["ISS (ZARYA)", "VANGUARD 1"]
+    assert str(columns["epoch"][0]) == "2008-09-21T12:25:40.104192"
+    assert meta["next_cursor"] == client.get("/query", query_string={"fields": "id,name,epoch", "limit": 2}).get_json()["next_cursor"]
+
+def test_catalog_formats(client):
+    as_json = client.get("/catalog", query_string={"fields": "satellite_number,epoch"}).get_json()
+    body = client.get("/catalog", query_string={"fields": "satellite_number,epoch", "format": "columns"}).get_data()
+    columns, meta = decode_columns(body)
+    assert meta["version"] == as_json["version"]
+    assert columns["satellite_number"].tolist() == as_json["columns"]["satellite_number"] == [5, 25544]
+    assert np.datetime_as_string(columns["epoch"], unit="us").tolist() == as_json["columns"]["epoch"]
+    assert client.get("/catalog", query_string={"format": "xml"}).status_code == 400
+
+def test_filters(client):
+    def satellite_numbers(filters):
+        response = client.get("/query", json=filters, query_string={"fields": "satellite_number"})
+        return [row["satellite_number"] for row in response.get_json()["results"]]
+    assert satellite_numbers({"epoch": {"<": "2008-09-21T00:00:00"}}) == [5, 25544]
+    assert satellite_numbers({"satellite_number": {"in": [25544]}, "element_number": {">=": 292}}) == [25544, 25544]
+    response = client.get("/query", json={"inclination": {"~": 1}})
+    assert response.status_code == 400 and "operator" in response.get_json()["error"]
+
+def test_request_metrics_and_profile(client, monkeypatch):
+    monkeypatch.setitem(api.app.config, "PROFILE_REQUESTS", True)
+    response = client.get("/query", json={"satellite_number": {"==": 5}}, headers={"X-Profile": "1"})
+    assert "query;dur=" in response.headers["Server-Timing"]
+    assert client.get(f"/metrics/profiles/{response.headers['X-Profile-Id']}").status_code == 200
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'orbitviz_http_requests_total{endpoint="/query",method="GET",status="200"}' in text
+    assert 'orbitviz_span_duration_seconds_count{span="query"}' in text
+    assert "orbitviz_response_cache_misses_total" in text
+
+def test_catalog_states(client):
+    args = {"start": "2008-09-21T12:00:00", "step": 60, "count": 3}
+    body = client.get("/catalog/states", query_string=dict(args, format="columns")).get_data()
+    columns, meta = decode_columns(body)
+    assert columns["satellite_number"].tolist() == [5, 25544]
+    assert columns["position"].shape == (2, 3, 3) and columns["error"].tolist() == [[0, 0, 0], [0, 0, 0]]
+    assert meta["frame"] == "TEME" and meta["count"] == 3
+
+    as_json = client.get("/catalog/states", query_string=dict(args, satellites="25544")).get_json()
+    assert as_json["times"][1] == "2008-09-21T12:01:00.000000"
+    np.testing.assert_allclose(as_json["positions"][0], columns["position"][1])
+    assert client.get("/catalog/states", query_string={"count": 3}).status_code == 400
+    assert client.get("/catalog/states", query_string=dict(args, count=10**7)).status_code == 400
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base
+from backend.services.database.archive import ElementArchive
+from backend.services.database.database_operations import bulk_insert_tle, ingest_hooks, register_ingest_hook
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+def new_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ElementArchive(str(tmp_path / "elements"))
+    register_ingest_hook(archive.sync)
+    yield archive
+    ingest_hooks.remove(archive.sync)
+
+def test_incremental_sync_and_reads(archive):
+    session = new_session()
+    bulk_insert_tle(f"{ISS_NEW}\n{VANGUARD}", session=session)
+    bulk_insert_tle(ISS_OLD, session=session)
+    assert archive.manifest["rows"] == 3
+
+    history = archive.history(25544)
+    assert isinstance(history, np.memmap)
+    assert list(history["epoch"].astype("M8[D]").astype(str)) == ["2008-09-20", "2008-09-21"]
+    assert len(archive.history(25544, start="2008-09-21")) == 1
+    assert sorted(archive.range(0, 30000)["satellite_number"]) == [5, 25544, 25544]
+    assert archive.sync(session) == 0
+
+def test_load_into_database(archive):
+    source = new_session()
+    bulk_insert_tle(f"{ISS_OLD}\n{ISS_NEW}\n{VANGUARD}", session=source)
+    target = new_session()
+    loaded = sum(bulk_insert_tle(batch, session=target).inserted for batch in archive.to_batches())
+    assert loaded == 3
@@ -0,0 +1,89 @@
+import gzip
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base, TLE, Satellite, Group
+from backend.models.tle_batch import TLEBatch
+from backend.services.database.database_operations import (
+    bulk_insert_tle, insert_tle, new_checkpoint, save_checkpoint, stream_insert_tle, sync_group_membership,
+)
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+def latest_epochs(session):
+    return {
+        sat.satellite_number: tle.epoch
+        for sat, tle in session.query(Satellite, TLE).join(TLE, Satellite.latest_tle_id == TLE.id)
+    }
+
+def test_duplicates_are_skipped(session):
+    assert bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session)[:2] == (2, None)
+    assert bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session).inserted == 0
+    assert session.query(TLE).count() == 2
+    assert session.query(Satellite).count() == 2
+
+def test_latest_tle_is_updated(session):
+    bulk_insert_tle(ISS_NEW, session=session)
+    bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session)
+    assert latest_epochs(session)[25544].day == 21
+    bulk_insert_tle(ISS_NEW, session=session)
+    assert session.query(TLE).count() == 3
+
+def test_group_membership(session):
+    bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session, group="visual")
+    bulk_insert_tle(ISS_NEW, session=session, group="visual")
+    group = session.query(Group).filter_by(name="visual").one()
+    assert sorted(sat.satellite_number for sat in group.satellites) == [5, 25544]
+
+def test_stream_insert_resumes_from_checkpoint(session, tmp_path):
+    archive = tmp_path / "history.gz"
+    with gzip.open(archive, "wt") as f:
+        f.write("\n".join([ISS_OLD, VANGUARD, ISS_OLD, ISS_NEW]) + "\n")
+    checkpoint_path = str(tmp_path / "history.checkpoint.json")
+
+    chunks = TLEBatch.iter_file(str(archive), chunk_size=3)
+    first_batch, offset, line_number = next(chunks)
+    assert len(first_batch) == 1
+    bulk_insert_tle(first_batch, session=session)
+    save_checkpoint(checkpoint_path, {**new_checkpoint(str(archive)), "offset": offset, "line_number": line_number})
+
+    summary = stream_insert_tle(str(archive), session=session, chunk_size=3, checkpoint_path=checkpoint_path)
+    assert summary["complete"]
+    assert (summary["records"], summary["inserted"]) == (3, 2)
+    assert session.query(TLE).count() == 3
+    assert latest_epochs(session)[25544].day == 21
+    assert stream_insert_tle(str(archive), session=session, checkpoint_path=checkpoint_path)["inserted"] == 2
+
+def test_group_sync_replaces_members(session):
+    assert bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session, group="visual", sync_group=True)[:2] == (2, ("visual", [5, 25544], []))
+    assert bulk_insert_tle(ISS_NEW, session=session, group="visual", sync_group=True)[:2] == (1, ("visual", [], [5]))
+    group = session.query(Group).filter_by(name="visual").one()
+    assert [sat.satellite_number for sat in group.satellites] == [25544]
+    assert sync_group_membership("visual", [5, 25544], session=session) == ("visual", [5], [])
+    # An empty member list empties the group
+    assert bulk_insert_tle("", session=session, group="visual", sync_group=True) == (0, ("visual", [], [5, 25544]), [])
+    assert insert_tle("", session=session, group="visual", sync_group=True) == (0, ("visual", [], []), [])
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_parse_errors_reach_the_caller(session, tmp_path, bulk):
+    path = tmp_path / "tles.txt"
+    path.write_text(f"{ISS_OLD}\ngarbage\n{VANGUARD}\n")
+    result = insert_tle(str(path), session=session, bulk=bulk)
+    assert result.inserted == 2
+    assert [error.line_number for error in result.errors] == [4]
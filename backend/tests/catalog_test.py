@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base
+from backend.services.database.catalog import LatestCatalog
+from backend.services.database.database_operations import bulk_insert_tle, insert_tle
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+def test_snapshot_reloads_changed_rows(session):
+    catalog = LatestCatalog(check_interval=3600)
+    bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session)
+    snapshot = catalog.get(session)
+    assert len(snapshot) == 2
+    assert snapshot.get(25544)["epoch"].astype(object).day == 20
+    assert catalog.get(session) is snapshot  # no version check within the interval
+
+    insert_tle(ISS_NEW, session=session)
+    catalog.invalidate()
+    assert catalog.refresh(session) == 1
+    snapshot = catalog.get(session)
+    assert snapshot.version > 0 and len(snapshot) == 2
+    assert snapshot.get(25544)["epoch"].astype(object).day == 21
+    assert snapshot.get(1) is None and 5 in snapshot
+    assert snapshot.take([25544, 1, 5])["satellite_number"].tolist() == [25544, 5]
+
+    # An older TLE does not change the latest one
+    bulk_insert_tle(ISS_OLD.replace("08264", "08263").replace("2927", "2926"), session=session)
+    assert catalog.refresh(session) == 0
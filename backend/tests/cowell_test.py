@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from backend.models.tle_batch import TLEBatch
+from backend.services.calculations import cowell
+from backend.services.calculations.propagation import CatalogPropagator
+
+ISS = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+
+def circular(radius, inclination):
+    speed = np.sqrt(cowell.MU / radius)
+    return np.array([radius, 0, 0, 0, speed * np.cos(inclination), speed * np.sin(inclination)])
+
+def test_two_body_returns_after_one_period():
+    state = circular(7000.0, 0.5)
+    period = 2 * np.pi * np.sqrt(7000.0 ** 3 / cowell.MU)
+    errors, positions, velocities = cowell.propagate(state, [0, period / 4, period], rtol=1e-12, atol=1e-9, j2=False)
+    assert not errors.any()
+    np.testing.assert_array_equal(positions[0, 0], state[:3])
+    np.testing.assert_allclose(positions[0, 1], [0, 7000 * np.cos(0.5), 7000 * np.sin(0.5)], atol=1e-6)
+    np.testing.assert_allclose(positions[0, 2], state[:3], atol=1e-6)
+    np.testing.assert_allclose(velocities[0, 2], state[3:], atol=1e-9)
+
+def test_j2_node_regression():
+    radius, inclination = 7000.0, np.radians(60)
+    seconds = np.linspace(0, 86400, 1441)
+    _, positions, velocities = cowell.propagate(circular(radius, inclination), seconds)
+    normal = np.cross(positions[0, -1], velocities[0, -1])
+    node = np.arctan2(normal[0], -normal[1])
+    # Secular rate of the right ascension of the ascending node
+    expected = -1.5 * np.sqrt(cowell.MU / radius ** 3) * cowell.J2 * (cowell.EARTH_RADIUS / radius) ** 2 * np.cos(inclination) * 86400
+    assert node == pytest.approx(expected, rel=0.02)
+
+def test_batch_matches_single_orbits_with_their_tolerances():
+    states = np.array([circular(7000.0, 0.5), circular(8000.0, 1.0), circular(7000.0, 0.5)])
+    seconds = np.arange(0, 20000, 90.0)
+    rtol = [1e-12, 1e-9, 1e-6]
+    errors, positions, _ = cowell.propagate(states, seconds, rtol=rtol)
+    assert not errors.any()
+    for row in range(3):
+        _, single, _ = cowell.propagate(states[row], seconds, rtol=rtol[row])
+        np.testing.assert_array_equal(positions[row], single[0])
+    loose_error = np.linalg.norm(positions[2] - positions[0], axis=1).max()
+    assert 1e-6 < loose_error < 10
+
+def test_dense_output_matches_integrating_to_the_time():
+    state = circular(7000.0, 0.5)
+    _, dense, _ = cowell.propagate(state, np.arange(0, 5000, 7.0), rtol=1e-11)
+    _, direct, _ = cowell.propagate(state, [0, 4998.0], rtol=1e-11)
+    np.testing.assert_allclose(dense[0, -1], direct[0, -1], atol=1e-5)
+
+def semi_major_axis(positions, velocities):
+    energy = (velocities ** 2).sum(axis=-1) / 2 - cowell.MU / np.linalg.norm(positions, axis=-1)
+    return -cowell.MU / (2 * energy)
+
+def test_drag_and_decay():
+    state = circular(cowell.EARTH_RADIUS + 300, 0.5)
+    seconds = np.arange(0, 86400, 600.0)
+    _, positions, velocities = cowell.propagate(state, seconds, j2=False)
+    _, drag_positions, drag_velocities = cowell.propagate(state, seconds, j2=False, ballistic_coefficients=0.02)
+    assert semi_major_axis(positions[0, -1], velocities[0, -1]) == pytest.approx(6678.137)
+    # About 2 km per day at 300 km
+    decay = 6678.137 - semi_major_axis(drag_positions[0, -1], drag_velocities[0, -1])
+    assert 1 < decay < 4
+    errors, positions, _ = cowell.propagate(state, seconds * 100, ballistic_coefficients=1.0)
+    assert errors[0, -1] == 3 and np.isnan(positions[0, -1]).all()
+
+def test_initial_states_from_elements():
+    elements = TLEBatch.from_lines(ISS.splitlines()).data
+    time = np.datetime64("2008-09-20T12:00", "us")
+    states = cowell.initial_states(elements, time)
+    expected = CatalogPropagator(elements).propagate(time)
+    np.testing.assert_allclose(states[:, :3], expected.positions[:, 0])
+    _, positions, _ = cowell.propagate(states, [0, 600.0])
+    # Close to SGP4 over a few minutes
+    later = CatalogPropagator(elements).propagate(time + np.timedelta64(600, "s"))
+    assert np.linalg.norm(positions[0, 1] - later.positions[0, 0]) < 5
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        cowell.propagate(np.zeros((2, 3)), [0, 1])
+    with pytest.raises(ValueError):
+        cowell.propagate(circular(7000.0, 0), [10, 5])
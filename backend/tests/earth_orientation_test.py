@@ -0,0 +1,39 @@
+import erfa
+import numpy as np
+import pytest
+from backend.services.calculations.earth_orientation import EarthOrientation, julian_dates, rotation_z
+
+TIMES = np.datetime64("2024-03-01", "us") + (np.random.default_rng(0).uniform(0, 10 * 86400, 2000) * 1e6).astype("m8[us]")
+
+def terrestrial_time(times):
+    return erfa.taitt(*erfa.utctai(*julian_dates(times)))
+
+def test_iau2006_matches_erfa():
+    dut1, xp, yp = -0.2, 1e-6, 2e-6
+    orientation = EarthOrientation(TIMES, dut1=dut1, xp=xp, yp=yp)
+    jd, fr = julian_dates(TIMES)
+    expected = erfa.c2t06a(*terrestrial_time(TIMES), jd, fr + dut1 / 86400, xp, yp)
+    assert np.abs(orientation.matrices - expected).max() < 1e-10
+
+def test_gmst_matches_iau2006_for_teme():
+    position = np.array([7000.0, 100.0, 50.0])
+    # The same point in TEME: GCRS to the true equator and equinox of date, then to the mean equinox
+    tt = terrestrial_time(TIMES)
+    teme = rotation_z(erfa.ee06a(*tt)) @ erfa.pnm06a(*tt) @ position
+    gmst = EarthOrientation(TIMES, "gmst").to_earth_fixed(teme)
+    iau2006 = EarthOrientation(TIMES).to_earth_fixed(np.broadcast_to(position, (len(TIMES), 3)))
+    assert np.linalg.norm(gmst - iau2006, axis=1).max() < 5e-7 * 7000
+
+def test_batched_stations_and_round_trip():
+    orientation = EarthOrientation(TIMES[:10])
+    stations = np.array([[6378.0, 0, 0], [0, 0, 6357.0]])
+    inertial = orientation.to_inertial(stations[:, None])
+    assert inertial.shape == (2, 10, 3)
+    np.testing.assert_allclose(np.linalg.norm(inertial, axis=2), [[6378.0] * 10, [6357.0] * 10])
+    np.testing.assert_allclose(orientation.to_earth_fixed(inertial), np.broadcast_to(stations[:, None], (2, 10, 3)), atol=1e-9)
+    # A scalar time gives one matrix
+    np.testing.assert_array_equal(EarthOrientation(TIMES[3]).matrices[0], EarthOrientation(TIMES[:10]).matrices[3])
+
+def test_unknown_tier():
+    with pytest.raises(ValueError):
+        EarthOrientation(TIMES, "fk5")
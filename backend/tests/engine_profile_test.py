@@ -0,0 +1,43 @@
+import gc
+import weakref
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from backend.models.models import Base
+from backend.services.database.database_utils import db_session, get_engine, get_scoped_session
+
+def test_file_engine_profile(tmp_path):
+    db_uri = f"sqlite:///{tmp_path / 'profile.sqlite'}"
+    engine = get_engine(db_uri)
+    assert get_engine(db_uri) is engine
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+    readonly = get_engine(db_uri, readonly=True)
+    assert readonly is not engine
+    with readonly.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM tles")).scalar() == 0
+        with pytest.raises(OperationalError):
+            connection.execute(text("DELETE FROM tles"))
+
+def test_scoped_session_is_shared_per_thread(tmp_path):
+    db_uri = f"sqlite:///{tmp_path / 'scoped.sqlite'}"
+    Base.metadata.create_all(get_engine(db_uri))
+    Session = get_scoped_session(db_uri, readonly=True)
+    assert Session() is Session()
+    Session.remove()
+
+def test_session_factories_are_reused_but_not_kept():
+    engine = create_engine("sqlite://")
+    with db_session(engine) as first, db_session(engine) as second:
+        assert first is not second and first.get_bind() is engine
+        assert type(first) is type(second)
+    engine_ref = weakref.ref(engine)
+    del engine, first, second
+    gc.collect()
+    assert engine_ref() is None
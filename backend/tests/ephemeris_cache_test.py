@@ -0,0 +1,78 @@
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base
+from backend.models.tle_batch import TLEBatch
+from backend.services.calculations.ephemeris_cache import EphemerisCache, orbit_hash
+from backend.services.calculations.propagation import CatalogPropagator, time_grid
+from backend.services.database.database_operations import bulk_insert_tle
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+def elements(tle):
+    return TLEBatch.from_lines(tle.splitlines()).data[0]
+
+def test_hit_matches_propagation(tmp_path):
+    cache = EphemerisCache(str(tmp_path))
+    iss = elements(ISS_OLD)
+    first = cache.propagate(iss, "2008-09-20T12:00", 60, 100)
+    second = cache.propagate(iss, "2008-09-20T12:00", 60, 100)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert isinstance(second.positions, np.memmap) and not second.positions.flags.writeable
+    expected = CatalogPropagator(iss[None]).propagate(time_grid("2008-09-20T12:00", 60, 100))
+    np.testing.assert_array_equal(second.positions, expected.positions)
+    np.testing.assert_array_equal(first.velocities, second.velocities)
+    assert (second.times == expected.times).all()
+    # The orbit hash does not depend on the record type
+    assert orbit_hash(iss) == orbit_hash({name: iss[name].item() for name in iss.dtype.names})
+
+def test_lru_eviction(tmp_path):
+    cache = EphemerisCache(str(tmp_path))
+    iss, vanguard = elements(ISS_OLD), elements(VANGUARD)
+    cache.propagate(iss, "2008-09-20", 60, 100)
+    entry_bytes = cache.size
+    cache.propagate(vanguard, "2008-09-20", 60, 100)
+    past = time.time() - 100
+    for key, _, _ in cache.entries():
+        os.utime(os.path.join(cache.root, key, "meta.json"), (past, past))
+    cache.propagate(iss, "2008-09-20", 60, 100)  # hit, now the most recently used
+    cache.max_bytes = 2 * entry_bytes
+    cache.propagate(iss, "2008-09-21", 60, 100)
+    assert sorted(meta["satellite_number"] for _, meta, _ in cache.entries()) == [25544, 25544]
+
+def test_index_is_read_from_disk_once(tmp_path, monkeypatch):
+    cache = EphemerisCache(str(tmp_path))
+    cache.propagate(elements(ISS_OLD), "2008-09-20", 60, 100)
+    other = EphemerisCache(str(tmp_path), max_bytes=cache.size)
+    scans = []
+    entries = other.entries
+    monkeypatch.setattr(other, "entries", lambda: scans.append(1) or entries())
+    other.propagate(elements(VANGUARD), "2008-09-20", 60, 100)  # seeds the index, then evicts the ISS entry
+    other.propagate(elements(VANGUARD), "2008-09-21", 60, 100)
+    assert len(scans) == 1
+    assert [meta["satellite_number"] for _, meta, _ in entries()] == [5]
+    assert other.size <= other.max_bytes
+
+def test_newer_tle_invalidates(tmp_path):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    cache = EphemerisCache(str(tmp_path))
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session)
+        cache.propagate(elements(ISS_OLD), "2008-09-20", 60, 10, tle_id=1)
+        cache.propagate(elements(VANGUARD), "2008-09-20", 60, 10)
+        assert cache.invalidate(session) == []
+        bulk_insert_tle(ISS_NEW, session=session)
+        assert len(cache.invalidate(session)) == 1
+    assert [meta["satellite_number"] for _, meta, _ in cache.entries()] == [5]
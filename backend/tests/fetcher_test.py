@@ -0,0 +1,98 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from backend.services.data_fetching.fetcher import ValidatorStore, fetch_and_ingest, fetch_sources, make_session
+
+BODIES = {"/stations": "STATIONS\n", "/visual": "VISUAL\n"}
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+    failures_left = {}
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        if self.failures_left.get(self.path, 0) > 0:
+            self.failures_left[self.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path not in BODIES:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hash(BODIES[self.path])}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = BODIES[self.path].encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    StubHandler.requests_seen = []
+    StubHandler.failures_left = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+def sources(server, tmp_path, groups=("stations", "visual")):
+    return [(group, f"{server}/{group}", str(tmp_path / f"{group}.txt")) for group in groups]
+
+def test_conditional_requests(server, tmp_path):
+    validators = ValidatorStore(str(tmp_path / "validators.json"))
+    first = {r.group: r.status for r in fetch_sources(sources(server, tmp_path), validators)}
+    assert first == {"stations": "updated", "visual": "updated"}
+    assert (tmp_path / "stations.txt").read_text() == "STATIONS\n"
+
+    # Validators are persisted, so a new store sends conditional requests
+    validators = ValidatorStore(str(tmp_path / "validators.json"))
+    second = {r.group: r.status for r in fetch_sources(sources(server, tmp_path), validators)}
+    assert second == {"stations": "not_modified", "visual": "not_modified"}
+
+def test_skip_existing_without_update(server, tmp_path):
+    (tmp_path / "stations.txt").write_text("OLD\n")
+    results = {r.group: r.status for r in fetch_sources(sources(server, tmp_path), update=False)}
+    assert results == {"stations": "skipped", "visual": "updated"}
+    assert "/stations" not in StubHandler.requests_seen
+
+def test_retry_and_failure(server, tmp_path):
+    StubHandler.failures_left = {"/stations": 1}
+    session = make_session(pool_size=2, retries=2, backoff_factor=0)
+    results = {r.group: r for r in fetch_sources(sources(server, tmp_path, ("stations", "missing")), session=session)}
+    assert results["stations"].status == "updated"
+    assert StubHandler.requests_seen.count("/stations") == 2
+    assert results["missing"].status == "failed"
+
+def test_pipeline_ingests_updated_groups(server, tmp_path):
+    ingested = []
+    def ingest(filepath, group):
+        if group == "visual":
+            raise ValueError("bad file")
+        ingested.append(group)
+    results = {r.group: r.status for r in fetch_and_ingest(sources(server, tmp_path), ingest)}
+    assert ingested == ["stations"]
+    assert results == {"stations": "updated", "visual": "ingest_failed"}
+
+def test_failed_ingest_is_downloaded_again(server, tmp_path):
+    validators = ValidatorStore(str(tmp_path / "validators.json"))
+    def failing(filepath, group):
+        raise ValueError("database is locked")
+    first = {r.group: r.status for r in fetch_and_ingest(sources(server, tmp_path), failing, validators=validators)}
+    assert first == {"stations": "ingest_failed", "visual": "ingest_failed"}
+
+    ingested = []
+    validators = ValidatorStore(str(tmp_path / "validators.json"))
+    second = {r.group: r.status for r in fetch_and_ingest(sources(server, tmp_path), lambda filepath, group: ingested.append(group), validators=validators)}
+    assert second == {"stations": "updated", "visual": "updated"}
+    assert sorted(ingested) == ["stations", "visual"]
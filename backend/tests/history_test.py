@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base
+from backend.services.database.archive import ElementArchive
+from backend.services.database.database_operations import bulk_insert_tle
+from backend.services.database.history import as_of_index, elements_at
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(f"{ISS_OLD}\n{ISS_NEW}\n{VANGUARD}", session=session)
+        yield session
+
+def test_database_and_archive_agree(session, tmp_path):
+    archive = ElementArchive(str(tmp_path / "elements"))
+    archive.sync(session)
+    satellite_numbers = [25544, 25544, 25544, 25544, 5, 5, 1]
+    times = np.array([
+        "2008-09-20T00:00", "2008-09-20T12:25:40.104192", "2008-09-21T00:00", "2030-01-01",
+        "2000-06-27T00:00", "2000-06-28T00:00", "2010-01-01",
+    ], dtype="M8[us]")
+    for source in [None, archive]:
+        batch, found = elements_at(satellite_numbers, times, session=session, archive=source)
+        assert found.tolist() == [False, True, True, True, False, True, False]
+        assert batch["element_number"][found].tolist() == [292, 292, 292, 475]
+        assert batch["epoch"][3].astype(object).day == 21
+
+def test_as_of_index():
+    history_satellite_numbers = np.array([1, 1, 1, 3, 3])
+    history_epochs = np.array([10, 20, 30, 5, 15])
+    satellite_numbers = np.array([1, 1, 1, 1, 2, 3, 3, 4])
+    times = np.array([9, 10, 25, 99, 50, 4, 15, 1])
+    assert as_of_index(history_satellite_numbers, history_epochs, satellite_numbers, times).tolist() == [-1, 0, 1, 2, -1, -1, 4, -1]
+
+def test_large_batches_read_the_default_archive_when_current(session, tmp_path, monkeypatch):
+    from backend.services.database import history
+    archive = ElementArchive(str(tmp_path / "elements"))
+    monkeypatch.setattr(history, "default_archive", archive)
+    monkeypatch.setattr(history, "ARCHIVE_MIN_PAIRS", 2)
+    calls = []
+    monkeypatch.setattr(history, "archive_elements_at", lambda *args: calls.append(args) or (None, None))
+    times = np.array(["2008-09-21T00:00", "2000-06-28T00:00"], dtype="M8[us]")
+    batch, found = elements_at([25544, 5], times, session=session)  # archive behind the database
+    assert not calls and found.tolist() == [True, True]
+    archive.sync(session)
+    elements_at([25544, 5], times, session=session)
+    elements_at([25544, 5], times, session=session, archive=False)
+    assert len(calls) == 1
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from backend.models.tle_batch import TLEBatch
+from backend.services.calculations import visibility
+from backend.services.calculations.ephemeris_cache import EphemerisCache
+from backend.services.calculations.interpolation import ChebyshevEphemeris
+from backend.services.calculations.propagation import CatalogPropagator
+
+ISS = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+def elements(tle):
+    return TLEBatch.from_lines(tle.splitlines()).data[0]
+
+@pytest.mark.parametrize("tle, start", [(ISS, "2008-09-20T12:00"), (VANGUARD, "2000-06-28")])
+def test_matches_sgp4_on_dense_grid(tle, start):
+    ephemeris = ChebyshevEphemeris.from_elements(elements(tle), start, 86400.0)
+    assert ephemeris.max_error_km <= 1e-3
+    times = np.datetime64(start, "us") + np.arange(0, 86400, 7) * np.timedelta64(1, "s")
+    expected = CatalogPropagator(elements(tle)[None]).propagate(times)
+    positions, velocities = ephemeris.evaluate(times)
+    assert np.linalg.norm(positions - expected.positions[0], axis=1).max() < 1e-3
+    assert np.linalg.norm(velocities - expected.velocities[0], axis=1).max() < 1e-2
+    # Much smaller than the states at 60 second steps
+    assert ephemeris.nbytes < 86400 // 60 * 48
+
+def test_unsorted_times_and_round_trip():
+    ephemeris = ChebyshevEphemeris.from_elements(elements(ISS), "2008-09-20T12:00", 6 * 3600.0)
+    seconds = np.random.default_rng(0).uniform(0, ephemeris.duration_seconds, 1000)
+    positions, velocities = ephemeris.evaluate_seconds(seconds)
+    order = np.argsort(seconds)
+    sorted_positions, _ = ephemeris.evaluate_seconds(seconds[order])
+    np.testing.assert_array_equal(positions[order], sorted_positions)
+    restored = ChebyshevEphemeris.from_arrays(ephemeris.to_arrays())
+    assert restored.start == ephemeris.start and restored.max_error_km == ephemeris.max_error_km
+    np.testing.assert_array_equal(restored.evaluate_seconds(seconds)[1], velocities)
+
+def test_outside_span():
+    ephemeris = ChebyshevEphemeris.from_elements(elements(ISS), "2008-09-20T12:00", 3600.0)
+    with pytest.raises(ValueError):
+        ephemeris.evaluate(np.array(["2008-09-20T11:59"], dtype="M8[us]"))
+    with pytest.raises(ValueError):
+        ephemeris.evaluate_seconds([3601.0])
+
+def test_scalar_position_and_visibility_refinement(tmp_path, monkeypatch):
+    ephemeris = ChebyshevEphemeris.from_elements(elements(ISS), "2008-09-20T12:00", 86400.0)
+    seconds = np.linspace(0, 86400, 101)
+    np.testing.assert_allclose([ephemeris.position(second) for second in seconds], ephemeris.evaluate_seconds(seconds)[0], atol=1e-9)
+    with pytest.raises(ValueError):
+        ephemeris.position(-1.0)
+
+    cache = EphemerisCache(str(tmp_path))
+    monkeypatch.setattr(visibility, "get_ephemeris_cache", lambda: cache)
+    passes = visibility.visibility_intervals(elements(ISS), 52.0, 4.0, start="2008-09-20T12:00")["passes"]
+    assert passes
+    # Refined with SGP4 when the fit fails
+    def fail(*args, **kwargs):
+        raise ValueError("propagation failed")
+    monkeypatch.setattr(ChebyshevEphemeris, "from_elements", fail)
+    expected = visibility.visibility_intervals(elements(ISS), 52.0, 4.0, start="2008-09-20T12:00")["passes"]
+    assert len(passes) == len(expected)
+    for actual, reference in zip(passes, expected):
+        for bound in ("rise", "set"):
+            difference = np.datetime64(actual[bound]) - np.datetime64(reference[bound])
+            assert abs(difference) <= np.timedelta64(1, "ms")
@@ -0,0 +1,115 @@
+import json
+import time
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.api import app as api
+from backend.models.models import Base
+from backend.services import jobs
+from backend.services.calculations import ephemeris_cache
+from backend.services.calculations.ephemeris_cache import EphemerisCache
+from backend.services.database.catalog import latest_catalog
+from backend.services.database.database_operations import bulk_insert_tle
+from backend.services.jobs import JobManager
+
+ISS = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+
+KINDS = {
+    "sleep": "backend.tests.jobs_test:sleep",
+    "fail": "backend.tests.jobs_test:fail",
+    "visibility": jobs.JOB_KINDS["visibility"],
+}
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return {"slept": seconds}
+
+def fail():
+    raise RuntimeError("no luck")
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(max_workers=2, jobs_dir=str(tmp_path), kinds=KINDS)
+    yield manager
+    manager.shutdown()
+
+def test_result_is_persisted_and_deduplicated(manager, tmp_path):
+    job = manager.submit("sleep", {"seconds": 0.2})
+    assert manager.submit("sleep", {"seconds": 0.2}) is job
+    assert manager.wait(job.id, timeout=10).status == jobs.SUCCEEDED
+    assert manager.result(job.id) == {"slept": 0.2}
+
+    restarted = JobManager(jobs_dir=str(tmp_path), kinds=KINDS)
+    assert restarted.submit("sleep", {"seconds": 0.2}).status == jobs.SUCCEEDED
+    assert restarted.result(job.id) == {"slept": 0.2}
+
+def test_failure_timeout_and_cancel(manager):
+    failed = manager.submit("fail", {})
+    timed_out = manager.submit("sleep", {"seconds": 30}, timeout=0.5)
+    cancelled = manager.submit("sleep", {"seconds": 31})
+    queued = manager.submit("sleep", {"seconds": 32})
+    manager.cancel(queued.id)
+    assert queued.status == jobs.CANCELLED
+
+    assert manager.wait(failed.id, timeout=10).error == "RuntimeError: no luck"
+    assert manager.wait(timed_out.id, timeout=10).status == jobs.TIMED_OUT
+    manager.cancel(cancelled.id)
+    assert cancelled.status == jobs.CANCELLED
+    assert [state["status"] for state in manager.watch(cancelled.id)] == [jobs.CANCELLED]
+
+def test_invalid_timeout_and_unstartable_job(manager):
+    for timeout in ["5", 0, -1, float("nan"), True]:
+        with pytest.raises(ValueError):
+            manager.submit("sleep", {"seconds": 0.1}, timeout)
+    busy = [manager.submit("sleep", {"seconds": 0.5 + i}) for i in range(2)]
+    broken = manager.submit("sleep", {"seconds": 0.1})
+    broken.timeout = "5"  # queued behind the busy workers, fails when the dispatcher starts it
+    assert all(manager.wait(job.id, timeout=10).status == jobs.SUCCEEDED for job in busy)
+    assert manager.wait(broken.id, timeout=10).status == jobs.FAILED
+    # The dispatcher survives it
+    assert manager.wait(manager.submit("sleep", {"seconds": 0.2}).id, timeout=10).status == jobs.SUCCEEDED
+
+def test_visibility_job_through_the_api(manager, monkeypatch, tmp_path):
+    # Forked workers inherit the cache, so nothing is written to data/cache/ephemerides
+    monkeypatch.setattr(ephemeris_cache, "ephemeris_cache", EphemerisCache(str(tmp_path / "ephemerides")))
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(ISS, session=session)
+    monkeypatch.setattr(api, "Session", scoped_session(sessionmaker(bind=engine)))
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    latest_catalog.invalidate()
+    client = api.app.test_client()
+
+    params = {"satellite_number": 25544, "latitude": 60.17, "longitude": 24.94, "start": "2008-09-20T12:00:00"}
+    response = client.post("/jobs", json={"kind": "visibility", "params": params})
+    assert response.status_code == 202
+    job_id = response.get_json()["id"]
+    events = client.get(f"/jobs/{job_id}/events").get_data(as_text=True)
+    last_event = events.strip().split("\n\n")[-1]
+    assert last_event.startswith("data: ")
+    assert json.loads(last_event[len("data: "):])["status"] == jobs.SUCCEEDED
+
+    result = client.get(f"/jobs/{job_id}/result").get_json()
+    assert result["satellite_number"] == 25544
+    assert result["passes"]
+    for visible in result["passes"]:
+        assert visible["rise"] < visible["set"]
+        assert visible["max_elevation_deg"] >= 10
+
+    # Without start the window starts now, not at the start of a persisted earlier result
+    before = np.datetime64("now", "s")
+    later_id = client.post("/jobs", json={"kind": "visibility", "params": dict(params, start=None)}).get_json()["id"]
+    assert later_id != job_id
+    assert before <= np.datetime64(manager.get(later_id).params["start"]) <= np.datetime64("now", "s")
+    manager.cancel(later_id)
+
+    assert client.post("/jobs", json={"kind": "nope", "params": {}}).status_code == 400
+    assert client.post("/jobs", json={"kind": "visibility", "params": params, "timeout": "5"}).status_code == 400
+    assert client.post("/jobs", json={"kind": "visibility", "params": {"satellite_number": 1}}).status_code == 400
+    assert client.get("/jobs/unknown").status_code == 404
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+from backend.services.metrics import Registry, SamplingProfiler, span, span_seconds
+
+def test_histogram_render():
+    registry = Registry()
+    histogram = registry.histogram("stage_seconds", "Stage durations", buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 3.0]:
+        histogram.observe(value, span="query")
+    registry.counter("events_total", "Events").inc(2, kind='a "quoted" kind')
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{span="query",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{span="query",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{span="query",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{span="query"} 4' in lines
+    assert 'stage_seconds_sum{span="query"} 3.65' in lines
+    assert 'events_total{kind="a \\"quoted\\" kind"} 2' in lines
+    with pytest.raises(ValueError):
+        registry.counter("stage_seconds", "Not a counter")
+
+def count(name):
+    return dict(((sample_name, labels), value) for sample_name, labels, value in span_seconds.samples()).get(
+        ("orbitviz_span_duration_seconds_count", (("span", name),)), 0)
+
+def test_nested_spans_count_once():
+    before = count("test_stage")
+    with pytest.raises(RuntimeError):
+        with span("test_stage"):
+            with span("test_stage"):
+                raise RuntimeError
+    assert count("test_stage") == before + 1
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_sampling_profiler():
+    profiler = SamplingProfiler(interval=0.001).start()
+    busy_wait(0.1)
+    stacks = profiler.stop().collapsed()
+    assert "busy_wait (metrics_test.py" in stacks
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+
+import pytest
+from backend.models.omm import iter_json_records, iter_omm_file, read_element_file
+from backend.models.tle_batch import TLEBatch
+
+ISS_TLE = [
+    "ISS (ZARYA)",
+    "1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927",
+    "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537",
+]
+ISS_OMM = {
+    "OBJECT_NAME": "ISS (ZARYA)", "OBJECT_ID": "1998-067A", "EPOCH": "2008-09-20T12:25:40.104192",
+    "MEAN_MOTION": 15.72125391, "ECCENTRICITY": 0.0006703, "INCLINATION": 51.6416, "RA_OF_ASC_NODE": 247.4627,
+    "ARG_OF_PERICENTER": 130.536, "MEAN_ANOMALY": 325.0288, "EPHEMERIS_TYPE": 0, "CLASSIFICATION_TYPE": "U",
+    "NORAD_CAT_ID": 25544, "ELEMENT_SET_NO": 292, "REV_AT_EPOCH": 56353, "BSTAR": -1.1606e-05,
+    "MEAN_MOTION_DOT": -2.182e-05, "MEAN_MOTION_DDOT": 0,
+}
+
+def to_csv(records):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(ISS_OMM))
+    writer.writeheader()
+    writer.writerows(records)
+    return out.getvalue()
+
+def assert_same_elements(omm_record, tle_record):
+    for column, value in tle_record.items():
+        if isinstance(value, float):
+            assert omm_record[column] == pytest.approx(value, rel=1e-9, abs=1e-15), column
+        else:
+            assert omm_record[column] == value, column
+
+@pytest.mark.parametrize("content", [json.dumps([ISS_OMM]), to_csv([ISS_OMM])])
+def test_matches_tle_path(tmp_path, content):
+    path = tmp_path / "iss.omm"
+    path.write_text(content)
+    batch = read_element_file(str(path))
+    assert batch.errors == []
+    assert_same_elements(batch.to_records()[0], TLEBatch.from_lines(ISS_TLE).to_records()[0])
+
+def test_incremental_json_with_small_buffer():
+    records = [dict(ISS_OMM, NORAD_CAT_ID=n) for n in range(50)]
+    decoded = list(iter_json_records(io.StringIO(json.dumps(records, indent=2)), buffer_size=7))
+    assert decoded == records
+    assert list(iter_json_records(io.StringIO(json.dumps(ISS_OMM)), buffer_size=7)) == [ISS_OMM]
+
+def test_chunks_and_bad_records():
+    records = [dict(ISS_OMM, NORAD_CAT_ID=n) for n in range(5)]
+    records[3] = dict(records[3], MEAN_MOTION="fast")
+    del records[4]["EPOCH"]
+    batches = list(iter_omm_file(io.StringIO(to_csv(records)), chunk_size=2))
+    assert [len(batch) for batch in batches] == [2, 1, 0]
+    assert [error.line_number for batch in batches for error in batch.errors] == [4, 5]
@@ -0,0 +1,56 @@
+import queue
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base, TLE, Group
+from backend.models.tle_batch import TLEBatch
+from backend.services.data_fetching import pipeline
+from backend.services.data_fetching.pipeline import ingest_groups, writer_main
+
+ISS = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537
+"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667
+"""
+
+def test_groups_share_satellites(tmp_path):
+    db_uri = f"sqlite:///{tmp_path / 'tles.sqlite'}"
+    engine = create_engine(db_uri)
+    Base.metadata.create_all(engine)
+    (tmp_path / "stations.txt").write_text(ISS)
+    (tmp_path / "visual.txt").write_text(ISS + VANGUARD + "garbage\n")
+    sources = [(group, str(tmp_path / f"{group}.txt")) for group in ("stations", "visual", "missing")]
+
+    summaries = {s["group"]: s for s in ingest_groups(iter(sources), processes=2, db_uri=db_uri)}
+
+    assert "error" in summaries["missing"]
+    assert summaries["visual"]["errors"] == 1
+    assert summaries["stations"]["inserted"] + summaries["visual"]["inserted"] == 2
+    with sessionmaker(bind=engine)() as session:
+        assert session.query(TLE).count() == 2
+        members = {g.name: sorted(s.satellite_number for s in g.satellites) for g in session.query(Group)}
+        assert members == {"stations": [25544], "visual": [5, 25544]}
+
+def test_failed_group_does_not_hide_its_tles(tmp_path, monkeypatch):
+    db_uri = f"sqlite:///{tmp_path / 'tles.sqlite'}"
+    bulk_insert_tle = pipeline.bulk_insert_tle
+    def flaky_insert(batch, session=None):
+        if not flaky_insert.failed:
+            flaky_insert.failed = True
+            raise RuntimeError("database is locked")
+        return bulk_insert_tle(batch, session=session)
+    flaky_insert.failed = False
+    monkeypatch.setattr(pipeline, "bulk_insert_tle", flaky_insert)
+    monkeypatch.setattr(pipeline, "get_ephemeris_cache", lambda: None)
+    batches, summaries = queue.Queue(), queue.Queue()
+    for group in ("stations", "visual"):
+        batches.put((group, TLEBatch.from_lines(ISS.splitlines())))
+    batches.put(None)
+
+    writer_main(batches, summaries, db_uri)
+
+    assert "error" in summaries.get_nowait()
+    assert summaries.get_nowait()["inserted"] == 1
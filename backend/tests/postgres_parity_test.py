@@ -0,0 +1,94 @@
+"""Runs the same ingest operations against SQLite and PostgreSQL.
+PostgreSQL comes from ORBITVIZ_TEST_POSTGRES_URI, or from a throwaway cluster launched with initdb/pg_ctl.
+The PostgreSQL cases are skipped when neither is available or no driver is installed."""
+import os
+import shutil
+import socket
+import subprocess
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from backend.models.models import TLE, Satellite, Group
+from backend.services.database.database_utils import initialize_database
+from backend.services.database.database_operations import bulk_insert_tle, sync_group_membership
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def postgres_uri(tmp_path_factory):
+    try:
+        import psycopg2  # noqa: F401
+    except ImportError:
+        pytest.skip("psycopg2 is not installed")
+    if os.environ.get("ORBITVIZ_TEST_POSTGRES_URI"):
+        yield os.environ["ORBITVIZ_TEST_POSTGRES_URI"]
+        return
+    if not (shutil.which("initdb") and shutil.which("pg_ctl")):
+        pytest.skip("PostgreSQL is not available")
+
+    data_dir = tmp_path_factory.mktemp("postgres")
+    port = free_port()
+    subprocess.run(["initdb", "-D", str(data_dir), "-U", "orbitviz", "--auth=trust"], check=True, capture_output=True)
+    subprocess.run(
+        ["pg_ctl", "-D", str(data_dir), "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1", "-w", "start"],
+        check=True, capture_output=True,
+    )
+    try:
+        yield f"postgresql+psycopg2://orbitviz@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(["pg_ctl", "-D", str(data_dir), "-m", "immediate", "stop"], capture_output=True)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def session(request, tmp_path):
+    if request.param == "sqlite":
+        engine = initialize_database(f"sqlite:///{tmp_path / 'parity.sqlite'}")
+    else:
+        engine = initialize_database(request.getfixturevalue("postgres_uri"))
+        with engine.begin() as connection:
+            connection.execute(text("TRUNCATE tles, satellites, groups, satellite_group_association"))
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def latest_epochs(session):
+    return {
+        sat.satellite_number: tle.epoch
+        for sat, tle in session.query(Satellite, TLE).join(TLE, Satellite.latest_tle_id == TLE.id)
+    }
+
+
+def test_bulk_insert_and_latest_tle(session):
+    assert bulk_insert_tle(f"{ISS_NEW}\n{VANGUARD}\n{VANGUARD}", session=session).inserted == 2
+    assert bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session).inserted == 1
+    assert session.query(TLE).count() == 3
+    assert {sat: epoch.day for sat, epoch in latest_epochs(session).items()} == {5: 27, 25544: 21}
+    iss = session.query(TLE).filter_by(satellite_number=25544).order_by(TLE.epoch).first()
+    assert iss.to_tle(as_string=True).splitlines()[2] == ISS_OLD.splitlines()[2]
+    assert iss.name == "ISS (ZARYA)" and iss.classification == "U"
+
+
+def test_group_sync(session):
+    bulk_insert_tle(f"{ISS_OLD}\n{VANGUARD}", session=session, group="visual")
+    result = sync_group_membership("visual", [25544], session=session)
+    session.commit()
+    assert result.removed == [5]
+    group = session.query(Group).filter_by(name="visual").one()
+    assert [sat.satellite_number for sat in group.satellites] == [25544]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sgp4.api import Satrec, SatrecArray
+from backend.models.tle_batch import TLEBatch
+from backend.services.calculations import propagation
+from backend.services.calculations.propagation import CatalogPropagator, julian_dates, time_grid
+
+ISS = ("1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927",
+       "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537")
+VANGUARD = ("1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753",
+            "2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667")
+
+def propagator():
+    return CatalogPropagator(TLEBatch.from_lines(["ISS (ZARYA)", *ISS, "VANGUARD 1", *VANGUARD]).data, version=1)
+
+def test_matches_twoline2rv():
+    times = time_grid("2008-09-20T12:00:00", 600, 12)
+    states = propagator().propagate(times)
+    assert states.satellite_numbers.tolist() == [5, 25544]
+    assert states.positions.shape == states.velocities.shape == (2, 12, 3)
+    assert states.positions.flags.c_contiguous
+    jd, fr = julian_dates(times)
+    for row, lines in [(0, VANGUARD), (1, ISS)]:
+        errors, positions, velocities = Satrec.twoline2rv(*lines).sgp4_array(jd, fr)
+        assert (states.errors[row] == errors).all()
+        np.testing.assert_allclose(states.positions[row], positions, atol=1e-6)
+        np.testing.assert_allclose(states.velocities[row], velocities, atol=1e-9)
+
+def test_subset_and_errors():
+    states = propagator().propagate(np.array(["2100-01-01"], dtype="M8[us]"), satellite_numbers=[25544, 7])
+    assert states.satellite_numbers.tolist() == [25544]
+    # ISS elements from 2008 have decayed by 2100
+    assert states.errors[0, 0] != 0 and np.isnan(states.positions[0, 0]).all()
+    assert len(propagator().propagate(time_grid("2008-09-20", 60, 3), satellite_numbers=[]).positions) == 0
+
+def test_sharded_matches_single_process(tmp_path):
+    catalog = propagator()
+    times = time_grid("2008-09-20T12:00:00", 600, 1000)
+    expected = catalog.propagate(times)
+    for out_dir in [None, str(tmp_path)]:
+        states = catalog.propagate_sharded(times, workers=2, out_dir=out_dir, shard_size=1)
+        assert states.satellite_numbers.tolist() == [5, 25544]
+        assert (states.errors == expected.errors).all()
+        np.testing.assert_array_equal(states.positions, expected.positions)
+        np.testing.assert_array_equal(states.velocities, expected.velocities)
+    assert np.load(tmp_path / "positions.npy", mmap_mode="r").shape == (2, len(times), 3)
+    assert catalog.propagate_sharded(times, satellite_numbers=[7]).positions.shape == (0, len(times), 3)
+
+def test_failed_sharded_run_releases_the_task(monkeypatch):
+    monkeypatch.setattr(propagation, "propagate_shard", lambda shard: None)  # lambdas cannot be sent to the pool
+    with pytest.raises(Exception):
+        propagator().propagate_sharded(time_grid("2008-09-20", 600, 10), workers=2)
+    assert propagation.shard_task is None
+
+def test_private_satrec_array_sgp4():
+    """propagate_shard relies on the private SatrecArray._sgp4 writing into caller arrays, as it does in sgp4 2.27"""
+    satrecs = SatrecArray([Satrec.twoline2rv(*ISS), Satrec.twoline2rv(*VANGUARD)])
+    jd, fr = julian_dates(time_grid("2008-09-20T12:00:00", 600, 12))
+    errors, positions, velocities = np.zeros((2, 12), dtype=np.uint8), np.empty((2, 12, 3)), np.empty((2, 12, 3))
+    satrecs._sgp4(jd, fr, errors, positions, velocities)
+    expected = satrecs.sgp4(jd, fr)
+    for actual, expected in zip((errors, positions, velocities), expected):
+        np.testing.assert_array_equal(actual, expected)
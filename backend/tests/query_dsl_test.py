@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models.models import Base
+from backend.services.database.database_operations import add_group_members, bulk_insert_tle, find_tles
+from backend.services.database.query_dsl import FilterError, cached_statement, compile_query, normalize_filters
+
+ISS_OLD = """ISS (ZARYA)
+1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+ISS_NEW = """ISS (ZARYA)
+1 25544U 98067A   08265.51782528 -.00002182  00000-0 -11606-4 0  2928
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"""
+VANGUARD = """VANGUARD 1
+1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753
+2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"""
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        bulk_insert_tle(f"{ISS_OLD}\n{ISS_NEW}\n{VANGUARD}", session=session)
+        add_group_members("stations", [25544], session=session)
+        yield session
+
+def ids(filters, session):
+    return [row.id for row in find_tles(filters, session=session)]
+
+def test_operators(session):
+    assert ids({"inclination": {">=": 0.8}}, session) == [1, 2]  # radians
+    assert ids({"inclination": {"between": [0.5, 0.7]}}, session) == [3]
+    assert ids({"satellite_number": {"in": [5, 7]}}, session) == [3]
+    assert ids({"satellite_number": {"not in": [5]}, "epoch": {">": "2008-09-21"}}, session) == [2]
+    assert ids({"name": {"==": "VANGUARD 1"}}, session) == ids({"name": {"!=": "ISS (ZARYA)"}}, session) == [3]
+    assert ids({"group": "stations"}, session) == [1, 2]
+    assert ids({"group": {"in": ["stations", "weather"]}, "epoch": {"<": "2008-09-21"}}, session) == [1]
+
+def test_invalid_filters_are_rejected():
+    for filters in [{"nope": {"==": 1}}, {"inclination": {"~": 1}}, {"inclination": 50}, {"epoch": {">": "soon"}},
+                    {"satellite_number": {"in": 5}}, {"satellite_number": {"==": 1.5}}, {"group": {">": "a"}}]:
+        with pytest.raises(FilterError):
+            normalize_filters(filters)
+
+def test_one_statement_per_shape():
+    first, params = compile_query({"inclination": {">": 1, "<": 2}, "satellite_number": {"in": [1, 2]}}, ["id"])
+    second, _ = compile_query({"satellite_number": {"in": [3]}, "inclination": {"<": 5, ">": 4}}, ["id"])
+    assert first is second
+    assert params == {"inclination_gt": 1.0, "inclination_lt": 2.0, "satellite_number_in": [1, 2]}
+    assert compile_query({"inclination": {">=": 1}}, ["id"])[0] is not first
+    assert cached_statement.cache_info().hits >= 1
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+IMPORT_BUDGET = 2.0  # seconds, about 0.6 s when this was written
+HEAVY_MODULES = ["astropy", "poliastro", "plotly", "matplotlib", "scipy", "sgp4", "numba", "erfa"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import backend.api.app
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(m for m in sys.modules if m.split(".")[0] in %r)}))
+""" % HEAVY_MODULES
+
+def test_api_import_is_fast_and_side_effect_free(tmp_path):
+    db_path = tmp_path / "database" / "tles.sqlite"
+    env = dict(os.environ, ORBITVIZ_DB_URI=f"sqlite:///{db_path}")
+    # Best of three, the first run may pay for a cold disk cache
+    runs = []
+    for _ in range(3):
+        out = subprocess.run([sys.executable, "-c", SCRIPT], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    assert min(run["elapsed"] for run in runs) < IMPORT_BUDGET
+    assert runs[0]["modules"] == []
+    assert not db_path.parent.exists()
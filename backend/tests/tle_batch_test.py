@@ -0,0 +1,63 @@
+import pytest
+from sgp4.io import twoline2rv
+from sgp4.earth_gravity import wgs72
+from backend.models.tle_batch import TLEBatch
+
+ISS = [
+    "ISS (ZARYA)",
+    "1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927",
+    "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537",
+]
+VANGUARD = [
+    "VANGUARD 1",
+    "1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753",
+    "2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667",
+]
+
+@pytest.mark.parametrize("lines", [ISS, VANGUARD])
+def test_matches_sgp4(lines):
+    batch = TLEBatch.from_lines(lines)
+    satrec = twoline2rv(lines[1], lines[2], wgs72)
+    record = batch.to_records()[0]
+    assert batch.errors == []
+    assert record["name"] == lines[0]
+    assert record["satellite_number"] == satrec.satnum
+    assert record["international_designator"] == satrec.intldesg
+    assert record["epoch_year"] == satrec.epochyr
+    assert record["element_number"] == satrec.elnum
+    assert record["revolution_number"] == int(satrec.revnum)
+    assert abs((record["epoch"] - satrec.epoch).total_seconds()) <= 1e-6
+    for column, attribute in [("inclination", "inclo"), ("right_ascension", "nodeo"), ("eccentricity", "ecco"),
+                              ("argument_of_perigee", "argpo"), ("mean_anomaly", "mo"), ("mean_motion", "no_kozai"),
+                              ("mean_motion_dot", "ndot"), ("mean_motion_ddot", "nddot"), ("bstar", "bstar")]:
+        assert record[column] == pytest.approx(getattr(satrec, attribute), rel=1e-12, abs=1e-20)
+
+def test_two_line_records():
+    batch = TLEBatch.from_lines(ISS[1:] + VANGUARD[1:])
+    assert list(batch["satellite_number"]) == [25544, 5]
+    assert list(batch["name"]) == ["", ""]
+
+def test_alpha5_satellite_number():
+    line1 = "1 A0001U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  292"
+    line2 = "2 A0001  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"
+    batch = TLEBatch.from_lines(["ALPHA", line1, line2[:68]])
+    assert batch.errors == []
+    assert batch["satellite_number"][0] == 100001
+
+@pytest.mark.parametrize("lines, reason", [
+    ([ISS[0], ISS[1][:-1] + "0", ISS[2]], "line 1 checksum mismatch"),
+    ([ISS[0], ISS[1], VANGUARD[2]], "satellite numbers in lines 1 and 2 do not match"),
+    ([ISS[0], ISS[1].replace(".", ",", 1), ISS[2]], "line 1 does not match the TLE format"),
+    ([ISS[0], ISS[1]], "line 1 without a matching line 2"),
+])
+def test_bad_records_are_reported(lines, reason):
+    batch = TLEBatch.from_lines(lines + VANGUARD)
+    assert len(batch) == 1
+    assert batch["satellite_number"][0] == 5
+    assert reason in [error.reason for error in batch.errors]
+
+def test_to_tles_round_trip():
+    batch = TLEBatch.from_lines(ISS)
+    tle = batch.to_tles()[0]
+    assert tle.to_tle()[2] == ISS[2]
+    assert TLEBatch.from_lines(tle.to_tle()).to_records() == batch.to_records()
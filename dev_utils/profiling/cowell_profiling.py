@@ -0,0 +1,49 @@
+"""Times Cowell propagation with J2 of 1000 orbits over one day with one minute outputs in one compiled call,
+against scipy's solve_ivp with a Python right-hand side one orbit at a time"""
+from time import time
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from backend.services.calculations import cowell
+
+ORBITS = 1000
+LOOP_ORBITS = 10
+RTOL = 1e-9
+
+rng = np.random.default_rng(0)
+radius = cowell.EARTH_RADIUS + rng.uniform(300, 2000, ORBITS)
+inclination = rng.uniform(0, np.pi, ORBITS)
+speed = np.sqrt(cowell.MU / radius) * rng.uniform(1.0, 1.05, ORBITS)
+states = np.zeros((ORBITS, 6))
+states[:, 0] = radius
+states[:, 4] = speed * np.cos(inclination)
+states[:, 5] = speed * np.sin(inclination)
+seconds = np.arange(0, 86400, 60.0)
+
+ts = time()
+cowell.propagate(states[:1], seconds[:2])
+te = time()
+print(f"compilation (or loading the cache) took: {te - ts:2.4f} sec")
+
+ts = time()
+errors, positions, _ = cowell.propagate(states, seconds, rtol=RTOL)
+te = time()
+print(f"propagate: {ORBITS} orbits took: {te - ts:2.4f} sec, {(te - ts) / ORBITS * 1e3:.2f} ms per orbit, "
+      f"{(errors != 0).sum()} errors")
+
+def f(t, y):
+    r = y[:3]
+    norm = np.linalg.norm(r)
+    factor = 1.5 * cowell.J2 * cowell.MU * cowell.EARTH_RADIUS ** 2 / norm ** 5
+    z2 = 5 * r[2] ** 2 / norm ** 2
+    j2 = factor * r * np.array([z2 - 1, z2 - 1, z2 - 3])
+    return np.concatenate([y[3:], -cowell.MU * r / norm ** 3 + j2])
+
+ts = time()
+differences = []
+for row in range(LOOP_ORBITS):
+    solution = solve_ivp(f, (0, seconds[-1]), states[row], method="RK45", t_eval=seconds, rtol=RTOL, atol=cowell.ATOL)
+    differences.append(np.abs(solution.y[:3].T - positions[row]).max())
+te = time()
+print(f"solve_ivp loop: {LOOP_ORBITS} orbits took: {te - ts:2.4f} sec, {(te - ts) / LOOP_ORBITS * 1e3:.2f} ms per orbit, "
+      f"max difference {max(differences) * 1e3:.3f} m")
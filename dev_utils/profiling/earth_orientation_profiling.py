@@ -0,0 +1,45 @@
+"""Times station positions in the inertial frame: astropy frame transforms one time at a time, as the pass search
+of visibility_intervals3.py does, against EarthOrientation per time and batched over a day, and erfa.c2t06a"""
+import warnings
+from time import time
+
+import erfa
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import GCRS, EarthLocation
+from astropy.time import Time
+from astropy.utils import iers
+from backend.services.calculations.earth_orientation import EarthOrientation, julian_dates
+
+SCALAR_CALLS = 100
+BATCH = 86400  # one day at one second steps
+
+iers.conf.auto_download = False
+warnings.simplefilter("ignore")
+location = EarthLocation(lat=33.7490 * u.deg, lon=-84.3880 * u.deg, height=0 * u.m)
+station = np.array([coordinate.to_value(u.km) for coordinate in location.geocentric])
+times = np.datetime64("2023-01-01", "us") + np.arange(BATCH) * np.timedelta64(1, "s")
+
+ts = time()
+for t in times[:SCALAR_CALLS]:
+    obstime = Time(t, scale="utc")
+    location.get_itrs(obstime).transform_to(GCRS(obstime=obstime))
+te = time()
+print(f"astropy transform_to: {(te - ts) / SCALAR_CALLS * 1e3:.3f} ms per time")
+
+for tier in ("iau2006", "gmst"):
+    ts = time()
+    for t in times[:SCALAR_CALLS]:
+        EarthOrientation(t, tier).to_inertial(station)
+    te = time()
+    print(f"EarthOrientation {tier}: {(te - ts) / SCALAR_CALLS * 1e3:.3f} ms per time")
+    ts = time()
+    EarthOrientation(times, tier).to_inertial(station)
+    te = time()
+    print(f"EarthOrientation {tier}: {BATCH} times took: {te - ts:2.4f} sec, {(te - ts) / BATCH * 1e6:.2f} us per time")
+
+jd, fr = julian_dates(times)
+ts = time()
+erfa.c2t06a(*erfa.taitt(*erfa.utctai(jd, fr)), jd, fr, 0.0, 0.0)
+te = time()
+print(f"erfa.c2t06a: {BATCH} times took: {te - ts:2.4f} sec, {(te - ts) / BATCH * 1e6:.2f} us per time")
@@ -0,0 +1,40 @@
+"""Times 100k "elements valid at time t" lookups against the database and the element archive"""
+import os
+import tempfile
+from time import time
+
+import numpy as np
+from sgp4.io import fix_checksum
+from sqlalchemy.orm import sessionmaker
+from backend.services.database.archive import ElementArchive
+from backend.services.database.database_utils import initialize_database
+from backend.services.database.database_operations import bulk_insert_tle
+from backend.services.database.history import elements_at
+
+SATELLITES = 10_000
+EPOCHS = 20
+LOOKUPS = 100_000
+
+line1 = "1 {:05d}U 98067A   08{:03d}.51782528 -.00002182  00000-0 -11606-4 0  292"
+line2 = "2 {:05d}  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"
+
+with tempfile.TemporaryDirectory() as tmp:
+    engine = initialize_database(f"sqlite:///{os.path.join(tmp, 'history.sqlite')}")
+    with sessionmaker(bind=engine)() as session:
+        lines = []
+        for day in range(1, EPOCHS + 1):
+            for n in range(1, SATELLITES + 1):
+                lines += [fix_checksum(line1.format(n, day * 10)), fix_checksum(line2.format(n))]
+        bulk_insert_tle("\n".join(lines), session=session)
+        archive = ElementArchive(os.path.join(tmp, "elements"))
+        archive.sync(session)
+
+        rng = np.random.default_rng(0)
+        satellite_numbers = rng.integers(1, SATELLITES + 1, LOOKUPS)
+        times = np.datetime64("2008-01-01", "us") + rng.integers(0, 220 * 86400, LOOKUPS) * np.timedelta64(1, "s")
+
+        for label, source in [("database", False), ("archive", archive)]:
+            ts = time()
+            batch, found = elements_at(satellite_numbers, times, session=session, archive=source)
+            te = time()
+            print(f"{label}: {LOOKUPS} lookups, {found.sum()} found took: {te - ts:2.4f} sec")
@@ -0,0 +1,49 @@
+"""Compares Chebyshev ephemerides of one day with dense SGP4 states: storage against states at 10 and 60 second
+steps, fit time, and evaluation of 1M times (sorted and shuffled) against sgp4_array"""
+from time import time
+
+import numpy as np
+from backend.models.tle_batch import TLEBatch
+from backend.services.calculations.interpolation import ChebyshevEphemeris
+from backend.services.calculations.propagation import julian_dates, satrec_from_elements
+
+TLES = {
+    "ISS": ["1 25544U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  2927",
+            "2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"],
+    "VANGUARD 1": ["1 00005U 58002B   00179.78495062  .00000023  00000-0  28098-4 0  4753",
+                   "2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667"],
+}
+DURATION = 86400.0
+EVALUATIONS = 1_000_000
+STATE_BYTES = 6 * 8
+
+for name, lines in TLES.items():
+    elements = TLEBatch.from_lines(lines).data[0]
+    start = elements["epoch"].astype("M8[D]").astype("M8[us]")
+    ts = time()
+    ephemeris = ChebyshevEphemeris.from_elements(elements, start, DURATION)
+    te = time()
+    print(f"{name}: fit of {len(ephemeris)} segments took: {te - ts:2.4f} sec, max error {ephemeris.max_error_km * 1e3:.3f} m")
+    for step in (10, 60):
+        dense = DURATION / step * STATE_BYTES
+        print(f"    {ephemeris.nbytes / 1e3:.1f} kB, states at {step} sec steps {dense / 1e3:.1f} kB ({dense / ephemeris.nbytes:.1f}x)")
+
+    seconds = np.linspace(0, DURATION, EVALUATIONS)
+    ts = time()
+    positions, velocities = ephemeris.evaluate_seconds(seconds)
+    te = time()
+    print(f"    evaluate {EVALUATIONS} sorted times took: {te - ts:2.4f} sec")
+    shuffled = np.random.default_rng(0).permutation(seconds)
+    ts = time()
+    ephemeris.evaluate_seconds(shuffled)
+    te = time()
+    print(f"    evaluate {EVALUATIONS} shuffled times took: {te - ts:2.4f} sec")
+
+    jd, fr = julian_dates(start + (seconds * 1e6).astype("m8[us]"))
+    satrec = satrec_from_elements(elements)
+    ts = time()
+    _, expected_positions, expected_velocities = satrec.sgp4_array(jd, fr)
+    te = time()
+    print(f"    sgp4_array {EVALUATIONS} times took: {te - ts:2.4f} sec, max differences "
+          f"{np.linalg.norm(positions - expected_positions, axis=1).max() * 1e3:.3f} m, "
+          f"{np.linalg.norm(velocities - expected_velocities, axis=1).max() * 1e3:.3f} m/s")
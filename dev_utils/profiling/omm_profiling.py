@@ -0,0 +1,48 @@
+"""Compares parsing the same catalog as TLE text, OMM JSON and OMM CSV"""
+import csv
+import json
+import os
+import tempfile
+from time import time
+
+from sgp4.io import fix_checksum
+from backend.models.tle_batch import TLEBatch
+from backend.models.omm import read_omm_file
+
+N = 30_000
+
+line1 = "1 {:05d}U 98067A   08264.51782528 -.00002182  00000-0 -11606-4 0  292"
+line2 = "2 {:05d}  51.6416 247.4627 0006703 130.5360 325.0288 15.72125391563537"
+omm = {
+    "OBJECT_NAME": "ISS (ZARYA)", "OBJECT_ID": "1998-067A", "EPOCH": "2008-09-20T12:25:40.104192",
+    "MEAN_MOTION": 15.72125391, "ECCENTRICITY": 0.0006703, "INCLINATION": 51.6416, "RA_OF_ASC_NODE": 247.4627,
+    "ARG_OF_PERICENTER": 130.536, "MEAN_ANOMALY": 325.0288, "EPHEMERIS_TYPE": 0, "CLASSIFICATION_TYPE": "U",
+    "NORAD_CAT_ID": 25544, "ELEMENT_SET_NO": 292, "REV_AT_EPOCH": 56353, "BSTAR": -1.1606e-05,
+    "MEAN_MOTION_DOT": -2.182e-05, "MEAN_MOTION_DDOT": 0,
+}
+
+with tempfile.TemporaryDirectory() as tmp:
+    tle_path = os.path.join(tmp, "catalog.txt")
+    json_path = os.path.join(tmp, "catalog.json")
+    csv_path = os.path.join(tmp, "catalog.csv")
+
+    with open(tle_path, "w") as f:
+        for n in range(N):
+            f.write(f"ISS (ZARYA)\n{fix_checksum(line1.format(n))}\n{fix_checksum(line2.format(n))}\n")
+    records = [dict(omm, NORAD_CAT_ID=n) for n in range(N)]
+    with open(json_path, "w") as f:
+        json.dump(records, f)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(omm))
+        writer.writeheader()
+        writer.writerows(records)
+
+    for label, parse, path in [
+        ("TLE text", TLEBatch.from_file, tle_path),
+        ("OMM JSON", read_omm_file, json_path),
+        ("OMM CSV", read_omm_file, csv_path),
+    ]:
+        ts = time()
+        batch = parse(path)
+        te = time()
+        print(f"{label}: {len(batch)} records, {len(batch.errors)} errors, {os.path.getsize(path) / 1e6:.1f} MB took: {te - ts:2.4f} sec")
@@ -0,0 +1,54 @@
+"""Times SGP4 propagation of a 30k satellite catalog over one day at one minute steps (43.2M states),
+in one process and sharded over os.cpu_count() worker processes into memory-mapped output"""
+import os
+from time import time
+
+import numpy as np
+from backend.models.tle_batch import TLE_DTYPE
+from backend.services.calculations.propagation import CatalogPropagator, julian_dates, time_grid
+
+SATELLITES = 30_000
+MINUTES = 1440
+LOOP_SATELLITES = 1000  # per satellite sgp4_array calls, for comparison
+
+rng = np.random.default_rng(0)
+elements = np.zeros(SATELLITES, dtype=TLE_DTYPE)
+elements["satellite_number"] = np.arange(1, SATELLITES + 1)
+elements["epoch"] = np.datetime64("2024-01-01", "us") - rng.integers(0, 7 * 86400, SATELLITES) * np.timedelta64(1, "s")
+elements["bstar"] = rng.uniform(0, 1e-4, SATELLITES)
+elements["inclination"] = np.radians(rng.uniform(0, 100, SATELLITES))
+elements["right_ascension"] = rng.uniform(0, 2 * np.pi, SATELLITES)
+elements["eccentricity"] = rng.uniform(0, 0.02, SATELLITES)
+elements["argument_of_perigee"] = rng.uniform(0, 2 * np.pi, SATELLITES)
+elements["mean_anomaly"] = rng.uniform(0, 2 * np.pi, SATELLITES)
+# Revolutions per day, LEO to GEO, in radians per minute as stored
+elements["mean_motion"] = rng.choice([15.5, 14.2, 12.0, 2.0, 1.0027], SATELLITES) * 2 * np.pi / 1440
+
+ts = time()
+propagator = CatalogPropagator(elements)
+te = time()
+print(f"SatrecArray of {SATELLITES} satellites took: {te - ts:2.4f} sec")
+
+times = time_grid("2024-01-01", 60, MINUTES)
+ts = time()
+states = propagator.propagate(times)
+te = time()
+count = SATELLITES * MINUTES
+print(f"propagate: {count} states took: {te - ts:2.4f} sec, {count / (te - ts) / 1e6:.1f}M states/sec, "
+      f"{(states.positions.nbytes + states.velocities.nbytes) / 1e9:.2f} GB, {(states.errors != 0).sum()} errors")
+
+workers = os.cpu_count()
+ts = time()
+sharded = propagator.propagate_sharded(times, workers=workers)
+te = time()
+print(f"propagate_sharded, {workers} workers: {count} states took: {te - ts:2.4f} sec, "
+      f"{count / (te - ts) / 1e6:.1f}M states/sec, identical: {np.array_equal(sharded.positions, states.positions, equal_nan=True)}")
+del states, sharded
+
+jd, fr = julian_dates(times)
+ts = time()
+for satrec in propagator.satrecs[:LOOP_SATELLITES]:
+    satrec.sgp4_array(jd, fr)
+te = time()
+print(f"per satellite loop: {LOOP_SATELLITES * MINUTES} states took: {te - ts:2.4f} sec, "
+      f"{LOOP_SATELLITES * MINUTES / (te - ts) / 1e6:.1f}M states/sec")